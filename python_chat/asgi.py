@@ -0,0 +1,133 @@
+"""ASGI entry point: Socket.IO on python-socketio's AsyncServer with async SQLAlchemy.
+
+Run it with any ASGI server, e.g.::
+
+    uvicorn --factory python_chat.asgi:create_asgi_app --host 0.0.0.0 --port 5000
+
+Socket.IO events are handled on the event loop and wait for Postgres through asyncpg, so a
+slow query only suspends its own handler. Pages and the REST API are still served by the
+Flask app, run in a thread pool; what the views emit (bans, deletions) is forwarded to the
+AsyncServer. The same models, caches, rate limits and typing digests are used as in the
+eventlet deployment, which makes the two directly comparable with python_chat.bench.socket_load.
+
+Only a single process is supported for now: presence must use the in-memory backend and
+SOCKETIO_MESSAGE_QUEUE must be unset. The batch message writer is not used.
+"""
+
+import asyncio
+import logging
+from typing import Any
+
+import socketio
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from python_chat.app import create_app
+from python_chat.app import socketio as flask_socketio
+from python_chat.routes.async_events import init_async_socketio
+from python_chat.utils.db_pool import async_engine_options
+from python_chat.utils.green_db import make_psycopg2_blocking
+from python_chat.utils.metrics import metrics
+from python_chat.utils.query_profiler import query_profiler
+from python_chat.utils.read_state import read_marker
+from python_chat.utils.typing_state import typing_coalescer
+
+logger = logging.getLogger(__name__)
+
+
+def async_database_url(url: str) -> str:
+    """The same database URL with the asyncpg driver."""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+class AsyncServerEmitter:
+    """Stands in for the Flask-SocketIO server so views running in worker threads emit through the AsyncServer."""
+
+    def __init__(self, sio: socketio.AsyncServer) -> None:
+        self.sio = sio
+        self.manager = sio.manager
+        self.handlers = sio.handlers
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def _submit(self, coro) -> None:
+        if self.loop is None:
+            # Nothing can be connected before the server started
+            coro.close()
+            return
+        asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def emit(self, event: str, data: Any = None, namespace: str | None = None, to: Any = None, skip_sid: Any = None, callback: Any = None, **kwargs) -> None:
+        self._submit(self.sio.emit(event, data, namespace=namespace, to=to, skip_sid=skip_sid, **kwargs))
+
+    def enter_room(self, sid: str, room: str, namespace: str | None = None) -> None:
+        self._submit(self.sio.enter_room(sid, room, namespace=namespace))
+
+    def leave_room(self, sid: str, room: str, namespace: str | None = None) -> None:
+        self._submit(self.sio.leave_room(sid, room, namespace=namespace))
+
+
+async def _emit_typing_digests(sio: socketio.AsyncServer) -> None:
+    """Asyncio counterpart of the typing coalescer's background loop."""
+    while True:
+        await sio.sleep(typing_coalescer.interval)
+        try:
+            for chat_id, users in typing_coalescer.collect():
+                await sio.emit("typing_state", {"chat_id": chat_id, "users": users, "source": typing_coalescer.source}, room=str(chat_id))
+        except Exception as e:
+            logger.error(f"Error sending typing state: {e}")
+
+
+async def _flush_read_marks(sio: socketio.AsyncServer, session_factory: async_sessionmaker[AsyncSession]) -> None:
+    """Asyncio counterpart of the read marker's background loop."""
+    while True:
+        await sio.sleep(read_marker.interval)
+        try:
+            async with session_factory() as session:
+                await read_marker.flush_async(session)
+        except Exception as e:
+            logger.error(f"Error writing read pointers: {e}")
+
+
+def create_asgi_app(test_config=None) -> socketio.ASGIApp:
+    """Create the Flask app and serve it together with an asyncio Socket.IO server."""
+    # Views run in a2wsgi's threads, not on an eventlet hub: no green database waits or pool
+    flask_socketio.server_options["async_mode"] = "threading"
+    flask_app = create_app(test_config)
+    if flask_app.config.get("PRESENCE_BACKEND", "memory") != "memory" or flask_app.config.get("SOCKETIO_MESSAGE_QUEUE"):
+        raise ValueError("The ASGI entry point supports a single process: use PRESENCE_BACKEND=memory without SOCKETIO_MESSAGE_QUEUE")
+
+    engine_options = {"pool_pre_ping": True, **async_engine_options(flask_app)}
+    engine: AsyncEngine = create_async_engine(async_database_url(flask_app.config["SQLALCHEMY_DATABASE_URI"]), **engine_options)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+    init_async_socketio(sio, flask_app, session_factory)
+    if flask_app.config.get("METRICS_ENABLED", True):
+        metrics.instrument_socketio(sio)
+        metrics.instrument_engine(engine.sync_engine)
+    if query_profiler.enabled:
+        query_profiler.instrument_socketio(sio)
+        query_profiler.instrument_engine(engine.sync_engine)
+
+    # Views emit through flask_socketio; their emits and room changes go to the AsyncServer instead
+    emitter = AsyncServerEmitter(sio)
+    flask_socketio.server = emitter
+    # Typing digests are sent by the asyncio task below, not by a Flask-SocketIO background task
+    typing_coalescer.init_app(flask_app, None)
+    # Likewise read pointers are written by an asyncio task, on the async engine
+    read_marker.init_app(flask_app, None)
+    # In case an eventlet app enabled green waits earlier in this process
+    make_psycopg2_blocking()
+
+    async def on_startup() -> None:
+        emitter.loop = asyncio.get_running_loop()
+        sio.start_background_task(_emit_typing_digests, sio)
+        sio.start_background_task(_flush_read_marks, sio, session_factory)
+
+    async def on_shutdown() -> None:
+        await engine.dispose()
+
+    # Everything but /socket.io goes to the Flask app, run in a2wsgi's thread pool
+    wsgi_app = WSGIMiddleware(flask_app)  # type: ignore[arg-type]
+    return socketio.ASGIApp(sio, other_asgi_app=wsgi_app, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,78 @@
+"""Measure the overhead the /metrics instrumentation adds to requests and socket handlers.
+
+No database needed::
+
+    python -m python_chat.bench.metrics --calls 200000 --requests 20000
+
+Each measurement is repeated ``--repeat`` times and the fastest run is kept, so that
+scheduler noise does not swamp the few microseconds being measured.
+"""
+
+import argparse
+import time
+
+from flask import Flask
+
+from python_chat.utils.metrics import MetricsRegistry
+
+
+def bench_calls(func, calls: int, repeat: int) -> float:
+    """Return the mean nanoseconds per call of ``func("sid", data)`` in the fastest run."""
+    data = {"chat_id": 1}
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for _ in range(calls):
+            func("sid", data)
+        runs.append((time.perf_counter_ns() - started) / calls)
+    return min(runs)
+
+
+def bench_requests(app: Flask, requests: int, repeat: int) -> float:
+    """Return the mean nanoseconds per request through the Flask test client in the fastest run."""
+    client = app.test_client()
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for _ in range(requests):
+            client.get("/ping")
+        runs.append((time.perf_counter_ns() - started) / requests)
+    return min(runs)
+
+
+def ping_app() -> Flask:
+    app = Flask(__name__)
+    app.add_url_rule("/ping", "ping", lambda: "pong")
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+
+    def handler(sid, data):
+        return data
+
+    instrumented_app = ping_app()
+    registry.instrument_app(instrumented_app)
+    results = {
+        "histogram observe": bench_calls(lambda sid, data: registry.socket_duration.observe(0.003, "send_message"), args.calls, args.repeat),
+        "socket handler": bench_calls(handler, args.calls, args.repeat),
+        "timed socket handler": bench_calls(registry._timed_handler("send_message", handler), args.calls, args.repeat),
+        "http request": bench_requests(ping_app(), args.requests, args.repeat),
+        "timed http request": bench_requests(instrumented_app, args.requests, args.repeat),
+    }
+
+    for name, ns in results.items():
+        print(f"{name:<22} {ns:>9.0f} ns/call")  # noqa: T201
+    print(f"handler overhead       {results['timed socket handler'] - results['socket handler']:>9.0f} ns")  # noqa: T201
+    print(f"request overhead       {results['timed http request'] - results['http request']:>9.0f} ns")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
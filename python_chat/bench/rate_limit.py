@@ -0,0 +1,44 @@
+"""Measure the cost of one rate limiter check.
+
+No database needed::
+
+    python -m python_chat.bench.rate_limit --checks 1000000 --users 10000
+"""
+
+import argparse
+import time
+
+from python_chat.utils.rate_limit import RateLimiter
+
+
+def bench_checks(limiter: RateLimiter, event: str, users: int, checks: int) -> float:
+    """Return the mean nanoseconds per ``allow`` call, cycling through ``users`` keys."""
+    allow = limiter.allow
+    keys = list(range(users)) * (checks // users)
+    started = time.perf_counter_ns()
+    for key in keys:
+        allow(key, event)
+    return (time.perf_counter_ns() - started) / len(keys)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+
+    results = {
+        # Generous limit: every check is allowed
+        "allowed": bench_checks(RateLimiter({"send_message": (1e9, 1e9)}), "send_message", args.users, args.checks),
+        # Tiny limit: nearly every check is rejected and counted
+        "rejected": bench_checks(RateLimiter({"send_message": (1e-9, 1.0)}), "send_message", args.users, args.checks),
+        "unlimited event": bench_checks(RateLimiter({}), "send_message", args.users, args.checks),
+    }
+
+    print(f"{args.checks // args.users * args.users} checks over {args.users} users")  # noqa: T201
+    for name, ns in results.items():
+        print(f"{name:<20} {ns:>8.0f} ns/check")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""``flask check-counters``: compare the maintained row counters with the tables they count."""
+
+import click
+from flask import Flask
+from sqlalchemy import Connection, text
+
+from python_chat.database import db
+from python_chat.database.models.row_counter import EXPECTED_COUNTERS_SQL, RowCounter
+
+# Counters whose sum over their slots differs from a fresh count; a missing side counts as 0
+MISMATCHES_SQL = text(
+    f"""
+    SELECT coalesce(e.name, a.name) AS name, coalesce(e.key_id, a.key_id) AS key_id, coalesce(e.value, 0) AS expected, coalesce(a.value, 0) AS actual
+    FROM ({EXPECTED_COUNTERS_SQL}) e
+    FULL JOIN (SELECT name, key_id, sum(value) AS value FROM row_counters GROUP BY name, key_id) a ON a.name = e.name AND a.key_id = e.key_id
+    WHERE coalesce(e.value, 0) <> coalesce(a.value, 0)
+    ORDER BY 1, 2
+    """
+)
+
+
+def counter_mismatches(conn: Connection) -> list[tuple[str, int, int, int]]:
+    """(name, key, expected, actual) of every counter that has drifted."""
+    return [(row.name, row.key_id, int(row.expected), int(row.actual)) for row in conn.execute(MISMATCHES_SQL)]
+
+
+def init_counters(app: Flask) -> None:
+    """Register ``flask check-counters``."""
+
+    @app.cli.command("check-counters")
+    @click.option("--repair", is_flag=True, help="Recount every counter if any has drifted.")
+    def check_counters_command(repair: bool) -> None:
+        """Report counters that differ from the rows they count."""
+        # One snapshot for the counts and the counters
+        with db.engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+            mismatches = counter_mismatches(conn)
+        for name, key_id, expected, actual in mismatches:
+            click.echo(f"{name}[{key_id}]: {actual}, expected {expected}")
+        if not mismatches:
+            click.echo("counters are consistent")
+        elif repair:
+            with db.engine.begin() as conn:
+                RowCounter.rebuild(conn)
+            click.echo(f"rebuilt counters, {len(mismatches)} were wrong")
+        else:
+            raise click.ClickException(f"{len(mismatches)} counters have drifted, rerun with --repair")
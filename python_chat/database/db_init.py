@@ -19,9 +19,9 @@ def initialize_db(app, db):
     """Initialize database with sample data"""
     with app.app_context():
         try:
-            # Drop all tables and recreate them
-            db.drop_all()
-            db.create_all()
+            # Drop all tables and recreate them, on the primary only
+            db.drop_all(bind_key=None)
+            db.create_all(bind_key=None)
 
             logger.info("Created database tables")
 
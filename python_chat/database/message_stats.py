@@ -0,0 +1,102 @@
+"""Analytics queries over the message_daily_stats rollup, and ``flask rollup-messages`` to rebuild it."""
+
+import datetime
+
+import click
+from flask import Flask
+from sqlalchemy import Select, func, select, tuple_
+
+from python_chat.database import db
+from python_chat.database.models.chat import Chat
+from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.models.message_daily_stat import MessageDailyStat
+
+GRANULARITIES = ("day", "hour")
+
+
+def _in_range(stmt: Select, start: datetime.date, end: datetime.date, chat_id: int | None = None, user_id: int | None = None) -> Select:
+    stmt = stmt.filter(MessageDailyStat.day >= start, MessageDailyStat.day <= end)
+    if chat_id is not None:
+        stmt = stmt.filter(MessageDailyStat.chat_id == chat_id)
+    if user_id is not None:
+        stmt = stmt.filter(MessageDailyStat.user_id == user_id)
+    return stmt
+
+
+def message_series(start: datetime.date, end: datetime.date, granularity: str = "day", chat_id: int | None = None, user_id: int | None = None) -> list[tuple[datetime.datetime, int]]:
+    """Messages per UTC day or hour from ``start`` to ``end`` inclusive, with empty buckets as 0."""
+    total = func.sum(MessageDailyStat.message_count)
+    if granularity == "hour":
+        hourly = select(MessageDailyStat.day, MessageDailyStat.hour, total).group_by(MessageDailyStat.day, MessageDailyStat.hour)
+        counts = {(day, hour): count for day, hour, count in db.session.execute(_in_range(hourly, start, end, chat_id, user_id))}
+        step = datetime.timedelta(hours=1)
+    else:
+        daily = select(MessageDailyStat.day, total).group_by(MessageDailyStat.day)
+        counts = {(day, 0): count for day, count in db.session.execute(_in_range(daily, start, end, chat_id, user_id))}
+        step = datetime.timedelta(days=1)
+
+    series = []
+    bucket = datetime.datetime.combine(start, datetime.time.min, tzinfo=datetime.UTC)
+    stop = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min, tzinfo=datetime.UTC)
+    while bucket < stop:
+        series.append((bucket, int(counts.get((bucket.date(), bucket.hour), 0))))
+        bucket += step
+    return series
+
+
+def top_chats(limit: int, start: datetime.date | None = None, end: datetime.date | None = None) -> list[tuple[str, int]]:
+    """Names and message counts of the busiest chats, over all time or the given days."""
+    total = func.sum(MessageDailyStat.message_count)
+    stmt = select(Chat.name, total.label("message_count")).join(Chat, Chat.id == MessageDailyStat.chat_id).group_by(Chat.id).having(total > 0)
+    if start is not None:
+        stmt = stmt.filter(MessageDailyStat.day >= start)
+    if end is not None:
+        stmt = stmt.filter(MessageDailyStat.day <= end)
+    return [(name, int(count)) for name, count in db.session.execute(stmt.order_by(total.desc(), Chat.id).limit(limit))]
+
+
+def total_messages(start: datetime.date | None = None, end: datetime.date | None = None) -> int:
+    """Number of messages, over all time or the given days."""
+    stmt = select(func.coalesce(func.sum(MessageDailyStat.message_count), 0))
+    if start is not None:
+        stmt = stmt.filter(MessageDailyStat.day >= start)
+    if end is not None:
+        stmt = stmt.filter(MessageDailyStat.day <= end)
+    return int(db.session.execute(stmt).scalar_one())
+
+
+def active_users_since(since: datetime.datetime) -> int:
+    """Users with a message since the start of the UTC hour of ``since``."""
+    since = since.astimezone(datetime.UTC)
+    stmt = select(func.count(func.distinct(MessageDailyStat.user_id))).filter(tuple_(MessageDailyStat.day, MessageDailyStat.hour) >= (since.date(), since.hour), MessageDailyStat.message_count > 0)
+    return int(db.session.execute(stmt).scalar_one())
+
+
+def rebuild_message_stats(start: datetime.date, end: datetime.date) -> int:
+    """Recompute the rollup for the UTC days from ``start`` to ``end``, one transaction per day. Returns the days rebuilt."""
+    day = start
+    while day <= end:
+        with db.engine.begin() as conn:
+            MessageDailyStat.rebuild_day(conn, day)
+        day += datetime.timedelta(days=1)
+    return (end - start).days + 1 if end >= start else 0
+
+
+def init_message_stats(app: Flask) -> None:
+    """Register ``flask rollup-messages``."""
+
+    @app.cli.command("rollup-messages")
+    @click.option("--since", type=click.DateTime(["%Y-%m-%d"]), help="First UTC day to rebuild; defaults to the oldest message.")
+    @click.option("--until", type=click.DateTime(["%Y-%m-%d"]), help="Last UTC day to rebuild; defaults to today.")
+    def rollup_messages_command(since: datetime.datetime | None, until: datetime.datetime | None) -> None:
+        """Backfill or repair message_daily_stats from messages."""
+        start = since.date() if since else None
+        if start is None:
+            oldest = db.session.execute(select(func.min(ChatMessage.sent_at))).scalar()
+            db.session.rollback()
+            if oldest is None:
+                click.echo("no messages")
+                return
+            start = oldest.astimezone(datetime.UTC).date()
+        end = until.date() if until else datetime.datetime.now(datetime.UTC).date()
+        click.echo(f"rebuilt {rebuild_message_stats(start, end)} days from {start} to {end}")
@@ -1,6 +1,10 @@
 from .chat import Chat
 from .chat_member import ChatMember
 from .chat_message import ChatMessage
+from .message_daily_stat import MessageDailyStat
+from .presence_session import PresenceSession
+from .row_counter import RowCounter
+from .socketio_payload import SocketIOPayload
 from .user import User
 
-__all__ = ["db", "User", "Chat", "ChatMember", "ChatMessage"]
+__all__ = ["db", "User", "Chat", "ChatMember", "ChatMessage", "MessageDailyStat", "PresenceSession", "RowCounter", "SocketIOPayload"]
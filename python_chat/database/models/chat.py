@@ -8,6 +8,7 @@ from python_chat.database import Base, db
 from python_chat.database.models.chat_member import ChatMember
 from python_chat.database.models.chat_message import ChatMessage
 from python_chat.database.models.user import User
+from python_chat.utils.membership_cache import membership_cache
 
 
 class Chat(Base):
@@ -28,6 +29,7 @@ class Chat(Base):
         member = ChatMember(user_id=user.id, chat_id=self.id, is_moderator=is_moderator)  # noqa
         db.session.add(member)
         db.session.commit()
+        membership_cache.invalidate(self.id, user.id)
         return member
 
     def remove_member(self, user: User) -> None:
@@ -36,6 +38,7 @@ class Chat(Base):
         if member:
             db.session.delete(member)
             db.session.commit()
+            membership_cache.invalidate(self.id, user.id)
 
     def ban_member(self, user: User, reason=None) -> bool:
         """Ban a user from this chat."""
@@ -43,6 +46,7 @@ class Chat(Base):
         if member:
             member.ban(reason)
             db.session.commit()
+            membership_cache.invalidate(self.id, user.id)
             return True
         return False
 
@@ -52,6 +56,7 @@ class Chat(Base):
         if member:
             member.unban()
             db.session.commit()
+            membership_cache.invalidate(self.id, user.id)
             return True
         return False
 
@@ -1,15 +1,21 @@
 from datetime import UTC, datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, Text
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, Select, Text, func, literal, select, true, tuple_
 from sqlalchemy.orm import Mapped, mapped_column
 
 from python_chat.database import Base, db
+from python_chat.database.models.chat_message import ChatMessage
+
+# Unread counts stop here; the chat list shows "99+"
+UNREAD_LIMIT = 100
 
 
 class ChatMember(Base):
     """Association model between users and chats."""
 
     __tablename__ = "chat_members"
+    # The (user_id, chat_id) primary key already serves lookups by user_id
+    __table_args__ = (Index("ix_chat_members_chat_id_is_banned", "chat_id", "is_banned"),)
 
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     chat_id: Mapped[int] = mapped_column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
@@ -18,6 +24,10 @@ class ChatMember(Base):
     is_banned: Mapped[bool] = mapped_column(Boolean, default=False)
     banned_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     banned_reason: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Newest message the member has seen, and its sent_at, i.e. its position in the history order.
+    # Not a foreign key: a partitioned messages table has no unique id
+    last_read_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_read_sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     user = db.relationship("User", back_populates="chats")
     chat = db.relationship("Chat", back_populates="members")
@@ -34,5 +44,27 @@ class ChatMember(Base):
         self.banned_at = None
         self.banned_reason = None
 
+    @staticmethod
+    def unread_counts(user_id: int, limit: int = UNREAD_LIMIT) -> dict[int, int]:
+        """Messages from others after the read position, per chat of the user, counted up to ``limit``."""
+        return dict(db.session.execute(ChatMember._unread_counts_stmt(user_id, limit)).all())
+
+    @staticmethod
+    def _unread_counts_stmt(user_id: int, limit: int) -> Select:
+        # One query for all chats; each reads at most ``limit`` entries of ix_messages_chat_id_sent_at_id
+        # after the read position, which also prunes older partitions
+        unread = (
+            select(ChatMessage.id)
+            .filter(
+                ChatMessage.chat_id == ChatMember.chat_id,
+                tuple_(ChatMessage.sent_at, ChatMessage.id)
+                > tuple_(func.coalesce(ChatMember.last_read_sent_at, literal("-infinity", DateTime(timezone=True))), func.coalesce(ChatMember.last_read_message_id, 0)),
+                ChatMessage.user_id.is_distinct_from(user_id),
+            )
+            .limit(limit)
+            .lateral("unread")
+        )
+        return select(ChatMember.chat_id, func.count(unread.c.id)).outerjoin(unread, true()).filter(ChatMember.user_id == user_id).group_by(ChatMember.chat_id)
+
     def __repr__(self) -> str:
         return f"<ChatMember user_id={self.user_id} chat_id={self.chat_id} is_moderator={self.is_moderator} is_banned={self.is_banned}>"
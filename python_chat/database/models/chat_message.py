@@ -1,15 +1,45 @@
-from datetime import UTC, datetime
+import uuid
+from datetime import UTC, datetime, timedelta
+from typing import Any
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Text
+from sqlalchemy import Computed, DateTime, Double, ForeignKey, Index, Integer, Select, Text, Uuid, cast, func, literal, select, text, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.dml import ReturningInsert
 
 from python_chat.database import Base, db
+from python_chat.database.models.user import User
+
+# How long after sending a retried message is still recognized across partitions
+DEDUPE_WINDOW = timedelta(days=1)
+
+# Text search configuration of the search vector: no stemming or stop words, as chats mix languages
+SEARCH_CONFIG = "simple"
+# Newest matches ranked per search, which bounds the work for common words
+SEARCH_CANDIDATES = 1000
+# ts_headline marks matches with private use characters, replaced after HTML escaping
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\ue000", "\ue001"
+HIGHLIGHT_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=35, MinWords=15"
 
 
 class ChatMessage(Base):
     """Message model for chat messages."""
 
     __tablename__ = "messages"
+    __table_args__ = (
+        # History pages: WHERE chat_id = ? ORDER BY sent_at, id
+        Index("ix_messages_chat_id_sent_at_id", "chat_id", "sent_at", "id"),
+        # Per-user counts (profile) and ON DELETE SET NULL from users
+        Index("ix_messages_user_id", "user_id"),
+        # Time-bounded analytics scans
+        Index("ix_messages_sent_at", "sent_at"),
+        # Idempotent sends: a retried client message id resolves to the stored message
+        Index("uq_messages_user_id_client_msg_id", "user_id", "client_msg_id", unique=True, postgresql_where=text("client_msg_id IS NOT NULL")),
+        # Full-text search
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     chat_id: Mapped[int] = mapped_column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
@@ -17,10 +47,156 @@ class ChatMessage(Base):
     # Изменили на SET NULL и nullable=True, чтобы сообщения сохранялись при удалении пользователя
     content: Mapped[str] = mapped_column(Text, nullable=False)
     sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(UTC))
+    # UUID generated by the sending client, for deduplicating retries
+    client_msg_id: Mapped[uuid.UUID | None] = mapped_column(Uuid, nullable=True)
+    # Maintained by Postgres; deferred so that loading messages does not fetch it
+    search_vector: Mapped[Any] = mapped_column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}'::regconfig, content)", persisted=True), deferred=True)
 
     chat = db.relationship("Chat", back_populates="messages")
     user = db.relationship("User", back_populates="messages")
 
+    @classmethod
+    def get_page(cls, chat_id: int, limit: int, before_id: int | None = None, after_id: int | None = None) -> tuple[list[Any], bool] | None:
+        """Get one keyset page of a chat's history, ordered by (sent_at, id).
+
+        Without a cursor the newest page is returned. ``before_id`` walks towards older
+        messages and ``after_id`` towards newer ones. Rows are (ChatMessage, username)
+        tuples in chronological order; the flag tells whether more rows exist past the page.
+        Returns None if the cursor message does not belong to the chat.
+        """
+        cursor_id = before_id if before_id is not None else after_id
+        cursor_sent_at = None
+        if cursor_id is not None:
+            cursor_sent_at = db.session.execute(cls._cursor_stmt(chat_id, cursor_id)).scalar_one_or_none()
+            if cursor_sent_at is None:
+                return None
+        newest_first = after_id is None
+        rows = list(db.session.execute(cls._page_stmt(chat_id, limit, newest_first, cursor_id, cursor_sent_at)).all())
+        return cls._split_page(rows, limit, newest_first)
+
+    @classmethod
+    async def get_page_async(cls, session: AsyncSession, chat_id: int, limit: int, before_id: int | None = None, after_id: int | None = None) -> tuple[list[Any], bool] | None:
+        """Same as :meth:`get_page`, on an asyncio session."""
+        cursor_id = before_id if before_id is not None else after_id
+        cursor_sent_at = None
+        if cursor_id is not None:
+            cursor_sent_at = (await session.execute(cls._cursor_stmt(chat_id, cursor_id))).scalar_one_or_none()
+            if cursor_sent_at is None:
+                return None
+        newest_first = after_id is None
+        rows = list((await session.execute(cls._page_stmt(chat_id, limit, newest_first, cursor_id, cursor_sent_at))).all())
+        return cls._split_page(rows, limit, newest_first)
+
+    @classmethod
+    def _cursor_stmt(cls, chat_id: int, cursor_id: int) -> Select:
+        return select(cls.sent_at).filter(cls.id == cursor_id, cls.chat_id == chat_id)
+
+    @classmethod
+    def _page_stmt(cls, chat_id: int, limit: int, newest_first: bool, cursor_id: int | None, cursor_sent_at: datetime | None) -> Select:
+        # Используем left join чтобы включить сообщения удаленных пользователей
+        stmt = select(cls, User.username).outerjoin(User, cls.user_id == User.id).filter(cls.chat_id == chat_id)
+        if cursor_id is not None:
+            key = tuple_(cls.sent_at, cls.id)
+            stmt = stmt.filter(key < (cursor_sent_at, cursor_id) if newest_first else key > (cursor_sent_at, cursor_id))
+            # Implied by the row comparison, but only a plain bound prunes partitions of a partitioned table
+            stmt = stmt.filter(cls.sent_at <= cursor_sent_at if newest_first else cls.sent_at >= cursor_sent_at)
+
+        if newest_first:
+            stmt = stmt.order_by(cls.sent_at.desc(), cls.id.desc())
+        else:
+            stmt = stmt.order_by(cls.sent_at, cls.id)
+
+        # Fetch one extra row to know whether another page exists
+        return stmt.limit(limit + 1)
+
+    @staticmethod
+    def _split_page(rows: list[Any], limit: int, newest_first: bool) -> tuple[list[Any], bool]:
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if newest_first:
+            rows.reverse()
+        return rows, has_more
+
+    @classmethod
+    def search(cls, query: str, chat_ids: Select | list[int], limit: int, before: tuple[float, int] | None = None) -> tuple[list[Any], bool]:
+        """Search messages of the given chats, best matches first.
+
+        ``query`` uses web search syntax: words, "quoted phrases", ``or`` and ``-word``. Only
+        the newest :data:`SEARCH_CANDIDATES` matches are ranked. Rows have id, chat_id,
+        sent_at, rank, headline and username; ``before`` is the (rank, id) of the last row of
+        the previous page. The flag tells whether more rows exist past the page.
+        """
+        rows = list(db.session.execute(cls._search_stmt(query, chat_ids, limit, before)).all())
+        return rows[:limit], len(rows) > limit
+
+    @classmethod
+    def _search_stmt(cls, query: str, chat_ids: Select | list[int], limit: int, before: tuple[float, int] | None) -> Select:
+        config = literal(SEARCH_CONFIG, REGCONFIG)
+        tsquery = func.websearch_to_tsquery(config, query)
+        # Double precision so that the rank survives the round trip through a cursor
+        rank = cast(func.ts_rank_cd(cls.search_vector, tsquery), Double).label("rank")
+        candidates = (
+            select(cls.id, cls.chat_id, cls.user_id, cls.content, cls.sent_at, rank)
+            .filter(cls.chat_id.in_(chat_ids), cls.search_vector.bool_op("@@")(tsquery))
+            .order_by(cls.sent_at.desc())
+            .limit(SEARCH_CANDIDATES)
+            .subquery()
+        )
+        page = select(candidates)
+        if before is not None:
+            page = page.filter(tuple_(candidates.c.rank, candidates.c.id) < before)
+        ranked = page.order_by(candidates.c.rank.desc(), candidates.c.id.desc()).limit(limit + 1).subquery()
+        # Headlines only for the rows of the page: ts_headline re-parses the whole message
+        headline = func.ts_headline(config, ranked.c.content, tsquery, HIGHLIGHT_OPTIONS).label("headline")
+        return (
+            select(ranked.c.id, ranked.c.chat_id, ranked.c.sent_at, ranked.c.rank, headline, User.username)
+            .outerjoin(User, ranked.c.user_id == User.id)
+            .order_by(ranked.c.rank.desc(), ranked.c.id.desc())
+        )
+
+    @classmethod
+    def create_idempotent(cls, user_id: int, chat_id: int, content: str, client_msg_id: uuid.UUID | None = None) -> tuple[int, bool]:
+        """Insert a message unless the user already sent one with the same client id.
+
+        Returns the message id and whether it was created by this call. Needs a commit.
+        """
+        message_id = db.session.execute(cls._insert_idempotent_stmt(user_id, chat_id, content, client_msg_id)).scalar_one_or_none()
+        if message_id is not None:
+            return message_id, True
+        existing_id = db.session.execute(cls._existing_stmt(user_id, client_msg_id)).scalar_one()
+        return existing_id, False
+
+    @classmethod
+    async def create_idempotent_async(cls, session: AsyncSession, user_id: int, chat_id: int, content: str, client_msg_id: uuid.UUID | None = None) -> tuple[int, bool]:
+        """Same as :meth:`create_idempotent`, on an asyncio session."""
+        message_id = (await session.execute(cls._insert_idempotent_stmt(user_id, chat_id, content, client_msg_id))).scalar_one_or_none()
+        if message_id is not None:
+            return message_id, True
+        existing_id = (await session.execute(cls._existing_stmt(user_id, client_msg_id))).scalar_one()
+        return existing_id, False
+
+    @classmethod
+    def _existing_stmt(cls, user_id: int, client_msg_id: uuid.UUID | None) -> Select:
+        # Partitions of different months may each hold a copy: resolve to the latest
+        return select(cls.id).filter(cls.user_id == user_id, cls.client_msg_id == client_msg_id).order_by(cls.sent_at.desc()).limit(1)
+
+    @classmethod
+    def _insert_idempotent_stmt(cls, user_id: int, chat_id: int, content: str, client_msg_id: uuid.UUID | None) -> ReturningInsert:
+        sent_at = datetime.now(UTC)
+        row = select(literal(user_id, Integer), literal(chat_id, Integer), literal(content, Text), literal(sent_at, DateTime(timezone=True)), literal(client_msg_id, Uuid))
+        if client_msg_id is not None:
+            # Partitioned messages only enforce (user_id, client_msg_id) per month: a retry sent after the
+            # month changed would not conflict, so recently stored copies are looked up explicitly
+            recent = select(cls.id).filter(cls.user_id == user_id, cls.client_msg_id == client_msg_id, cls.sent_at >= sent_at - DEDUPE_WINDOW)
+            row = row.where(~recent.exists())
+        return (
+            pg_insert(cls)
+            .from_select(["user_id", "chat_id", "content", "sent_at", "client_msg_id"], row)
+            # No conflict target: a partitioned table has no unique index on the parent to infer
+            .on_conflict_do_nothing()
+            .returning(cls.id)
+        )
+
     def __repr__(self) -> str:
         preview = self.content[:20] + "..." if len(self.content) > 20 else self.content
         return f"<ChatMessage id={self.id} chat={self.chat_id} user={self.user_id} content='{preview}'>"
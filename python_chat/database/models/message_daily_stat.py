@@ -0,0 +1,102 @@
+import datetime
+
+from sqlalchemy import DDL, BigInteger, Connection, Date, ForeignKey, Index, Integer, SmallInteger, delete, event, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from python_chat.database import Base
+from python_chat.database.models.chat_message import ChatMessage
+
+# Statement-level triggers on messages keep the rollup current for every write path (ORM, batch
+# writer, cascades from chats). Rows are upserted in key order so concurrent inserts cannot deadlock.
+STATS_TRIGGERS_SQL = """
+CREATE OR REPLACE FUNCTION message_daily_stats_add() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO message_daily_stats (day, hour, chat_id, user_id, message_count)
+    SELECT (sent_at AT TIME ZONE 'UTC')::date, extract(hour FROM sent_at AT TIME ZONE 'UTC'), chat_id, user_id, count(*)
+    FROM new_messages GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+    ON CONFLICT (day, hour, chat_id, user_id) DO UPDATE SET message_count = message_daily_stats.message_count + EXCLUDED.message_count;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION message_daily_stats_remove() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE message_daily_stats s SET message_count = s.message_count - d.message_count
+    FROM (
+        SELECT (sent_at AT TIME ZONE 'UTC')::date AS day, extract(hour FROM sent_at AT TIME ZONE 'UTC') AS hour, chat_id, user_id, count(*) AS message_count
+        FROM old_messages GROUP BY 1, 2, 3, 4
+    ) d
+    WHERE s.day = d.day AND s.hour = d.hour AND s.chat_id = d.chat_id AND s.user_id IS NOT DISTINCT FROM d.user_id;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE TRIGGER message_daily_stats_add AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_messages FOR EACH STATEMENT EXECUTE FUNCTION message_daily_stats_add();
+CREATE OR REPLACE TRIGGER message_daily_stats_remove AFTER DELETE ON messages
+    REFERENCING OLD TABLE AS old_messages FOR EACH STATEMENT EXECUTE FUNCTION message_daily_stats_remove();
+"""
+
+REBUILD_SQL = text(
+    """
+    INSERT INTO message_daily_stats (day, hour, chat_id, user_id, message_count)
+    SELECT :day, extract(hour FROM sent_at AT TIME ZONE 'UTC'), chat_id, user_id, count(*)
+    FROM messages WHERE sent_at >= :start AND sent_at < :stop
+    GROUP BY 2, 3, 4
+    """
+)
+
+
+class MessageDailyStat(Base):
+    """Message counts per UTC hour, chat and author, for analytics that must not scan messages.
+
+    Maintained by triggers on messages. Authors deleted later keep their id here until the
+    day is rebuilt with ``flask rollup-messages``; their messages then count under a NULL user.
+    """
+
+    __tablename__ = "message_daily_stats"
+    __table_args__ = (
+        # The upsert key; deleted authors share one NULL row per hour and chat
+        Index("uq_message_daily_stats_day_hour_chat_user", "day", "hour", "chat_id", "user_id", unique=True, postgresql_nulls_not_distinct=True),
+        Index("ix_message_daily_stats_user_id_day", "user_id", "day"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    day: Mapped[datetime.date] = mapped_column(Date, nullable=False)
+    # UTC hour of the day, 0-23
+    hour: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    chat_id: Mapped[int] = mapped_column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
+    # No foreign key: deleting a user must not rewrite its statistics
+    user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def rebuild_day(conn: Connection, day: datetime.date) -> None:
+        """Recompute one UTC day from messages, e.g. after a bulk import or to repair drift.
+
+        Writers to messages wait while the day is recounted, so that no insert is counted twice or lost.
+        """
+        start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.UTC)
+        conn.execute(text("LOCK TABLE messages IN SHARE MODE"))
+        conn.execute(delete(MessageDailyStat).filter(MessageDailyStat.day == day))
+        conn.execute(REBUILD_SQL, {"day": day, "start": start, "stop": start + datetime.timedelta(days=1)})
+
+    def __repr__(self) -> str:
+        return f"<MessageDailyStat {self.day} {self.hour:02d}h chat={self.chat_id} user={self.user_id} count={self.message_count}>"
+
+
+def create_stats_triggers(conn: Connection) -> None:
+    """(Re)create the triggers that maintain message_daily_stats on messages."""
+    conn.exec_driver_sql(STATS_TRIGGERS_SQL)
+
+
+DROP_STATS_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS message_daily_stats_add ON messages;
+DROP TRIGGER IF EXISTS message_daily_stats_remove ON messages;
+DROP FUNCTION IF EXISTS message_daily_stats_add(), message_daily_stats_remove();
+"""
+
+
+# The triggers are created with the table, so messages must exist first. This also installs them
+# on databases whose messages table predates the rollup.
+Base.metadata.tables[MessageDailyStat.__tablename__].add_is_dependent_on(Base.metadata.tables[ChatMessage.__tablename__])
+event.listen(MessageDailyStat.__table__, "after_create", DDL(STATS_TRIGGERS_SQL))
+event.listen(MessageDailyStat.__table__, "before_drop", DDL(DROP_STATS_TRIGGERS_SQL))
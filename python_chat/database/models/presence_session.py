@@ -0,0 +1,23 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import DateTime, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from python_chat.database import Base
+
+
+class PresenceSession(Base):
+    """Connected socket, shared between worker processes by the Postgres presence backend."""
+
+    __tablename__ = "presence_sessions"
+    # Presence is rebuilt by reconnecting clients, so it does not need WAL or crash safety
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    sid: Mapped[str] = mapped_column(String(64), primary_key=True)
+    node: Mapped[str] = mapped_column(String(128), nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    username: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    seen_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(UTC))
+
+    def __repr__(self) -> str:
+        return f"<PresenceSession sid={self.sid} user_id={self.user_id} node={self.node}>"
@@ -0,0 +1,126 @@
+from sqlalchemy import DDL, BigInteger, Connection, Integer, SmallInteger, Text, event, func, select, text, tuple_
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from python_chat.database import Base
+from python_chat.database.models.chat import Chat
+from python_chat.database.models.chat_member import ChatMember
+from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.models.user import User
+
+# Key of the counters that cover a whole table
+TABLE_KEY = 0
+# Concurrent writers add to different rows of a counter, so a busy chat or table total is not a hot row
+COUNTER_SLOTS = 8
+
+# Counter name -> key column, per counted table. Counters whose key is NULL are skipped.
+COUNTERS: dict[str, dict[str, str | None]] = {
+    "users": {"users": None},
+    "chats": {"chats": None},
+    "chat_members": {"chat_members": "chat_id", "user_chats": "user_id"},
+    "messages": {"messages": None, "chat_messages": "chat_id", "user_messages": "user_id"},
+}
+# Counters keyed by rows of a table, removed with those rows
+OWNED_COUNTERS = {"users": ("user_chats", "user_messages"), "chats": ("chat_members", "chat_messages")}
+
+
+def _counts_sql(table: str, source: str) -> str:
+    """Rows of ``source`` (the table or a transition table) per counter and key."""
+    parts = []
+    for name, key in COUNTERS[table].items():
+        if key is None:
+            parts.append(f"SELECT '{name}' AS name, {TABLE_KEY} AS key_id, count(*) AS value FROM {source}")
+        else:
+            parts.append(f"SELECT '{name}' AS name, {key} AS key_id, count(*) AS value FROM {source} WHERE {key} IS NOT NULL GROUP BY {key}")
+    return " UNION ALL ".join(parts)
+
+
+def counter_triggers_sql(table: str) -> str:
+    """The statement-level triggers that keep the counters of ``table`` current."""
+    owned = ""
+    if table in OWNED_COUNTERS:
+        names = ", ".join(f"'{name}'" for name in OWNED_COUNTERS[table])
+        owned = f"DELETE FROM row_counters WHERE name IN ({names}) AND key_id IN (SELECT id FROM changed_rows);"
+    counts = f"SELECT * FROM ({_counts_sql(table, 'changed_rows')}) counts WHERE value > 0"
+    return f"""
+CREATE OR REPLACE FUNCTION row_counters_{table}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO row_counters (name, key_id, slot, value)
+        SELECT name, key_id, mod(pg_backend_pid(), {COUNTER_SLOTS}), value FROM ({counts}) counts ORDER BY 1, 2
+        ON CONFLICT (name, key_id, slot) DO UPDATE SET value = row_counters.value + EXCLUDED.value;
+    ELSE
+        -- Only existing rows are decremented: a cascade from a deleted chat or user must not bring back its counters
+        UPDATE row_counters c SET value = c.value - d.value FROM ({counts}) d
+        WHERE c.name = d.name AND c.key_id = d.key_id AND c.slot = (
+            SELECT s.slot FROM row_counters s WHERE s.name = d.name AND s.key_id = d.key_id
+            ORDER BY s.slot = mod(pg_backend_pid(), {COUNTER_SLOTS}) DESC, s.slot LIMIT 1
+        );
+        {owned}
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE TRIGGER row_counters_insert AFTER INSERT ON {table}
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION row_counters_{table}();
+CREATE OR REPLACE TRIGGER row_counters_delete AFTER DELETE ON {table}
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION row_counters_{table}();
+"""
+
+
+def drop_counter_triggers_sql(table: str) -> str:
+    return f"DROP TRIGGER IF EXISTS row_counters_insert ON {table}; DROP TRIGGER IF EXISTS row_counters_delete ON {table}; DROP FUNCTION IF EXISTS row_counters_{table}();"
+
+
+# Every counter as counted from its table
+EXPECTED_COUNTERS_SQL = " UNION ALL ".join(_counts_sql(table, table) for table in COUNTERS)
+FILL_COUNTERS_SQL = f"INSERT INTO row_counters (name, key_id, slot, value) SELECT name, key_id, 0, value FROM ({EXPECTED_COUNTERS_SQL}) counts WHERE value > 0"
+
+
+class RowCounter(Base):
+    """Row counts per table, chat and user, so totals and profile statistics are O(1) lookups.
+
+    Maintained by triggers on the counted tables. A counter is the sum of its rows over all slots;
+    ``flask check-counters`` compares them with the tables and can rebuild them.
+    """
+
+    __tablename__ = "row_counters"
+
+    name: Mapped[str] = mapped_column(Text, primary_key=True)
+    # Id of the chat or user counted, TABLE_KEY for whole tables
+    key_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    slot: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+    @staticmethod
+    def get(session: Session, *counters: tuple[str, int]) -> dict[tuple[str, int], int]:
+        """Values of the given (name, key) counters in one query; counters without rows are 0."""
+        rows = session.execute(
+            select(RowCounter.name, RowCounter.key_id, func.sum(RowCounter.value)).filter(tuple_(RowCounter.name, RowCounter.key_id).in_(counters)).group_by(RowCounter.name, RowCounter.key_id)
+        )
+        values = {(name, key_id): int(value) for name, key_id, value in rows}
+        return {counter: values.get(counter, 0) for counter in counters}
+
+    @staticmethod
+    def rebuild(conn: Connection) -> None:
+        """Recount every counter from its table. Writers to the counted tables wait meanwhile."""
+        conn.execute(text(f"LOCK TABLE {', '.join(COUNTERS)} IN SHARE MODE"))
+        conn.execute(text("DELETE FROM row_counters"))
+        conn.execute(text(FILL_COUNTERS_SQL))
+
+    def __repr__(self) -> str:
+        return f"<RowCounter {self.name}[{self.key_id}] slot={self.slot} value={self.value}>"
+
+
+def create_counter_triggers(conn: Connection, table: str) -> None:
+    """(Re)create the triggers that maintain the counters of ``table``."""
+    conn.exec_driver_sql(counter_triggers_sql(table))
+
+
+_table = Base.metadata.tables[RowCounter.__tablename__]
+for _model in (User, Chat, ChatMember, ChatMessage):
+    # The triggers are created with row_counters, so the counted tables must exist first
+    _table.add_is_dependent_on(Base.metadata.tables[_model.__tablename__])
+    event.listen(_table, "after_create", DDL(counter_triggers_sql(_model.__tablename__)))
+    event.listen(_table, "before_drop", DDL(drop_counter_triggers_sql(_model.__tablename__)))
+# Counts rows that predate the counters, e.g. when added to an existing database
+event.listen(_table, "after_create", DDL(FILL_COUNTERS_SQL))
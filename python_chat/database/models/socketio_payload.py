@@ -0,0 +1,21 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import BigInteger, DateTime, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from python_chat.database import Base
+
+
+class SocketIOPayload(Base):
+    """Socket.IO queue message too large for a NOTIFY payload, referenced by id in the notification."""
+
+    __tablename__ = "socketio_payloads"
+    # Only needed for a few minutes, so skip the WAL
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(UTC), server_default="now()")
+
+    def __repr__(self) -> str:
+        return f"<SocketIOPayload id={self.id} size={len(self.payload)}>"
@@ -1,7 +1,7 @@
 from datetime import UTC, datetime
 
 from flask_login import UserMixin
-from sqlalchemy import Boolean, DateTime, Integer, String, Text
+from sqlalchemy import DDL, Boolean, DateTime, Index, Integer, Select, String, Text, event, func, select, text
 from sqlalchemy.orm import Mapped, mapped_column
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -12,6 +12,10 @@ class User(UserMixin, Base):
     """User model for authentication and session management."""
 
     __tablename__ = "users"
+    __table_args__ = (
+        # Prefix autocomplete: WHERE lower(username) LIKE 'q%' ORDER BY lower(username), in byte order so LIKE can use it
+        Index("ix_users_username_lower", func.lower(text("username")).collate("C")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
@@ -45,5 +49,46 @@ class User(UserMixin, Base):
         self.blocked_at = None
         self.blocked_reason = None
 
+    @classmethod
+    def search(cls, query: str, limit: int, exclude_id: int | None = None, prefix: bool = False) -> list["User"]:
+        """Find users by username, case-insensitively: the exact match, then prefix matches, then other substring matches.
+
+        ``prefix`` stops after the prefix matches, which are served by ix_users_username_lower.
+        Other matches come from the pg_trgm index where it exists, and are not necessarily
+        the alphabetically first ones.
+        """
+        users = list(db.session.execute(cls._exclude(cls._prefix_search_stmt(query), exclude_id).limit(limit)).scalars())
+        if not prefix and len(users) < limit:
+            others = db.session.execute(cls._exclude(cls._substring_search_stmt(query), exclude_id).limit(limit - len(users))).scalars()
+            users += sorted(others, key=lambda user: user.username.lower())
+        return users
+
+    @classmethod
+    def _exclude(cls, stmt: Select, user_id: int | None) -> Select:
+        return stmt if user_id is None else stmt.filter(cls.id != user_id)
+
+    @classmethod
+    def _prefix_search_stmt(cls, query: str) -> Select:
+        lowered = func.lower(cls.username).collate("C")
+        # The exact match sorts before longer names with it as a prefix
+        return select(cls).filter(lowered.startswith(query.lower(), autoescape=True)).order_by(lowered)
+
+    @classmethod
+    def _substring_search_stmt(cls, query: str) -> Select:
+        # Unordered, so that the scan stops at the limit; sorting every match would read them all
+        lowered = func.lower(cls.username).collate("C")
+        return select(cls).filter(cls.username.icontains(query, autoescape=True), ~lowered.startswith(query.lower(), autoescape=True))
+
     def __repr__(self) -> str:
         return f"<User {self.username}>"
+
+
+def _trigram_available(ddl, target, bind, tables=None, state=None, **kw) -> bool:
+    if bind is None:
+        return False
+    return bool(bind.execute(text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")).scalar_one())
+
+
+# Substring search (ILIKE '%q%'), where Postgres ships pg_trgm; without it substring searches scan users
+event.listen(User.__table__, "after_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(callable_=_trigram_available))
+event.listen(User.__table__, "after_create", DDL("CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)").execute_if(callable_=_trigram_available))
@@ -0,0 +1,277 @@
+"""Optional monthly range partitioning of ``messages`` by ``sent_at``.
+
+With MESSAGES_PARTITIONED the table is created as ``PARTITION BY RANGE (sent_at)`` with one
+partition per UTC month, ``messages_pYYYY_MM``, and a ``messages_default`` partition for rows
+outside them. Partitions are kept ``months_ahead`` months ahead at startup, by a background
+task and by ``flask partition-messages``; maintenance also moves rows that landed in the
+default partition into monthly partitions. An existing plain table is converted with
+``flask partition-messages --convert``: it becomes the partition for everything up to its
+newest month.
+
+Postgres cannot enforce uniqueness across partitions, so the primary key is (id, sent_at) and
+the (user_id, client_msg_id) index used to deduplicate retried sends is unique per partition;
+:meth:`ChatMessage.create_idempotent` also checks recent messages for the cross-month case.
+"""
+
+import datetime
+from typing import Any
+
+import click
+from flask import Flask
+from sqlalchemy import Column, Connection, Index, MetaData, Table, func, inspect, select, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from python_chat.database import db
+from python_chat.database.models.chat import Chat
+from python_chat.database.models.chat_member import ChatMember
+from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.models.message_daily_stat import MessageDailyStat, create_stats_triggers
+from python_chat.database.models.row_counter import RowCounter, create_counter_triggers, drop_counter_triggers_sql
+from python_chat.database.models.user import User
+
+DEFAULT_PARTITION = "messages_default"
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"messages_p{month.year:04d}_{month.month:02d}"
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def next_month(month: datetime.date) -> datetime.date:
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _bound(month: datetime.date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def partitioned_messages_table(metadata: MetaData) -> Table:
+    """Copy of the ORM ``messages`` table partitioned by range of sent_at, keyed by (id, sent_at)."""
+    for table in (db.metadata.tables[User.__tablename__], db.metadata.tables[Chat.__tablename__]):
+        table.to_metadata(metadata)
+    columns: list[Column[Any]] = []
+    for column in db.metadata.tables[ChatMessage.__tablename__].columns:
+        copy = column._copy()
+        # The partition key must be part of the primary key
+        copy.primary_key = column.name in ("id", "sent_at")
+        if column.name == "id":
+            copy.autoincrement = True
+        columns.append(copy)
+    table = Table(ChatMessage.__tablename__, metadata, *columns, postgresql_partition_by="RANGE (sent_at)")
+    for index in db.metadata.tables[ChatMessage.__tablename__].indexes:
+        if not index.unique:
+            # Non-unique indexes are created on the parent and cascade to every partition
+            Index(index.name, *[table.c[column.name] for column in index.columns], **index.dialect_kwargs)
+    return table
+
+
+def _partition_indexes(conn: Connection, name: str) -> None:
+    # Retried sends are deduplicated per partition
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_user_id_client_msg_id ON {name} (user_id, client_msg_id) WHERE client_msg_id IS NOT NULL"))
+
+
+def _message_triggers(conn: Connection) -> None:
+    # The rollup and counter triggers belong to the table named messages, which was just created
+    db.metadata.create_all(conn, tables=[db.metadata.tables[model.__tablename__] for model in (ChatMember, MessageDailyStat, RowCounter)])
+    create_stats_triggers(conn)
+    create_counter_triggers(conn, ChatMessage.__tablename__)
+
+
+def _lock(conn: Connection) -> None:
+    # Workers starting together must not create the same partition twice
+    conn.execute(select(func.pg_advisory_xact_lock(func.hashtext("messages_partitions"))))
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages'))")).scalar_one())
+
+
+def message_partitions(conn: Connection) -> list[str]:
+    """Names of the partitions of messages."""
+    rows = conn.execute(text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass('messages') ORDER BY c.relname"))
+    return [name for (name,) in rows]
+
+
+def create_partitioned_messages(conn: Connection) -> bool:
+    """Create messages as a partitioned table with its default partition, unless it exists."""
+    _lock(conn)
+    if inspect(conn).has_table(ChatMessage.__tablename__):
+        return False
+    metadata = MetaData()
+    table = partitioned_messages_table(metadata)
+    # users and chats are referenced by foreign keys
+    db.metadata.create_all(conn, tables=[db.metadata.tables[User.__tablename__], db.metadata.tables[Chat.__tablename__]])
+    conn.execute(CreateTable(table))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+    _partition_indexes(conn, DEFAULT_PARTITION)
+    _message_triggers(conn)
+    return True
+
+
+def _create_partition(conn: Connection, month: datetime.date, has_default: bool) -> None:
+    name = partition_name(month)
+    bounds = f"FROM ({_bound(month)}) TO ({_bound(next_month(month))})"
+    in_range = f"sent_at >= {_bound(month)} AND sent_at < {_bound(next_month(month))}"
+    if has_default and conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})")).scalar_one():
+        # A new partition may not overlap rows of the default partition: move them over first
+        names = ", ".join(column.name for column in db.metadata.tables[ChatMessage.__tablename__].columns if column.computed is None)
+        conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"))
+        conn.execute(text(f"INSERT INTO {name} ({names}) SELECT {names} FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    else:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF messages FOR VALUES {bounds}"))
+    _partition_indexes(conn, name)
+
+
+def ensure_message_partitions(conn: Connection, months_ahead: int = 3, today: datetime.date | None = None) -> list[str]:
+    """Create the monthly partitions up to ``months_ahead`` months from today and for rows in the default partition.
+
+    Returns the names of the partitions created. Does nothing if messages is not partitioned.
+    """
+    _lock(conn)
+    if not is_partitioned(conn):
+        return []
+    existing = set(message_partitions(conn))
+    has_default = DEFAULT_PARTITION in existing
+
+    month = month_start(today or datetime.datetime.now(datetime.UTC).date())
+    months = set()
+    for _ in range(months_ahead + 1):
+        months.add(month)
+        month = next_month(month)
+    if has_default:
+        stray = conn.execute(text(f"SELECT DISTINCT date_trunc('month', sent_at AT TIME ZONE 'UTC')::date FROM {DEFAULT_PARTITION}"))
+        months.update(month for (month,) in stray)
+
+    created = []
+    for month in sorted(months):
+        if partition_name(month) not in existing:
+            _create_partition(conn, month, has_default)
+            created.append(partition_name(month))
+    return created
+
+
+def convert_messages_to_partitioned(conn: Connection) -> str:
+    """Turn an existing plain messages table into the first partition of a partitioned one.
+
+    The old table keeps its rows, indexes and id sequence and covers everything up to the
+    end of its newest month; later months get monthly partitions. Its primary key index is
+    rebuilt on (id, sent_at), under an exclusive lock. Returns its new name.
+    """
+    _lock(conn)
+    if is_partitioned(conn):
+        raise ValueError("messages is already partitioned")
+    legacy = "messages_legacy"
+    newest = conn.execute(text("SELECT max(sent_at) FROM messages")).scalar_one()
+    upper = next_month(month_start((newest or datetime.datetime.now(datetime.UTC)).astimezone(datetime.UTC).date()))
+
+    conn.execute(text(f"ALTER TABLE messages RENAME TO {legacy}"))
+    # The key of a partition has to match the parent's (id, sent_at)
+    conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT messages_pkey, ADD CONSTRAINT {legacy}_pkey PRIMARY KEY (id, sent_at)"))
+    for index in db.metadata.tables[ChatMessage.__tablename__].indexes:
+        conn.execute(text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy"))
+    conn.execute(text(f"ALTER SEQUENCE messages_id_seq RENAME TO {legacy}_id_seq"))
+    # Statement triggers only fire for the table a statement targets: the parent's take over
+    conn.execute(text(f"DROP TRIGGER IF EXISTS message_daily_stats_add ON {legacy}"))
+    conn.execute(text(f"DROP TRIGGER IF EXISTS message_daily_stats_remove ON {legacy}"))
+    conn.exec_driver_sql(drop_counter_triggers_sql(legacy))
+
+    metadata = MetaData()
+    table = partitioned_messages_table(metadata)
+    conn.execute(CreateTable(table))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    # Ids continue where the old table stopped
+    conn.execute(text(f"SELECT setval('messages_id_seq', greatest((SELECT max(id) FROM {legacy}), 1))"))
+    conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ({_bound(upper)})"))
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+    _partition_indexes(conn, DEFAULT_PARTITION)
+    _message_triggers(conn)
+    return legacy
+
+
+class MessagePartitioner:
+    """Keeps the monthly partitions of messages ahead of time when MESSAGES_PARTITIONED is set."""
+
+    def __init__(self, months_ahead: int = 3, check_hours: float = 12.0) -> None:
+        self.enabled = False
+        self.months_ahead = months_ahead
+        self.check_hours = check_hours
+        self.app: Flask | None = None
+        self._socketio: Any = None
+        self._started = False
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Read the settings and register ``flask partition-messages``."""
+        self.enabled = app.config.get("MESSAGES_PARTITIONED", False)
+        self.months_ahead = app.config.get("MESSAGES_PARTITION_MONTHS_AHEAD", self.months_ahead)
+        self.check_hours = app.config.get("MESSAGES_PARTITION_CHECK_HOURS", self.check_hours)
+        self.app = app
+        self._socketio = socketio
+        self._started = False
+
+        @app.cli.command("partition-messages")
+        @click.option("--convert", is_flag=True, help="Convert an existing plain messages table first.")
+        def partition_messages_command(convert: bool) -> None:
+            """Create the monthly partitions of messages ahead of time."""
+            with db.engine.begin() as conn:
+                if convert:
+                    try:
+                        click.echo(f"messages converted, old rows are in {convert_messages_to_partitioned(conn)}")
+                    except ValueError as e:
+                        raise click.ClickException(str(e)) from e
+                created = ensure_message_partitions(conn, self.months_ahead)
+            click.echo(f"created {len(created)} partitions: {', '.join(created)}" if created else "partitions are up to date")
+
+        if self.enabled:
+
+            @app.before_request
+            def start_partition_maintenance():
+                self._ensure_worker()
+
+    def create_table(self) -> None:
+        """Create messages as a partitioned table if it does not exist yet. Needs an app context."""
+        if not self.enabled:
+            return
+        with db.engine.begin() as conn:
+            if create_partitioned_messages(conn):
+                assert self.app is not None
+                self.app.logger.info("Created messages as a partitioned table")
+
+    def maintain(self) -> list[str]:
+        """Create missing partitions. Needs an app context."""
+        if not self.enabled:
+            return []
+        with db.engine.begin() as conn:
+            if not is_partitioned(conn):
+                assert self.app is not None
+                self.app.logger.warning("MESSAGES_PARTITIONED is set but messages is a plain table: run flask partition-messages --convert")
+                return []
+            created = ensure_message_partitions(conn, self.months_ahead)
+        if created and self.app is not None:
+            self.app.logger.info(f"Created message partitions {', '.join(created)}")
+        return created
+
+    def _ensure_worker(self) -> None:
+        if not self._started and self._socketio is not None:
+            self._started = True
+            self._socketio.start_background_task(self._maintenance_loop)
+
+    def _maintenance_loop(self) -> None:
+        assert self.app is not None
+        while True:
+            self._socketio.sleep(self.check_hours * 3600)
+            with self.app.app_context():
+                try:
+                    self.maintain()
+                except Exception as e:
+                    self.app.logger.error(f"Message partition maintenance failed: {e}")
+
+
+message_partitioner = MessagePartitioner()
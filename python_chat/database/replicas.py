@@ -0,0 +1,167 @@
+import logging
+import random
+import time
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Flask, has_request_context
+from flask import session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Delete, Insert, Select, Update, event, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Replication lag in seconds; 0 when the replica replayed everything it received, which also
+# covers an idle primary, and on a server that is not a standby (a stand-in replica in tests)
+REPLICA_LAG_SQL = text("SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END")
+
+# Whether SELECTs of the current request, socket event or block may go to a replica
+_replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def replica_reads() -> Iterator[None]:
+    """Let SELECTs go to a replica, e.g. ``with replica_reads():`` or ``@replica_reads()`` on a read-only view.
+
+    Writes, flushes and raw SQL still use the primary.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _request_user_id() -> int | None:
+    """Id of the logged in user, from the session cookie so the user is not loaded from the database."""
+    if not has_request_context():
+        return None
+    user_id = flask_session.get("_user_id")
+    return int(user_id) if user_id is not None else None
+
+
+class ReplicaRouter:
+    """Sends reads in :func:`replica_reads` scopes to read replicas.
+
+    Replicas are the binds ``replica_0``, ``replica_1``, ... built from SQLALCHEMY_REPLICA_URIS.
+    A replica is used while its replication lag, measured at most every ``check_interval``
+    seconds, stays within ``max_lag``; lagging or unreachable replicas fall back to the
+    primary. A user who committed a write reads from the primary for ``max_lag +
+    check_interval`` seconds, after which any replica still in use has the write. Writes are
+    remembered per process, which holds with the sticky sessions Socket.IO needs anyway.
+    """
+
+    def __init__(self, max_lag: float = 5.0, check_interval: float = 1.0) -> None:
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.bind_keys: list[str] = []
+        # bind key -> (usable, monotonic time of the check)
+        self._health: dict[str, tuple[bool, float]] = {}
+        # bind key -> last measured lag in seconds
+        self.lags: dict[str, float] = {}
+        # user id -> monotonic time of the last commit with a write
+        self._last_writes: dict[int, float] = {}
+        self.routed = {"replica": 0, "primary": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.bind_keys)
+
+    def init_app(self, app: Flask) -> None:
+        """Add a bind per replica URI. Call before ``db.init_app``, which creates the engines."""
+        self.max_lag = app.config.get("REPLICA_MAX_LAG_SECONDS", self.max_lag)
+        self.check_interval = app.config.get("REPLICA_LAG_CHECK_SECONDS", self.check_interval)
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        self.bind_keys = []
+        for index, uri in enumerate(app.config.get("SQLALCHEMY_REPLICA_URIS") or []):
+            key = f"replica_{index}"
+            binds[key] = uri
+            self.bind_keys.append(key)
+        app.config["SQLALCHEMY_BINDS"] = binds
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget replica health and recent writes."""
+        self._health.clear()
+        self.lags.clear()
+        self._last_writes.clear()
+        self.routed = {"replica": 0, "primary": 0}
+
+    def record_write(self, user_id: int | None) -> None:
+        """Keep the user's reads on the primary until replicas in use have caught up."""
+        if user_id is not None and self.enabled:
+            self._last_writes[int(user_id)] = time.monotonic()
+
+    def _recently_wrote(self, user_id: int | None, now: float) -> bool:
+        if user_id is None:
+            return False
+        written_at = self._last_writes.get(user_id)
+        if written_at is None:
+            return False
+        if now - written_at < self.max_lag + self.check_interval:
+            return True
+        del self._last_writes[user_id]
+        return False
+
+    def measure_lag(self, engine: Engine) -> float:
+        """Replication lag of a replica in seconds."""
+        with engine.connect() as conn:
+            return float(conn.execute(REPLICA_LAG_SQL).scalar_one() or 0.0)
+
+    def _usable(self, key: str, engine: Engine, now: float) -> bool:
+        usable, checked_at = self._health.get(key, (False, float("-inf")))
+        if now - checked_at < self.check_interval:
+            return usable
+        try:
+            self.lags[key] = self.measure_lag(engine)
+            usable = self.lags[key] <= self.max_lag
+            if not usable:
+                logger.warning(f"Replica {key} lags {self.lags[key]:.1f} s, reading from the primary")
+        except Exception as e:
+            logger.warning(f"Replica {key} is unreachable, reading from the primary: {e}")
+            usable = False
+        self._health[key] = (usable, now)
+        return usable
+
+    def engine_for_read(self, engines: Mapping[str | None, Engine]) -> Engine | None:
+        """A usable replica engine for a SELECT of the current user, or None for the primary."""
+        now = time.monotonic()
+        if self._recently_wrote(_request_user_id(), now):
+            self.routed["primary"] += 1
+            return None
+        candidates = [engines[key] for key in self.bind_keys if self._usable(key, engines[key], now)]
+        if not candidates:
+            self.routed["primary"] += 1
+            return None
+        self.routed["replica"] += 1
+        return random.choice(candidates)
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """``db.session`` class that sends SELECTs in :func:`replica_reads` scopes to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, Insert | Update | Delete):
+                self.info["replica_wrote"] = True
+            elif replica_router.enabled and _replica_reads.get() and isinstance(clause, Select):
+                engine = replica_router.engine_for_read(self._db.engines)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_write(session: RoutingSession) -> None:
+    if session.info.pop("replica_wrote", False):
+        replica_router.record_write(_request_user_id())
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_write(session: RoutingSession) -> None:
+    session.info.pop("replica_wrote", None)
@@ -1,17 +1,23 @@
 import datetime
 import functools
+import hmac
 
-from flask import Blueprint, abort, jsonify, render_template
+from flask import Blueprint, Response, abort, current_app, jsonify, render_template, request
 from flask_login import current_user, login_required
-from sqlalchemy import func, text
 
-from python_chat.database import db
-from python_chat.database.models.chat import Chat
-from python_chat.database.models.chat_message import ChatMessage
-from python_chat.database.models.user import User
+from python_chat.database import db, message_stats
+from python_chat.database.models.row_counter import TABLE_KEY, RowCounter
+from python_chat.database.replicas import replica_reads
+from python_chat.utils.metrics import metrics
+from python_chat.utils.query_profiler import query_profiler
 
 bp = Blueprint("admin", __name__)
 
+DEFAULT_ACTIVITY_DAYS = 7
+# Bounds on the buckets one activity request may return
+MAX_DAILY_DAYS = 3660
+MAX_HOURLY_DAYS = 31
+
 
 def admin_required(func):
     """Decorator to ensure the user is an admin."""
@@ -25,6 +31,22 @@ def admin_required(func):
     return wrapper
 
 
+def _date_range(default_days: int | None) -> tuple[datetime.date | None, datetime.date | None]:
+    """Parse the inclusive ``from``/``to`` UTC dates (YYYY-MM-DD); without ``from``, the last ``default_days`` days."""
+    try:
+        start = datetime.date.fromisoformat(request.args["from"]) if "from" in request.args else None
+        end = datetime.date.fromisoformat(request.args["to"]) if "to" in request.args else None
+    except ValueError:
+        abort(400, "Dates must be YYYY-MM-DD")
+    if start is None and default_days is not None:
+        start = (end or datetime.datetime.now(datetime.UTC).date()) - datetime.timedelta(days=default_days - 1)
+    if end is None and default_days is not None:
+        end = datetime.datetime.now(datetime.UTC).date()
+    if start is not None and end is not None and start > end:
+        abort(400, "from must not be after to")
+    return start, end
+
+
 @bp.route("/admin/dashboard")
 @login_required
 @admin_required
@@ -36,23 +58,23 @@ def admin_dashboard():
 @bp.route("/api/analytics/overview")
 @login_required
 @admin_required
+@replica_reads()
 def get_analytics_overview():
-    """Получить обзорные аналитические данные на основе существующих таблиц"""
+    """Получить обзорные аналитические данные из счётчиков и message_daily_stats"""
 
-    # Запросы к существующим таблицам
-    total_users = db.session.query(User).count()
-    total_chats = db.session.query(Chat).count()
-    total_messages = db.session.query(ChatMessage).count()
+    totals = RowCounter.get(db.session, ("users", TABLE_KEY), ("chats", TABLE_KEY), ("messages", TABLE_KEY))
 
-    # Пользователи с сообщениями за последние 24 часа
-    yesterday = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=1)
-    active_users = db.session.query(ChatMessage.user_id).distinct().filter(ChatMessage.sent_at >= yesterday).count()
+    # Пользователи с сообщениями за последние 24 часа (с точностью до часа)
+    now = datetime.datetime.now(datetime.UTC)
+    active_users = message_stats.active_users_since(now - datetime.timedelta(days=1))
 
-    # Сообщения за сегодня
-    today = datetime.datetime.now(datetime.UTC).date()
-    messages_today = db.session.query(ChatMessage).filter(func.date(ChatMessage.sent_at) == today).count()
-
-    data = {"total_users": total_users, "total_chats": total_chats, "total_messages": total_messages, "active_users": active_users, "messages_today": messages_today}
+    data = {
+        "total_users": totals["users", TABLE_KEY],
+        "total_chats": totals["chats", TABLE_KEY],
+        "total_messages": totals["messages", TABLE_KEY],
+        "active_users": active_users,
+        "messages_today": message_stats.total_messages(now.date(), now.date()),
+    }
 
     return jsonify(data)
 
@@ -60,20 +82,14 @@ def get_analytics_overview():
 @bp.route("/api/analytics/chat-activity")
 @login_required
 @admin_required
+@replica_reads()
 def get_chat_activity():
-    """Получить данные об активности чатов"""
-    # Находим самые активные чаты (по количеству сообщений)
-    chat_activity = (
-        db.session.query(Chat.name, func.count(ChatMessage.id).label("message_count"))
-        .join(ChatMessage, Chat.id == ChatMessage.chat_id)
-        .group_by(Chat.id)
-        .order_by(text("message_count DESC"))
-        .limit(5)
-        .all()
-    )
+    """Получить самые активные чаты, за всё время или за период from/to"""
+    start, end = _date_range(None)
+    chat_activity = message_stats.top_chats(5, start, end)
 
     # Преобразуем в формат для графика
-    chart_data = {"labels": [chat.name for chat in chat_activity], "datasets": [{"label": "Количество сообщений", "data": [chat.message_count for chat in chat_activity]}]}
+    chart_data = {"labels": [name for name, _ in chat_activity], "datasets": [{"label": "Количество сообщений", "data": [count for _, count in chat_activity]}]}
 
     return jsonify(chart_data)
 
@@ -81,23 +97,54 @@ def get_chat_activity():
 @bp.route("/api/analytics/user-activity")
 @login_required
 @admin_required
+@replica_reads()
 def get_user_activity():
-    """Получить данные о пользовательской активности"""
+    """Получить количество сообщений по дням или часам (granularity) за период from/to, по умолчанию за 7 дней"""
+    granularity = request.args.get("granularity", "day")
+    if granularity not in message_stats.GRANULARITIES:
+        abort(400, "granularity must be day or hour")
+    start, end = _date_range(DEFAULT_ACTIVITY_DAYS)
+    assert start is not None and end is not None
+    max_days = MAX_HOURLY_DAYS if granularity == "hour" else MAX_DAILY_DAYS
+    if (end - start).days + 1 > max_days:
+        abort(400, f"At most {max_days} days at {granularity} granularity")
+
+    series = message_stats.message_series(start, end, granularity, chat_id=request.args.get("chat_id", type=int), user_id=request.args.get("user_id", type=int))
+    label_format = "%d.%m %H:00" if granularity == "hour" else "%d.%m"
+
+    data = {
+        "labels": [bucket.strftime(label_format) for bucket, _ in series],
+        "datasets": [{"label": "Сообщения", "data": [count for _, count in series]}],
+        "granularity": granularity,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+    }
 
-    # Данные по активности пользователей за последние 7 дней
-    days = 7
-    today = datetime.datetime.now(datetime.UTC).date()
+    return jsonify(data)
 
-    # Подготавливаем список дат (последние 7 дней)
-    date_labels = [(today - datetime.timedelta(days=i)) for i in range(days - 1, -1, -1)]
-    date_labels_str = [d.strftime("%d.%m") for d in date_labels]
 
-    # Запрос количества сообщений по дням
-    message_counts = []
-    for date in date_labels:
-        count = db.session.query(func.count(ChatMessage.id)).filter(func.date(ChatMessage.sent_at) == date).scalar() or 0
-        message_counts.append(count)
+@bp.route("/admin/queries")
+@login_required
+@admin_required
+def query_profile_page():
+    """Самые тяжёлые запросы к БД по данным профилировщика (только для админов)"""
+    return render_template("admin_queries.html", user=current_user, report=query_profiler.report())
 
-    data = {"labels": date_labels_str, "datasets": [{"label": "Сообщения", "data": message_counts}]}
 
-    return jsonify(data)
+@bp.route("/api/admin/query-profile")
+@login_required
+@admin_required
+def get_query_profile():
+    """Получить статистику профилировщика запросов"""
+    return jsonify(query_profiler.report(limit=request.args.get("limit", 20, type=int)))
+
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    """Метрики в формате Prometheus: для админов или по токену METRICS_TOKEN"""
+    token = current_app.config.get("METRICS_TOKEN")
+    authorization = request.headers.get("Authorization", "")
+    by_token = bool(token) and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    if not by_token and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
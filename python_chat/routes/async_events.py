@@ -0,0 +1,266 @@
+import functools
+from typing import Any
+
+import socketio
+from flask import Flask
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from werkzeug.http import parse_cookie
+
+from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.models.user import User
+from python_chat.database.replicas import replica_router
+from python_chat.routes.events import (
+    Rejection,
+    _join_rejection,
+    _leave_chat,
+    _mark_read,
+    _mark_read_target,
+    _message_ack,
+    _message_payload,
+    _parse_send_message,
+    _rate_limit_rejection,
+    _remove_socket,
+    _rename,
+    _replay_limit,
+    _replay_payload,
+    _send_rejection,
+    _set_typing,
+    _username_rejection,
+)
+from python_chat.utils.membership_cache import membership_cache
+from python_chat.utils.presence import get_presence, user_room
+from python_chat.utils.typing_state import typing_coalescer
+
+
+def session_user_id(app: Flask, environ: dict[str, Any]) -> int | None:
+    """User id stored by Flask-Login in the signed session cookie of a Socket.IO handshake."""
+    cookie = parse_cookie(environ.get("HTTP_COOKIE", "")).get(app.config.get("SESSION_COOKIE_NAME", "session"))
+    serializer = app.session_interface.get_signing_serializer(app)  # type: ignore[attr-defined]
+    if not cookie or serializer is None:
+        return None
+    try:
+        session = serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        return int(session["_user_id"])
+    except Exception:
+        return None
+
+
+async def _missed_messages(session: AsyncSession, app: Flask, chat_id: int, last_message_id: int) -> dict[str, Any]:
+    """Messages after last_message_id, or a reload signal if the client is too far behind."""
+    try:
+        page = await ChatMessage.get_page_async(session, chat_id, _replay_limit(app), after_id=int(last_message_id))
+    except (TypeError, ValueError):
+        page = None
+    return _replay_payload(page)
+
+
+def init_async_socketio(sio: socketio.AsyncServer, app: Flask, session_factory: async_sessionmaker[AsyncSession]) -> socketio.AsyncServer:
+    """Register the Socket.IO event handlers of the ASGI entry point.
+
+    Same events and payloads as :func:`python_chat.routes.events.init_socketio`, with database
+    access awaited on an asyncio session instead of blocking the worker.
+    """
+    logger = app.logger
+    with app.app_context():
+        presence = get_presence()
+
+    async def reject(sid, rejection):
+        """Tell the socket why its event was refused and return the ack."""
+        if rejection.error is not None:
+            await sio.emit(rejection.event, rejection.error, to=sid)
+        return rejection.ack
+
+    def rate_limited(event):
+        """Reject the event with an error if the user exceeds its token bucket"""
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(sid, *args):
+                rejection = _rate_limit_rejection(presence.get(sid), event)
+                if rejection:
+                    return await reject(sid, rejection)
+                return await handler(sid, *args)
+
+            return wrapper
+
+        return decorator
+
+    @sio.on("connect")
+    async def handle_connect(sid, environ, auth=None):
+        """Handle client connection"""
+        user_id = session_user_id(app, environ)
+        user = None
+        if user_id is not None:
+            async with session_factory() as session:
+                user = await session.get(User, user_id)
+        if user is None:
+            logger.warning("Unauthenticated socket connection attempt rejected")
+            return False
+
+        username = user.username
+        first_socket = presence.add(sid, user.id, username)
+        # Personal room for notifications to every tab of the user, e.g. bans
+        await sio.enter_room(sid, user_room(user.id))
+
+        logger.info(f"User {username} connected with socket ID {sid}")
+        await sio.emit("set_username", {"username": username}, to=sid)
+
+        # Full snapshot for this socket only; everyone else gets a delta, and only for the user's first tab
+        await sio.emit("online_users", {"users": presence.online_usernames()}, to=sid)
+        if first_socket:
+            await sio.emit("presence_add", {"username": username}, skip_sid=sid)
+
+    @sio.on("disconnect")
+    async def handle_disconnect(sid, reason=None):
+        """Handle client disconnection"""
+        gone = _remove_socket(presence, sid, logger)
+        if gone:
+            await sio.emit("presence_remove", {"username": gone})
+
+    @sio.on("send_message")
+    @rate_limited("send_message")
+    async def handle_message(sid, data):
+        """Handle incoming chat message; the ack carries the stored message id"""
+        user = presence.get(sid)
+        if not user:
+            logger.warning(f"Message from unknown socket ID {sid}")
+            return {"status": "error", "message": "Not connected"}
+
+        parsed = _parse_send_message(user, data, logger)
+        if isinstance(parsed, Rejection):
+            return await reject(sid, parsed)
+        chat_id, message, client_msg_id = parsed
+
+        room_name = str(chat_id)
+        async with session_factory() as session:
+            try:
+                rejection = _send_rejection(await membership_cache.get_async(session, chat_id, user["user_id"]), user, chat_id, logger)
+                if rejection:
+                    return await reject(sid, rejection)
+            except Exception as e:
+                logger.error(f"Error checking ban status: {e}")
+
+            # Sending ends typing without waiting for the client's isTyping=false
+            typing_coalescer.set_typing(chat_id, user["username"], False)
+
+            try:
+                # Save the message to database, or find the copy stored by an earlier attempt
+                message_id, created = await ChatMessage.create_idempotent_async(session, user["user_id"], chat_id, message, client_msg_id)
+                await session.commit()
+                # The async session is not a RoutingSession; keep the sender's reads on the primary by hand
+                replica_router.record_write(user["user_id"])
+            except Exception as e:
+                logger.error(f"Error sending message: {e}")
+                await session.rollback()
+                await sio.emit("error", {"message": "Failed to send message"}, to=sid)
+                return {"status": "error", "message": "Failed to send message"}
+
+        if created:
+            await sio.emit("receive_message", _message_payload(user, message, message_id, client_msg_id), room=room_name)
+        else:
+            logger.info(f"Duplicate message {client_msg_id} from {user['username']} resolved to {message_id}")
+        return _message_ack(message_id, client_msg_id)
+
+    @sio.on("join")
+    @rate_limited("join")
+    async def handle_join(sid, data):
+        """Handle user joining a specific chat room"""
+        user = presence.get(sid)
+        if not user:
+            logger.warning(f"Join attempt from unknown socket ID {sid}")
+            return
+
+        chat_id = data.get("chat_id")
+        if not chat_id:
+            logger.warning(f"Join attempt without chat_id from {user['username']}")
+            return
+
+        async with session_factory() as session:
+            try:
+                rejection = _join_rejection(await membership_cache.get_async(session, chat_id, user["user_id"]), user, chat_id, logger)
+                if rejection:
+                    await reject(sid, rejection)
+                    return
+            except Exception as e:
+                logger.error(f"Error checking ban status: {e}")
+
+            presence.set_chat(sid, chat_id)
+            room_name = str(chat_id)
+            await sio.enter_room(sid, room_name)
+            logger.info(f"User {user['username']} joined chat {chat_id}, room: {room_name}")
+
+            joined = {"chat_id": chat_id, "status": "success"}
+            last_message_id = data.get("last_message_id")
+            if last_message_id:
+                # Reconnect: replay only what was missed; the room is already joined, so nothing sent meanwhile is lost
+                joined.update(await _missed_messages(session, app, chat_id, last_message_id))
+
+        await sio.emit("joined_chat", joined, to=sid)
+        await sio.emit("user_joined_chat", {"username": user["username"], "chat_id": chat_id}, room=room_name, skip_sid=sid)
+
+    @sio.on("leave")
+    async def handle_leave(sid, data):
+        """Handle user leaving a specific chat room"""
+        user = presence.get(sid)
+        if not user:
+            return
+
+        chat_id = data.get("chat_id") or user.get("chat_id")
+        if not chat_id:
+            return
+
+        await sio.leave_room(sid, str(chat_id))
+        _leave_chat(presence, sid, user, chat_id, logger)
+        await sio.emit("user_left_chat", {"username": user["username"], "chat_id": chat_id}, room=str(chat_id))
+
+    @sio.on("typing")
+    @rate_limited("typing")
+    async def handle_typing(sid, data):
+        """Handle typing status updates"""
+        user = presence.get(sid)
+        if not user:
+            return
+
+        _set_typing(user, data)
+
+    @sio.on("mark_read")
+    @rate_limited("mark_read")
+    async def handle_mark_read(sid, data):
+        """Move the user's read pointer in a chat forward; written in batches"""
+        user = presence.get(sid)
+        if not user or not isinstance(data, dict):
+            return
+
+        target = _mark_read_target(data)
+        if isinstance(target, Rejection):
+            return target.ack
+        chat_id, message_id = target
+
+        async with session_factory() as session:
+            status = await membership_cache.get_async(session, chat_id, user["user_id"])
+        return _mark_read(status, user, chat_id, message_id)
+
+    @sio.on("update_username")
+    async def handle_update_username(sid, data):
+        """Handle username update request"""
+        user = presence.get(sid)
+        if not user:
+            await sio.emit("username_error", {"error": "User not found"}, to=sid)
+            return
+
+        new_username = data.get("username")
+        rejection = _username_rejection(new_username)
+        if rejection:
+            await reject(sid, rejection)
+            return
+
+        for event, payload in _rename(presence, sid, user, new_username, logger):
+            await sio.emit(event, payload)
+
+    @sio.on("get_online_users")
+    @rate_limited("get_online_users")
+    async def handle_get_online_users(sid, data=None):
+        """Send list of online users"""
+        await sio.emit("online_users", {"users": presence.online_usernames()}, to=sid)
+
+    return sio
@@ -2,17 +2,67 @@ from typing import cast
 
 from flask import Blueprint, abort, current_app, jsonify, render_template, request
 from flask_login import current_user, login_required
+from markupsafe import escape
 from sqlalchemy import select
 from werkzeug.exceptions import HTTPException, NotFound
 
 from python_chat.database import db
 from python_chat.database.models.chat import Chat
-from python_chat.database.models.chat_member import ChatMember
-from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.models.chat_member import UNREAD_LIMIT, ChatMember
+from python_chat.database.models.chat_message import HIGHLIGHT_START, HIGHLIGHT_STOP, ChatMessage
 from python_chat.database.models.user import User
+from python_chat.database.replicas import replica_reads
+from python_chat.utils.membership_cache import membership_cache
+from python_chat.utils.presence import get_presence, user_room
 
 bp = Blueprint("chats", __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def format_message(message: ChatMessage, username: str | None) -> dict:
+    """Format a message for JSON responses."""
+    return {
+        "id": message.id,
+        "content": message.content,
+        "username": username if username else "[Deleted User]",
+        "timestamp": message.sent_at.isoformat(),
+    }
+
+
+def format_search_result(row) -> dict:
+    """Format a search hit for JSON responses; ``highlight`` is HTML with the matches in <mark>."""
+    highlight = str(escape(row.headline)).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+    return {
+        "id": row.id,
+        "chat_id": row.chat_id,
+        "username": row.username if row.username else "[Deleted User]",
+        "timestamp": row.sent_at.isoformat(),
+        "rank": row.rank,
+        "highlight": highlight,
+    }
+
+
+def _search_response(chat_ids):
+    """Run the search described by the ``q``, ``before`` and ``limit`` query params over ``chat_ids``."""
+    query = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    before = None
+    if cursor := request.args.get("before"):
+        # "<rank>:<id>" of the last result of the previous page
+        try:
+            rank, message_id = cursor.split(":")
+            before = (float(rank), int(message_id))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    if not query:
+        return jsonify({"results": [], "has_more": False, "next_cursor": None})
+
+    results, has_more = ChatMessage.search(query, chat_ids, limit, before=before)
+    next_cursor = f"{results[-1].rank!r}:{results[-1].id}" if has_more and results else None
+    return jsonify({"results": [format_search_result(row) for row in results], "has_more": has_more, "next_cursor": next_cursor})
+
 
 @bp.route("/chat/<int:chat_id>")
 @login_required
@@ -34,25 +84,35 @@ def chat_page(chat_id):
 
 @bp.route("/api/messages/<int:chat_id>")
 @login_required
+@replica_reads()
 def get_chat_messages(chat_id):
-    """Get previous messages for a chat"""
+    """Get one page of previous messages for a chat.
+
+    Query params: ``before_id`` (older page), ``after_id`` (newer page) and ``limit``.
+    Without a cursor the newest page is returned.
+    """
     try:
         db.get_or_404(Chat, chat_id)
-        # Используем left join чтобы включить сообщения удаленных пользователей
-        stmt = select(ChatMessage, User.username).outerjoin(User, ChatMessage.user_id == User.id).filter(ChatMessage.chat_id == chat_id).order_by(ChatMessage.sent_at)
-        messages = db.session.execute(stmt).all()
-        # Format messages for JSON response
-        formatted_messages = [
-            {
-                "id": msg.ChatMessage.id,
-                "content": msg.ChatMessage.content,
-                "username": msg.username if msg.username else "[Deleted User]",
-                "timestamp": msg.ChatMessage.sent_at.isoformat(),
-            }
-            for msg in messages
-        ]
 
-        return jsonify({"messages": formatted_messages})
+        before_id = request.args.get("before_id", type=int)
+        after_id = request.args.get("after_id", type=int)
+        limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+
+        if before_id is not None and after_id is not None:
+            return jsonify({"error": "Use either before_id or after_id, not both"}), 400
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        page = ChatMessage.get_page(chat_id, limit, before_id=before_id, after_id=after_id)
+        if page is None:
+            return jsonify({"error": "Unknown cursor"}), 400
+        messages, has_more = page
+
+        # Cursor for the next request in the same direction
+        next_cursor = None
+        if has_more and messages:
+            next_cursor = messages[-1].ChatMessage.id if after_id is not None else messages[0].ChatMessage.id
+
+        return jsonify({"messages": [format_message(msg.ChatMessage, msg.username) for msg in messages], "has_more": has_more, "next_cursor": next_cursor})
     except HTTPException as e:
         current_app.logger.error(f"HTTP error retrieving messages for chat {chat_id}: {e}")
         raise
@@ -61,8 +121,45 @@ def get_chat_messages(chat_id):
         abort(404)
 
 
+@bp.route("/api/chat/<int:chat_id>/search")
+@login_required
+@replica_reads()
+def search_chat_messages(chat_id):
+    """Full-text search in one chat.
+
+    Query params: ``q`` (words, "phrases", ``or``, ``-word``), ``before`` (``next_cursor`` of
+    the previous page) and ``limit``. Results are ordered by relevance.
+    """
+    try:
+        db.get_or_404(Chat, chat_id)
+        status = membership_cache.get(chat_id, current_user.id)
+        if not status.is_member or status.is_banned:
+            return jsonify({"error": "You are not a member of this chat"}), 403
+        return _search_response([chat_id])
+    except HTTPException as e:
+        current_app.logger.error(f"HTTP error searching chat {chat_id}: {e}")
+        raise
+    except Exception as e:
+        current_app.logger.error(f"Error searching chat {chat_id}: {e}")
+        return jsonify({"error": "Failed to search messages"}), 500
+
+
+@bp.route("/api/search")
+@login_required
+@replica_reads()
+def search_messages():
+    """Full-text search across the chats the user is a member of, with the params of :func:`search_chat_messages`."""
+    try:
+        chat_ids = select(ChatMember.chat_id).filter(ChatMember.user_id == current_user.id, ChatMember.is_banned == False)
+        return _search_response(chat_ids)
+    except Exception as e:
+        current_app.logger.error(f"Error searching messages: {e}")
+        return jsonify({"error": "Failed to search messages"}), 500
+
+
 @bp.route("/api/chat/<int:chat_id>/members")
 @login_required
+@replica_reads()
 def get_chat_members(chat_id):
     """Get all members of a chat"""
     try:
@@ -94,14 +191,17 @@ def get_chat_members(chat_id):
 
 @bp.route("/api/chats")
 @login_required
+@replica_reads()
 def get_user_chats():
     """Получить список чатов текущего пользователя"""
     try:
         # Получаем чаты, в которых пользователь является участником
         stmt = select(Chat).join(ChatMember).filter(ChatMember.user_id == current_user.id)
         chats = db.session.execute(stmt).scalars().all()
+        # Counted up to UNREAD_LIMIT
+        unread = ChatMember.unread_counts(current_user.id)
 
-        return jsonify({"chats": [{"id": chat.id, "name": chat.name, "is_group": chat.is_group} for chat in chats]})
+        return jsonify({"chats": [{"id": chat.id, "name": chat.name, "is_group": chat.is_group, "unread": unread.get(chat.id, 0)} for chat in chats], "unread_limit": UNREAD_LIMIT})
     except Exception as e:
         current_app.logger.error(f"Error retrieving user chats: {e}")
 
@@ -110,16 +210,19 @@ def get_user_chats():
 
 @bp.route("/api/search-users")
 @login_required
+@replica_reads()
 def search_users():
-    """Поиск пользователей по имени"""
+    """Поиск пользователей по имени
+
+    Query params: ``query`` and ``mode``, ``substring`` (default) or ``prefix`` for autocomplete.
+    """
     try:
         query = request.args.get("query", "")
         if not query or len(query) < 2:
             return jsonify({"users": []})
 
         # Поиск пользователей по имени (исключая текущего пользователя)
-        stmt = select(User).filter(User.username.ilike(f"%{query}%"), User.id != current_user.id).limit(10)
-        users = db.session.execute(stmt).scalars().all()
+        users = User.search(query, 10, exclude_id=current_user.id, prefix=request.args.get("mode") == "prefix")
 
         return jsonify({"users": [{"id": user.id, "username": user.username} for user in users]})
     except Exception as e:
@@ -162,6 +265,8 @@ def create_chat():
                 db.session.add(member)
 
         db.session.commit()
+        # A join attempt before the chat existed may have cached a negative entry
+        membership_cache.invalidate(new_chat.id)
 
         return jsonify({"success": True, "chat": {"id": new_chat.id, "name": new_chat.name, "is_group": new_chat.is_group}})
     except Exception as e:
@@ -216,25 +321,12 @@ def ban_chat_user(chat_id):
         # Ban the user
         chat.ban_member(target_user, reason)
 
-        # Получаем socket ID пользователя, чтобы принудительно удалить его из комнаты
         from python_chat.app import socketio
-        from python_chat.routes.events import users
-
-        # Найдем все активные соединения этого пользователя
-        user_socket_ids = [sid for sid, user_data in users.items() if user_data.get("user_id") == int(user_id)]
-
-        # Отправляем уведомление о бане на все соединения пользователя
-        for socket_id in user_socket_ids:
-            # Отправляем уведомление о бане
-            socketio.emit("banned_from_chat", {"chat_id": chat_id, "chat_name": chat.name}, room=socket_id)
-
-            # Принудительно исключаем пользователя из комнаты чата
-            room_name = str(chat_id)
-            socketio.server.leave_room(socket_id, room_name)
 
-            # Удалить чат из текущего чата пользователя
-            if users.get(socket_id) and users[socket_id].get("chat_id") == chat_id:
-                users[socket_id].pop("chat_id", None)
+        # Уведомление о бане уходит в личную комнату пользователя - на все его вкладки одним emit
+        socketio.emit("banned_from_chat", {"chat_id": chat_id, "chat_name": chat.name}, to=user_room(int(user_id)))
+        # Исключаем все соединения пользователя из комнаты чата, на каком бы воркере они ни были подключены
+        get_presence().kick(int(user_id), chat_id)
 
         # Отправляем уведомление всем в чате о бане пользователя
         room_name = str(chat_id)
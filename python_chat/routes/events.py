@@ -1,19 +1,227 @@
+import functools
+import logging
 import time
-from typing import Any
+import uuid
+from typing import Any, NamedTuple
 
-from flask import current_app, request
+from flask import Flask, current_app, request
 from flask_login import current_user
 from flask_socketio import emit, join_room, leave_room
 
 from python_chat.database import db
 from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.replicas import replica_reads, replica_router
+from python_chat.routes.chats import MAX_PAGE_SIZE, format_message
+from python_chat.utils.membership_cache import MemberStatus, membership_cache
+from python_chat.utils.message_writer import message_writer
+from python_chat.utils.presence import PresenceRegistry, get_presence, user_room
+from python_chat.utils.rate_limit import rate_limiter
+from python_chat.utils.read_state import read_marker
+from python_chat.utils.typing_state import typing_coalescer
 
-# Global dictionary to store connected users and their information
-users: dict[str, dict[str, Any]] = {}
+
+def _message_payload(user: dict[str, Any], message: str, message_id: int, client_msg_id: uuid.UUID | None = None) -> dict[str, Any]:
+    """Build the receive_message payload."""
+    return {
+        "username": user["username"],
+        "user_id": user["user_id"],
+        "message": message,
+        "timestamp": int(time.time() * 1000),
+        "message_id": message_id,  # Add message ID to help with deduplication
+        "client_msg_id": str(client_msg_id) if client_msg_id else None,
+    }
+
+
+def _message_ack(message_id: int, client_msg_id: uuid.UUID | None) -> dict[str, Any]:
+    """Build the send_message ack."""
+    return {"status": "ok", "message_id": message_id, "client_msg_id": str(client_msg_id) if client_msg_id else None}
+
+
+class Rejection(NamedTuple):
+    """A refused event: the ack, and the event telling the socket why, if any."""
+
+    ack: dict[str, Any] | None
+    error: dict[str, Any] | None = None
+    event: str = "error"
+
+
+class SendRequest(NamedTuple):
+    """A validated send_message event."""
+
+    chat_id: Any
+    message: str
+    client_msg_id: uuid.UUID | None
+
+
+# The validation and payloads below are shared with the ASGI handlers in python_chat.routes.async_events,
+# which differ only in how they reach the database and the sockets
+
+
+def _rate_limit_rejection(user: dict[str, Any] | None, event: str) -> Rejection | None:
+    """Refusal for a user over its token bucket for the event."""
+    if user is None or rate_limiter.allow(user["user_id"], event):
+        return None
+    return Rejection({"status": "error", "message": "Rate limit exceeded"}, {"message": "Too many requests, please slow down", "event": event})
+
+
+def _parse_send_message(user: dict[str, Any], data: dict[str, Any], logger: logging.Logger) -> SendRequest | Rejection:
+    """Chat, text and client_msg_id of a send_message event."""
+    chat_id = data.get("chat_id")
+    if not chat_id:
+        logger.error(f"No chat_id provided for message from {user['username']}")
+        return Rejection({"status": "error", "message": "No chat room selected"}, {"message": "No chat room selected"})
+
+    # Client-generated id, so retries of the same message are stored once
+    client_msg_id = None
+    if data.get("client_msg_id"):
+        try:
+            client_msg_id = uuid.UUID(str(data["client_msg_id"]))
+        except ValueError:
+            return Rejection({"status": "error", "message": "Invalid client_msg_id"}, {"message": "Invalid client_msg_id"})
+    return SendRequest(chat_id, data.get("message", ""), client_msg_id)
+
+
+def _send_rejection(status: MemberStatus, user: dict[str, Any], chat_id: Any, logger: logging.Logger) -> Rejection | None:
+    """Refusal for a sender banned from the chat."""
+    if not status.is_banned:
+        return None
+    logger.warning(f"Banned user {user['username']} attempted to send message to chat {chat_id}")
+    return Rejection({"status": "error", "message": "You are banned from this chat"}, {"message": "You are banned from this chat", "chat_id": chat_id})
+
+
+def _join_rejection(status: MemberStatus, user: dict[str, Any], chat_id: Any, logger: logging.Logger) -> Rejection | None:
+    """Refusal for a user banned from the chat or not in it; join has no ack."""
+    if status.is_banned:
+        logger.warning(f"Banned user {user['username']} attempted to join chat {chat_id}")
+        return Rejection(None, {"message": "You are banned from this chat", "chat_id": chat_id})
+    if not status.is_member:
+        logger.warning(f"Non-member {user['username']} attempted to join chat {chat_id}")
+        return Rejection(None, {"message": "You are not a member of this chat", "chat_id": chat_id})
+    return None
+
+
+def _replay_limit(app: Flask) -> int:
+    """Most messages replayed to a rejoining client before it is told to reload."""
+    return int(app.config.get("JOIN_REPLAY_LIMIT", MAX_PAGE_SIZE))
+
+
+def _replay_payload(page: tuple[list[Any], bool] | None) -> dict[str, Any]:
+    """joined_chat fields for the messages after the client's last one, or a reload signal if it is too far behind."""
+    if page is None or page[1]:
+        return {"missed_messages": [], "reload": True}
+    return {"missed_messages": [format_message(message, username) for message, username in page[0]], "reload": False}
+
+
+def _mark_read_target(data: dict[str, Any]) -> tuple[int, int] | Rejection:
+    """Chat and message id of a mark_read event."""
+    chat_id = data.get("chat_id")
+    message_id = data.get("message_id")
+    if not isinstance(chat_id, int) or not isinstance(message_id, int) or message_id <= 0:
+        return Rejection({"status": "error", "message": "chat_id and message_id are required"})
+    return chat_id, message_id
+
+
+def _mark_read(status: MemberStatus, user: dict[str, Any], chat_id: int, message_id: int) -> dict[str, Any]:
+    """Queue the read pointer of a member for the next batch and build the ack."""
+    if not status.is_member:
+        return {"status": "error", "message": "You are not a member of this chat"}
+    read_marker.mark_read(user["user_id"], chat_id, message_id)
+    return {"status": "ok"}
+
+
+def _set_typing(user: dict[str, Any], data: dict[str, Any]) -> None:
+    """Record a typing update for the user's current chat."""
+    chat_id = user.get("chat_id")
+    if chat_id:
+        # Coalesced into a periodic typing_state digest per room instead of a frame per event
+        typing_coalescer.set_typing(chat_id, user["username"], bool(data.get("isTyping", False)))
+
+
+def _leave_chat(presence: PresenceRegistry, sid: str, user: dict[str, Any], chat_id: Any, logger: logging.Logger) -> None:
+    """Forget the socket's current chat; the caller leaves the room."""
+    presence.set_chat(sid, None)
+    typing_coalescer.set_typing(chat_id, user["username"], False)
+    logger.info(f"User {user['username']} left chat {chat_id}")
+
+
+def _remove_socket(presence: PresenceRegistry, sid: str, logger: logging.Logger) -> str | None:
+    """Forget a disconnected socket; the username to broadcast presence_remove for if it was the user's last tab."""
+    user, last_socket = presence.remove(sid)
+    if not user:
+        return None
+    if user.get("chat_id"):
+        typing_coalescer.set_typing(user["chat_id"], user["username"], False)
+    logger.info(f"User {user['username']} disconnected from socket ID {sid}")
+    return user["username"] if last_socket else None
+
+
+def _username_rejection(new_username: Any) -> Rejection | None:
+    """Refusal for a username that is too short; update_username has no ack."""
+    if not new_username or len(new_username) < 3:
+        return Rejection(None, {"error": "Username must be at least 3 characters"}, "username_error")
+    return None
+
+
+def _rename(presence: PresenceRegistry, sid: str, user: dict[str, Any], new_username: str, logger: logging.Logger) -> list[tuple[str, dict[str, Any]]]:
+    """Rename the user of a socket; the events to broadcast about it."""
+    old_username = user["username"]
+    logger.info(f"Username update requested: {old_username} → {new_username}")
+    old_gone, new_added = presence.set_username(sid, new_username)
+    logger.info(f"Username updated successfully: {old_username} → {new_username}")
+
+    broadcasts = [("username_updated", {"old_username": old_username, "new_username": new_username})]
+    if old_gone:
+        broadcasts.append(("presence_remove", {"username": old_username}))
+    if new_added:
+        broadcasts.append(("presence_add", {"username": new_username}))
+    return broadcasts
+
+
+def _reject(rejection: Rejection) -> dict[str, Any] | None:
+    """Tell the socket why its event was refused and return the ack."""
+    if rejection.error is not None:
+        emit(rejection.event, rejection.error)
+    return rejection.ack
+
+
+def _missed_messages(chat_id: int, last_message_id: int) -> dict[str, Any]:
+    """Messages after last_message_id, or a reload signal if the client is too far behind."""
+    try:
+        with replica_reads():
+            page = ChatMessage.get_page(chat_id, _replay_limit(current_app), after_id=int(last_message_id))
+    except (TypeError, ValueError):
+        page = None
+    return _replay_payload(page)
 
 
 def init_socketio(socketio):
     """Initialize Socket.IO event handlers"""
+    # Connected sockets and their users, in this process or across workers depending on the backend
+    presence = get_presence()
+
+    def handle_kick(sid, chat_id):
+        """Remove a local socket from a chat room, e.g. after a ban"""
+        socketio.server.leave_room(sid, str(chat_id))
+        session = presence.get(sid)
+        if session and session.get("chat_id") == chat_id:
+            presence.set_chat(sid, None)
+
+    presence.on_kick(handle_kick)
+
+    def rate_limited(event):
+        """Reject the event with an error if the user exceeds its token bucket"""
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args):
+                rejection = _rate_limit_rejection(presence.get(request.sid), event)
+                if rejection:
+                    return _reject(rejection)
+                return handler(*args)
+
+            return wrapper
+
+        return decorator
 
     @socketio.on("connect")
     def handle_connect():
@@ -24,98 +232,105 @@ def init_socketio(socketio):
             return False
 
         username = current_user.username
-        users[request.sid] = {"username": username, "user_id": current_user.id}
+        first_socket = presence.add(request.sid, current_user.id, username)
+        # Personal room for notifications to every tab of the user, e.g. bans
+        join_room(user_room(current_user.id))
 
         current_app.logger.info(f"User {username} connected with socket ID {request.sid}")
-        emit("user_joined", {"username": username}, broadcast=True)
         emit("set_username", {"username": username})
 
-        # Send current online users count
-        emit("online_users", {"users": list({user["username"] for user in users.values()})}, broadcast=True)
+        # Full snapshot for this socket only; everyone else gets a delta, and only for the user's first tab
+        emit("online_users", {"users": presence.online_usernames()})
+        if first_socket:
+            emit("presence_add", {"username": username}, broadcast=True, include_self=False)
 
     @socketio.on("disconnect")
     def handle_disconnect():
         """Handle client disconnection"""
-        user = users.pop(request.sid, None)
-        if user:
-            current_app.logger.info(f"User {user['username']} disconnected from socket ID {request.sid}")
-            emit("user_left", {"username": user["username"]}, broadcast=True)
-            # Update online users count
-            emit("online_users", {"users": list({user["username"] for user in users.values()})}, broadcast=True)
+        gone = _remove_socket(presence, request.sid, current_app.logger)
+        if gone:
+            emit("presence_remove", {"username": gone}, broadcast=True)
 
     @socketio.on("send_message")
+    @rate_limited("send_message")
     def handle_message(data):
-        """Handle incoming chat message"""
-        user = users.get(request.sid)
+        """Handle incoming chat message; the ack carries the stored message id"""
+        user = presence.get(request.sid)
         if not user:
             current_app.logger.warning(f"Message from unknown socket ID {request.sid}")
-            return
-
-        chat_id = data.get("chat_id")
-        if not chat_id:
-            current_app.logger.error(f"No chat_id provided for message from {user['username']}")
-            emit("error", {"message": "No chat room selected"})
-            return
+            return {"status": "error", "message": "Not connected"}
 
-        message = data.get("message", "")
+        parsed = _parse_send_message(user, data, current_app.logger)
+        if isinstance(parsed, Rejection):
+            return _reject(parsed)
+        chat_id, message, client_msg_id = parsed
 
         # For debug - log what room the user is in
-        user_room = users[request.sid].get("chat_id")
-        current_app.logger.debug(f"Message in chat {chat_id} from {user['username']} (currently in room {user_room}): {message[:20]}...")
+        current_room = user.get("chat_id")
+        current_app.logger.debug(f"Message in chat {chat_id} from {user['username']} (currently in room {current_room}): {message[:20]}...")
 
         # Проверка, не забанен ли пользователь в чате
         try:
-            from sqlalchemy import select
-
-            from python_chat.database.models.chat_member import ChatMember
-
-            # Проверяем, забанен ли пользователь
-            banned_check = db.session.execute(select(ChatMember).filter(ChatMember.chat_id == chat_id, ChatMember.user_id == user["user_id"], ChatMember.is_banned)).scalar_one_or_none()
-
-            if banned_check:
-                current_app.logger.warning(f"Banned user {user['username']} attempted to send message to chat {chat_id}")
-                emit("error", {"message": "You are banned from this chat", "chat_id": chat_id})
-                return
+            rejection = _send_rejection(membership_cache.get(chat_id, user["user_id"]), user, chat_id, current_app.logger)
+            if rejection:
+                return _reject(rejection)
         except Exception as e:
             current_app.logger.error(f"Error checking ban status: {e}")
 
+        # Convert chat_id to string for room name consistency
+        room_name = str(chat_id)
+        # Sending ends typing without waiting for the client's isTyping=false
+        typing_coalescer.set_typing(chat_id, user["username"], False)
+
+        if message_writer.enabled:
+            sid = request.sid
+            saved = socketio.server.eio.create_event()
+            result = {}
+
+            def on_saved(message_id, created):
+                result["message_id"] = message_id
+                if created:
+                    # Committed by the writer thread, outside this user's request
+                    replica_router.record_write(user["user_id"])
+                    socketio.emit("receive_message", _message_payload(user, message, message_id, client_msg_id), room=room_name)
+                else:
+                    current_app.logger.info(f"Duplicate message {client_msg_id} from {user['username']} resolved to {message_id}")
+                saved.set()
+
+            def on_error(e):
+                socketio.emit("error", {"message": "Failed to send message"}, to=sid)
+                saved.set()
+
+            # The batch writer broadcasts once the message has its id; only this handler waits for the ack
+            message_writer.submit(user["user_id"], chat_id, message, on_saved, on_error, client_msg_id)
+            if not saved.wait(message_writer.ack_timeout) or "message_id" not in result:
+                return {"status": "error", "message": "Failed to send message"}
+            return _message_ack(result["message_id"], client_msg_id)
+
         try:
-            # Save the message to database
-            message_obj = ChatMessage(
-                user_id=user["user_id"],
-                chat_id=chat_id,
-                content=message,
-            )
-            db.session.add(message_obj)
+            # Save the message to database, or find the copy stored by an earlier attempt
+            message_id, created = ChatMessage.create_idempotent(user["user_id"], chat_id, message, client_msg_id)
             db.session.commit()
 
-            # Convert chat_id to string for room name consistency
-            room_name = str(chat_id)
-
-            # Broadcast to the right room
-            current_app.logger.debug(f"Emitting message to room {room_name}")
-            emit(
-                "receive_message",
-                {
-                    "username": user["username"],
-                    "user_id": user["user_id"],
-                    "message": message,
-                    "timestamp": int(time.time() * 1000),
-                    "message_id": message_obj.id,  # Add message ID to help with deduplication
-                },
-                room=room_name,
-                broadcast=True,
-            )
-            current_app.logger.debug(f"Message broadcast completed to room {room_name}")
+            if created:
+                # Broadcast to the right room
+                current_app.logger.debug(f"Emitting message to room {room_name}")
+                emit("receive_message", _message_payload(user, message, message_id, client_msg_id), room=room_name, broadcast=True)
+                current_app.logger.debug(f"Message broadcast completed to room {room_name}")
+            else:
+                current_app.logger.info(f"Duplicate message {client_msg_id} from {user['username']} resolved to {message_id}")
+            return _message_ack(message_id, client_msg_id)
         except Exception as e:
             current_app.logger.error(f"Error sending message: {e}")
             db.session.rollback()
             emit("error", {"message": "Failed to send message"})
+            return {"status": "error", "message": "Failed to send message"}
 
     @socketio.on("join")
+    @rate_limited("join")
     def handle_join(data):
         """Handle user joining a specific chat room"""
-        user = users.get(request.sid)
+        user = presence.get(request.sid)
         if not user:
             current_app.logger.warning(f"Join attempt from unknown socket ID {request.sid}")
             return
@@ -127,30 +342,15 @@ def init_socketio(socketio):
 
         # Check if user is banned from this chat
         try:
-            from sqlalchemy import select
-
-            from python_chat.database.models.chat_member import ChatMember
-
-            # Check if the user exists in the chat member list and is banned
-            banned_check = db.session.execute(select(ChatMember).filter(ChatMember.chat_id == chat_id, ChatMember.user_id == user["user_id"], ChatMember.is_banned)).scalar_one_or_none()
-
-            if banned_check:
-                current_app.logger.warning(f"Banned user {user['username']} attempted to join chat {chat_id}")
-                emit("error", {"message": "You are banned from this chat", "chat_id": chat_id})
-                return
-
-            # Check if the user is a member of this chat
-            member_check = db.session.execute(select(ChatMember).filter(ChatMember.chat_id == chat_id, ChatMember.user_id == user["user_id"])).scalar_one_or_none()
-
-            if not member_check:
-                current_app.logger.warning(f"Non-member {user['username']} attempted to join chat {chat_id}")
-                emit("error", {"message": "You are not a member of this chat", "chat_id": chat_id})
+            rejection = _join_rejection(membership_cache.get(chat_id, user["user_id"]), user, chat_id, current_app.logger)
+            if rejection:
+                _reject(rejection)
                 return
         except Exception as e:
             current_app.logger.error(f"Error checking ban status: {e}")
 
         # Store chat ID in user data
-        users[request.sid]["chat_id"] = chat_id
+        presence.set_chat(request.sid, chat_id)
 
         # Convert chat_id to string for room name
         room_name = str(chat_id)
@@ -161,7 +361,13 @@ def init_socketio(socketio):
         current_app.logger.info(f"User {user['username']} joined chat {chat_id}, room: {room_name}")
 
         # Confirm joining to the client
-        emit("joined_chat", {"chat_id": chat_id, "status": "success"})
+        joined: dict[str, Any] = {"chat_id": chat_id, "status": "success"}
+        last_message_id = data.get("last_message_id")
+        if last_message_id:
+            # Reconnect: replay only what was missed. The room is already joined, so nothing
+            # sent meanwhile is lost; duplicates are dropped by message id on the client
+            joined.update(_missed_messages(chat_id, last_message_id))
+        emit("joined_chat", joined)
 
         # Notify others in the room
         emit("user_joined_chat", {"username": user["username"], "chat_id": chat_id}, room=room_name, include_self=False)
@@ -169,7 +375,7 @@ def init_socketio(socketio):
     @socketio.on("leave")
     def handle_leave(data):
         """Handle user leaving a specific chat room"""
-        user = users.get(request.sid)
+        user = presence.get(request.sid)
         if not user:
             return
 
@@ -179,63 +385,57 @@ def init_socketio(socketio):
 
         # Leave the room
         leave_room(chat_id)
-
-        # Remove chat_id from user data
-        if "chat_id" in users[request.sid]:
-            del users[request.sid]["chat_id"]
-
-        current_app.logger.info(f"User {user['username']} left chat {chat_id}")
+        _leave_chat(presence, request.sid, user, chat_id, current_app.logger)
 
         # Notify others in the room
         emit("user_left_chat", {"username": user["username"], "chat_id": chat_id}, room=chat_id, broadcast=True)
 
     @socketio.on("typing")
+    @rate_limited("typing")
     def handle_typing(data):
         """Handle typing status updates"""
-        user = users.get(request.sid)
+        user = presence.get(request.sid)
         if not user:
             return
 
-        chat_id = user.get("chat_id")
-        is_typing = data.get("isTyping", False)
+        _set_typing(user, data)
+
+    @socketio.on("mark_read")
+    @rate_limited("mark_read")
+    def handle_mark_read(data):
+        """Move the user's read pointer in a chat forward; written in batches"""
+        user = presence.get(request.sid)
+        if not user or not isinstance(data, dict):
+            return
 
-        if chat_id:
-            emit(
-                "typing",
-                {"username": user["username"], "isTyping": is_typing},
-                room=chat_id,
-                broadcast=True,
-                include_self=False,
-            )
+        target = _mark_read_target(data)
+        if isinstance(target, Rejection):
+            return target.ack
+        chat_id, message_id = target
+        return _mark_read(membership_cache.get(chat_id, user["user_id"]), user, chat_id, message_id)
 
     @socketio.on("update_username")
     def handle_update_username(data):
         """Handle username update request"""
-        if request.sid not in users:
+        user = presence.get(request.sid)
+        if not user:
             emit("username_error", {"error": "User not found"})
             return
 
-        old_username = users[request.sid]["username"]
         new_username = data.get("username")
-
-        if not new_username or len(new_username) < 3:
-            emit("username_error", {"error": "Username must be at least 3 characters"})
+        rejection = _username_rejection(new_username)
+        if rejection:
+            _reject(rejection)
             return
 
-        current_app.logger.info(f"Username update requested: {old_username} → {new_username}")
-
-        # Update username in all rooms this user is in
-        users[request.sid]["username"] = new_username
-
-        current_app.logger.info(f"Username updated successfully: {old_username} → {new_username}")
-
-        # Notify all users about the username change
-        emit("username_updated", {"old_username": old_username, "new_username": new_username}, broadcast=True)
+        # Update username in all rooms this user is in, then notify all users about the change
+        for event, payload in _rename(presence, request.sid, user, new_username, current_app.logger):
+            emit(event, payload, broadcast=True)
 
     @socketio.on("get_online_users")
+    @rate_limited("get_online_users")
     def handle_get_online_users():
         """Send list of online users"""
-        unique_users = list({user["username"] for user in users.values()})
-        emit("online_users", {"users": unique_users})
+        emit("online_users", {"users": presence.online_usernames()})
 
     return socketio
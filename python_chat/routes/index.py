@@ -3,7 +3,8 @@ from flask_login import current_user
 
 from python_chat.database import db
 from python_chat.database.models.chat import Chat
-from python_chat.database.models.chat_member import ChatMember
+from python_chat.database.models.chat_member import UNREAD_LIMIT, ChatMember
+from python_chat.database.replicas import replica_reads
 
 bp = Blueprint("index", __name__)
 
@@ -12,12 +13,13 @@ bp = Blueprint("index", __name__)
 
 
 @bp.route("/")
+@replica_reads()
 def index():
     logger = current_app.logger
     logger.info(f"Index route accessed. Authenticated: {current_user.is_authenticated}")
     if current_user.is_authenticated:
         user_chats = db.session.query(Chat).join(ChatMember).filter(ChatMember.user_id == current_user.id).all()
         logger.debug(f"User {current_user.username} chats is {user_chats}")
-        return render_template("index.html", chats=user_chats)
+        return render_template("index.html", chats=user_chats, unread=ChatMember.unread_counts(current_user.id), unread_limit=UNREAD_LIMIT)
 
     return redirect(url_for("auth.login"))
@@ -1,10 +1,8 @@
-from flask import Blueprint, current_app, render_template
+from flask import Blueprint, render_template
 from flask_login import current_user, login_required
-from sqlalchemy import func, select
 
 from python_chat.database import db
-from python_chat.database.models.chat_member import ChatMember
-from python_chat.database.models.chat_message import ChatMessage
+from python_chat.database.models.row_counter import RowCounter
 
 bp = Blueprint("profile", __name__)
 
@@ -14,15 +12,7 @@ bp = Blueprint("profile", __name__)
 @login_required
 def profile():
     """Личный кабинет пользователя"""
-    # Получаем статистику пользователя
-    chats_count_stmt = select(func.count(ChatMember.user_id)).filter(ChatMember.user_id == current_user.id)
-    messages_count_stmt = select(func.count(ChatMessage.user_id)).filter(ChatMessage.user_id == current_user.id)
-
-    current_app.logger.debug(f"Query for chats count: {chats_count_stmt}")
-    current_app.logger.debug(f"Query for messages count: {messages_count_stmt}")
-
-    user_stats = {
-        "chats_count": db.session.execute(chats_count_stmt).scalar_one(),
-        "messages_count": db.session.execute(messages_count_stmt).scalar_one(),
-    }
+    # Статистика пользователя из поддерживаемых триггерами счётчиков
+    counters = RowCounter.get(db.session, ("user_chats", current_user.id), ("user_messages", current_user.id))
+    user_stats = {"chats_count": counters["user_chats", current_user.id], "messages_count": counters["user_messages", current_user.id]}
     return render_template("profile.html", user=current_user, stats=user_stats)
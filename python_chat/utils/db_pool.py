@@ -0,0 +1,76 @@
+from collections.abc import Mapping
+from typing import Any
+from uuid import uuid4
+
+from flask import Flask
+
+# Engine options of each DB_POOL_PROFILE; options set explicitly in SQLALCHEMY_ENGINE_OPTIONS win
+POOL_PROFILES: dict[str, dict[str, Any]] = {
+    # Connections straight to Postgres: SQLAlchemy's defaults
+    "default": {},
+    # Transaction pooling behind pgbouncer. A server connection is only ours for one transaction,
+    # so nothing may outlive it: no prepared statements, SET, LISTEN or session advisory locks.
+    # pgbouncer drops idle clients, so connections are tested before use and recycled early.
+    "pgbouncer": {"pool_pre_ping": True, "pool_recycle": 300},
+}
+
+# Environment variable -> engine option and parser
+ENGINE_OPTION_VARIABLES: dict[str, tuple[str, Any]] = {
+    "DB_POOL_SIZE": ("pool_size", int),
+    "DB_MAX_OVERFLOW": ("max_overflow", int),
+    "DB_POOL_TIMEOUT": ("pool_timeout", float),
+    "DB_POOL_RECYCLE": ("pool_recycle", int),
+    "DB_POOL_PRE_PING": ("pool_pre_ping", lambda value: value == "1"),
+    "DB_POOL_USE_LIFO": ("pool_use_lifo", lambda value: value == "1"),
+}
+
+# Pool options the asyncpg engine of the ASGI entry point takes over from the psycopg2 one
+_ASYNC_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping", "pool_use_lifo")
+
+
+def engine_options_from_env(environ: Mapping[str, str]) -> dict[str, Any]:
+    """SQLALCHEMY_ENGINE_OPTIONS given by the DB_POOL_* variables that are set."""
+    return {option: parse(environ[name]) for name, (option, parse) in ENGINE_OPTION_VARIABLES.items() if environ.get(name)}
+
+
+def init_db_pool(app: Flask) -> dict[str, Any]:
+    """Resolve SQLALCHEMY_ENGINE_OPTIONS from DB_POOL_PROFILE, explicit options and DB_STATEMENT_TIMEOUT_MS.
+
+    Behind pgbouncer the LISTEN connections of the Postgres message queue and presence
+    backends need SQLALCHEMY_DIRECT_DATABASE_URI. Call before ``db.init_app``, which
+    creates the engine. Returns the options.
+    """
+    profile = app.config.get("DB_POOL_PROFILE") or "default"
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE: {profile}")
+    options = {**POOL_PROFILES[profile], **(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})}
+    listens = app.config.get("SOCKETIO_MESSAGE_QUEUE") == "postgres" or app.config.get("PRESENCE_BACKEND") == "postgres"
+    if profile == "pgbouncer" and listens and not app.config.get("SQLALCHEMY_DIRECT_DATABASE_URI"):
+        raise ValueError("LISTEN does not work through transaction pooling: set SQLALCHEMY_DIRECT_DATABASE_URI to a direct connection")
+
+    statement_timeout = app.config.get("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout:
+        if profile == "pgbouncer":
+            # pgbouncer refuses the startup option; it belongs on the role: ALTER ROLE ... SET statement_timeout
+            raise ValueError("DB_STATEMENT_TIMEOUT_MS is not supported with DB_POOL_PROFILE=pgbouncer")
+        connect_args = dict(options.get("connect_args") or {})
+        connect_args["options"] = f"{connect_args.get('options', '')} -c statement_timeout={int(statement_timeout)}".strip()
+        options["connect_args"] = connect_args
+
+    app.config["DB_POOL_PROFILE"] = profile
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    return options
+
+
+def async_engine_options(app: Flask) -> dict[str, Any]:
+    """Options for an asyncpg engine matching the app's psycopg2 engine."""
+    options = {name: value for name, value in app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}).items() if name in _ASYNC_POOL_OPTIONS}
+    connect_args: dict[str, Any] = {}
+    if app.config.get("DB_STATEMENT_TIMEOUT_MS"):
+        connect_args["server_settings"] = {"statement_timeout": str(int(app.config["DB_STATEMENT_TIMEOUT_MS"]))}
+    if app.config.get("DB_POOL_PROFILE") == "pgbouncer":
+        # asyncpg prepares every statement; unique names and no caches keep them within one transaction
+        connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0, prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__")
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
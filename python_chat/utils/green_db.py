@@ -0,0 +1,68 @@
+from flask import Flask
+from psycopg2 import OperationalError, extensions
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util.queue import Queue
+
+
+def eventlet_wait_callback(conn, timeout=None) -> None:
+    """Wait for psycopg2 I/O through the eventlet hub instead of blocking the whole process."""
+    from eventlet.hubs import trampoline
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise OperationalError(f"Bad result from poll: {state}")
+
+
+class GreenQueue(Queue):
+    """SQLAlchemy's pool queue with eventlet locks, so waiting for a free connection yields to other green threads."""
+
+    def __init__(self, maxsize: int = 0, use_lifo: bool = False) -> None:
+        from eventlet.green import threading as green_threading
+
+        super().__init__(maxsize, use_lifo)
+        self.mutex = green_threading.RLock()  # type: ignore[attr-defined]
+        self.not_empty = green_threading.Condition(self.mutex)  # type: ignore[attr-defined]
+        self.not_full = green_threading.Condition(self.mutex)  # type: ignore[attr-defined]
+
+
+class GreenQueuePool(QueuePool):
+    """QueuePool whose checkout waits cooperatively under eventlet."""
+
+    _queue_class = GreenQueue
+
+
+def make_psycopg2_green() -> None:
+    """Make every psycopg2 connection of the process cooperative under eventlet."""
+    extensions.set_wait_callback(eventlet_wait_callback)
+
+
+def make_psycopg2_blocking() -> None:
+    """Undo :func:`make_psycopg2_green`."""
+    extensions.set_wait_callback(None)
+
+
+def init_green_db(app: Flask, socketio) -> bool:
+    """Make database waits yield to other connections when Socket.IO runs on eventlet.
+
+    Without it every query blocks the eventlet hub, and so every other socket of the worker,
+    until Postgres answers. Monkey patching does not help, psycopg2 does its I/O in C.
+    Once queries yield, more green threads hold connections at once, so waiting for a free
+    one must yield too: the engine gets :class:`GreenQueuePool` unless a pool class is
+    configured. Call before ``db.init_app``. Set ``DB_GREEN`` to False to keep blocking
+    calls. Returns whether green mode is on.
+    """
+    if not app.config.get("DB_GREEN", True) or socketio.async_mode != "eventlet":
+        return False
+    make_psycopg2_green()
+    engine_options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    engine_options.setdefault("poolclass", GreenQueuePool)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
+    app.logger.debug("psycopg2 waits on the eventlet hub")
+    return True
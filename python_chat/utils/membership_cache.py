@@ -0,0 +1,93 @@
+import time
+from typing import NamedTuple
+
+from flask import Flask
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from python_chat.database import db
+from python_chat.database.models.chat_member import ChatMember
+
+
+class MemberStatus(NamedTuple):
+    """Membership state of a user in a chat."""
+
+    is_member: bool
+    is_banned: bool
+
+
+NOT_A_MEMBER = MemberStatus(is_member=False, is_banned=False)
+
+
+class MembershipCache:
+    """Per-process cache of chat membership and ban status keyed by (chat_id, user_id).
+
+    Entries expire after ``ttl`` seconds. Code that changes memberships or bans must call
+    :meth:`invalidate` after committing; the TTL bounds staleness for changes made by
+    other processes.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 100_000) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[tuple[int, int], tuple[MemberStatus, float]] = {}
+
+    def init_app(self, app: Flask) -> None:
+        """Read the cache settings from the app config."""
+        self.ttl = app.config.get("MEMBERSHIP_CACHE_TTL", self.ttl)
+        self.max_entries = app.config.get("MEMBERSHIP_CACHE_MAX_ENTRIES", self.max_entries)
+        self.clear()
+
+    def get(self, chat_id: int, user_id: int) -> MemberStatus:
+        """Return the membership status, loading it from the database on a miss."""
+        key = (int(chat_id), int(user_id))
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        is_banned = db.session.execute(self._status_stmt(key)).scalar_one_or_none()
+        return self._load(key, is_banned, now)
+
+    async def get_async(self, session: AsyncSession, chat_id: int, user_id: int) -> MemberStatus:
+        """Same as :meth:`get`, loading misses through an asyncio session."""
+        key = (int(chat_id), int(user_id))
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        is_banned = (await session.execute(self._status_stmt(key))).scalar_one_or_none()
+        return self._load(key, is_banned, now)
+
+    @staticmethod
+    def _status_stmt(key: tuple[int, int]) -> Select:
+        return select(ChatMember.is_banned).filter(ChatMember.chat_id == key[0], ChatMember.user_id == key[1])
+
+    def _load(self, key: tuple[int, int], is_banned: bool | None, now: float) -> MemberStatus:
+        status = NOT_A_MEMBER if is_banned is None else MemberStatus(is_member=True, is_banned=bool(is_banned))
+        self._store(key, status, now)
+        return status
+
+    def _store(self, key: tuple[int, int], status: MemberStatus, now: float) -> None:
+        if len(self._entries) >= self.max_entries:
+            self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+        self._entries[key] = (status, now + self.ttl)
+
+    def invalidate(self, chat_id: int, user_id: int | None = None) -> None:
+        """Drop the entry of one member, or of every member of the chat if user_id is None."""
+        if user_id is not None:
+            self._entries.pop((int(chat_id), int(user_id)), None)
+            return
+        chat_id = int(chat_id)
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+
+
+membership_cache = MembershipCache()
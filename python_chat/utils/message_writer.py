@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from datetime import UTC, datetime
+from typing import Any, NamedTuple
+
+from flask import Flask
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from python_chat.database import db
+from python_chat.database.models.chat_message import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class PendingMessage(NamedTuple):
+    """A message waiting to be written by the batch writer."""
+
+    user_id: int
+    chat_id: int
+    content: str
+    sent_at: datetime
+    on_saved: Callable[[int, bool], None]
+    on_error: Callable[[Exception], None]
+    client_msg_id: uuid.UUID | None = None
+
+
+class BatchMessageWriter:
+    """Group-commit writer for chat messages.
+
+    Messages submitted from any connection are collected for up to ``max_delay`` seconds
+    or ``max_batch_size`` messages and written with one multi-row INSERT ... RETURNING in a
+    single transaction. ``on_saved`` is then called with the message id for each one, in
+    submission order, and whether this batch created it. A message whose client id the user
+    already sent is not inserted again; ``on_saved`` gets the id of the stored one and False.
+    Disabled unless ``MESSAGE_BATCH_ENABLED`` is set.
+    """
+
+    def __init__(self, max_batch_size: int = 100, max_delay: float = 0.005, ack_timeout: float = 10.0) -> None:
+        self.enabled = False
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        # How long a send_message handler waits for its batch before acking an error
+        self.ack_timeout = ack_timeout
+        self.app: Flask | None = None
+        self._socketio: Any = None
+        self._queue: Any = None
+        self._empty: type[Exception] = Exception
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Read the writer settings and bind to the app and its Socket.IO async mode."""
+        self.enabled = app.config.get("MESSAGE_BATCH_ENABLED", False)
+        self.max_batch_size = app.config.get("MESSAGE_BATCH_MAX_SIZE", self.max_batch_size)
+        self.max_delay = app.config.get("MESSAGE_BATCH_MAX_DELAY_MS", self.max_delay * 1000) / 1000
+        self.ack_timeout = app.config.get("MESSAGE_BATCH_ACK_TIMEOUT", self.ack_timeout)
+        self.app = app
+        self._socketio = socketio
+        self._started = False
+
+    def submit(
+        self,
+        user_id: int,
+        chat_id: int,
+        content: str,
+        on_saved: Callable[[int, bool], None],
+        on_error: Callable[[Exception], None],
+        client_msg_id: uuid.UUID | None = None,
+    ) -> None:
+        """Queue a message; the callbacks run on the writer task once its batch is written."""
+        if not self._started:
+            # Handlers sending the first messages at once must not each start a writer with its own queue
+            with self._start_lock:
+                if not self._started:
+                    # Queue primitives must match the async mode (eventlet, threading, ...) of the server
+                    eio = self._socketio.server.eio
+                    self._queue = eio.create_queue()
+                    self._empty = eio.get_queue_empty_exception()
+                    self._socketio.start_background_task(self._run)
+                    self._started = True
+        self._queue.put(PendingMessage(user_id, int(chat_id), content, datetime.now(UTC), on_saved, on_error, client_msg_id))
+
+    def _run(self) -> None:
+        while True:
+            batch: list[PendingMessage] = []
+            try:
+                batch.append(self._queue.get())
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except self._empty:
+                        break
+
+                assert self.app is not None
+                with self.app.app_context():
+                    self.write_batch(batch)
+            except Exception as e:
+                # The writer must outlive any failure, or every later send waits for its ack timeout
+                logger.exception(f"Message writer failed on a batch of {len(batch)} messages")
+                for message in batch:
+                    try:
+                        message.on_error(e)
+                    except Exception:
+                        logger.exception("Error in error callback of a batched message")
+
+    def write_batch(self, batch: list[PendingMessage]) -> None:
+        """Write a batch in one transaction and run its callbacks. Needs an app context."""
+        try:
+            # Ids of retried messages, looked up with one query on the (user_id, client_msg_id) index
+            keys: set[tuple[int, uuid.UUID | None]] = {(m.user_id, m.client_msg_id) for m in batch if m.client_msg_id is not None}
+            known = self._stored_ids(keys) if keys else {}
+
+            plain: list[PendingMessage] = []
+            keyed: dict[tuple[int, uuid.UUID | None], PendingMessage] = {}
+            for m in batch:
+                if m.client_msg_id is None:
+                    plain.append(m)
+                elif (m.user_id, m.client_msg_id) not in known:
+                    keyed.setdefault((m.user_id, m.client_msg_id), m)
+
+            plain_ids: list[int] = []
+            if plain:
+                plain_stmt = insert(ChatMessage).returning(ChatMessage.id, sort_by_parameter_order=True)
+                plain_ids = list(db.session.execute(plain_stmt, [self._row(m) for m in plain]).scalars().all())
+            created: dict[tuple[int, uuid.UUID | None], int] = {}
+            if keyed:
+                # Another worker or the direct path may have stored one since the lookup: those rows
+                # are skipped and resolved like retries instead of failing the whole batch
+                keyed_stmt = pg_insert(ChatMessage).on_conflict_do_nothing().returning(ChatMessage.id, ChatMessage.user_id, ChatMessage.client_msg_id)
+                created = {(user_id, client_msg_id): message_id for message_id, user_id, client_msg_id in db.session.execute(keyed_stmt, [self._row(m) for m in keyed.values()])}
+                conflicted = keyed.keys() - created.keys()
+                if conflicted:
+                    known.update(self._stored_ids(conflicted))
+
+            # (id, created) per message, in submission order
+            results: list[tuple[int, bool]] = []
+            saved = iter(plain_ids)
+            for m in batch:
+                message_key = (m.user_id, m.client_msg_id)
+                if m.client_msg_id is None:
+                    results.append((next(saved), True))
+                elif message_key in created:
+                    # Repeats of a client id within the batch get the id of its first message
+                    results.append((created[message_key], keyed.pop(message_key, None) is m))
+                else:
+                    results.append((known[message_key], False))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if self.app is not None:
+                self.app.logger.error(f"Error writing batch of {len(batch)} messages: {e}")
+            for message in batch:
+                message.on_error(e)
+            return
+
+        for message, (message_id, is_new) in zip(batch, results, strict=True):
+            try:
+                message.on_saved(message_id, is_new)
+            except Exception as e:
+                if self.app is not None:
+                    self.app.logger.error(f"Error in callback for message {message_id}: {e}")
+
+    @staticmethod
+    def _stored_ids(keys: set[tuple[int, uuid.UUID | None]]) -> dict[tuple[int, uuid.UUID | None], int]:
+        stmt = select(ChatMessage.id, ChatMessage.user_id, ChatMessage.client_msg_id).filter(tuple_(ChatMessage.user_id, ChatMessage.client_msg_id).in_(keys))
+        return {(user_id, client_msg_id): message_id for message_id, user_id, client_msg_id in db.session.execute(stmt)}
+
+    @staticmethod
+    def _row(m: PendingMessage) -> dict[str, Any]:
+        return {"user_id": m.user_id, "chat_id": m.chat_id, "content": m.content, "sent_at": m.sent_at, "client_msg_id": m.client_msg_id}
+
+
+message_writer = BatchMessageWriter()
@@ -0,0 +1,316 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from flask import Flask, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+from python_chat.database import db
+from python_chat.database.replicas import replica_router
+from python_chat.utils.rate_limit import rate_limiter
+
+# Seconds; covers in-memory handlers up to slow database round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base class for metrics rendered in the Prometheus text format."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> list[str]:
+        """Exposition lines, including the HELP and TYPE headers."""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic counter per label values."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Histogram(Metric):
+    """Histogram with fixed buckets per label values.
+
+    Observations increment a single bucket; counts are made cumulative only when rendering.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        state = self._values.get(labelvalues)
+        if state is None:
+            state = self._values[labelvalues] = [0.0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, state in list(self._values.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), state[:-1], strict=True):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {_number(cumulative)}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(state[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {_number(cumulative)}"
+
+
+class CallbackGauge(Metric):
+    """Gauge whose values are read from a callback at scrape time, so it costs nothing in between."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], dict[tuple[str, ...], float]], labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in self.collect().items():
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter whose values are read from a callback at scrape time, e.g. totals kept by another component."""
+
+    type = "counter"
+
+
+class CallbackHistogram(Histogram):
+    """Histogram rebuilt from a callback's observations at scrape time."""
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Iterable[float]], buckets: Iterable[float]) -> None:
+        super().__init__(name, documentation, (), buckets)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        self._values = {}
+        for value in self.collect():
+            self.observe(value)
+        return super().samples()
+
+
+class MetricsRegistry:
+    """Process-local metrics of the chat server."""
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.http_duration = self.register(Histogram("http_request_duration_seconds", "Time spent in HTTP requests.", ("endpoint", "method", "status")))
+        self.socket_duration = self.register(Histogram("socketio_event_duration_seconds", "Time spent in Socket.IO event handlers.", ("event",)))
+        self.socket_errors = self.register(Counter("socketio_event_errors_total", "Socket.IO event handlers that raised.", ("event",)))
+        self.db_duration = self.register(Histogram("db_query_duration_seconds", "Time spent executing SQL statements."))
+        self.pool_checkouts = self.register(Counter("db_pool_checkouts_total", "Connections checked out of the SQLAlchemy pool."))
+        self.pool_wait = self.register(Histogram("db_pool_wait_seconds", "Time checkouts spent waiting for a pooled connection, including connecting."))
+        self.pool_timeouts = self.register(Counter("db_pool_timeouts_total", "Checkouts that gave up after pool_timeout."))
+
+    def register(self, metric: Any) -> Any:
+        """Add a metric, replacing one with the same name."""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Instrument the app, its engine and its Socket.IO server.
+
+        Call after the Socket.IO handlers are registered so every one of them is timed.
+        """
+        if not app.config.get("METRICS_ENABLED", True):
+            return
+        self.instrument_app(app)
+        with app.app_context():
+            engine = db.engine
+            # The primary and any read replicas
+            for bind_engine in db.engines.values():
+                self.instrument_engine(bind_engine)
+        self.instrument_socketio(socketio)
+
+        def pool_stats() -> dict[tuple[str, ...], float]:
+            pool: Any = engine.pool
+            stats: dict[tuple[str, ...], float] = {}
+            for name in ("size", "checkedin", "checkedout", "overflow"):
+                if hasattr(pool, name):
+                    stats[(name,)] = float(getattr(pool, name)())
+            return stats
+
+        def room_sizes() -> list[float]:
+            return [len(sids) for room, sids in socketio.server.manager.rooms.get("/", {}).items() if room is not None]
+
+        self.register(CallbackGauge("socketio_connected_sockets", "Sockets connected to this worker.", lambda: {(): float(len(app.extensions["presence"]))}))
+        self.register(CallbackGauge("socketio_rooms", "Socket.IO rooms on this worker, including per-socket rooms.", lambda: {(): float(len(room_sizes()))}))
+        self.register(CallbackHistogram("socketio_room_sockets", "Sockets per Socket.IO room.", room_sizes, (1, 2, 5, 10, 25, 50, 100, 250, 1000)))
+        self.register(CallbackGauge("db_pool_connections", "SQLAlchemy pool connections by state.", pool_stats, ("state",)))
+        self.register(
+            CallbackCounter(
+                "socketio_rate_limited_total", "Socket events rejected by the rate limiter.", lambda: {(name,): float(count) for name, count in rate_limiter.rejections.items()}, ("event",)
+            )
+        )
+        if replica_router.enabled:
+
+            def replica_lags() -> dict[tuple[str, ...], float]:
+                return {(key,): lag for key, lag in replica_router.lags.items()}
+
+            def routed_reads() -> dict[tuple[str, ...], float]:
+                return {(target,): float(count) for target, count in replica_router.routed.items()}
+
+            self.register(CallbackGauge("db_replica_lag_seconds", "Last measured replication lag of each read replica.", replica_lags, ("replica",)))
+            self.register(CallbackCounter("db_replica_routed_reads_total", "Reads in replica scopes by where they went.", routed_reads, ("target",)))
+        app.extensions["metrics"] = self
+
+    def instrument_app(self, app: Flask) -> None:
+        """Time every request by endpoint, method and status."""
+
+        @app.before_request
+        def start_timer():
+            g._metrics_started = time.perf_counter()
+
+        @app.after_request
+        def observe_request(response):
+            started = g.pop("_metrics_started", None)
+            if started is not None:
+                endpoint = request.url_rule.endpoint if request.url_rule is not None else "unmatched"
+                self.http_duration.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+            return response
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """Time every SQL statement executed on the engine."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_query(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("_metrics_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def observe_query(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.get("_metrics_started")
+            if started:
+                self.db_duration.observe(time.perf_counter() - started.pop())
+
+        @event.listens_for(engine, "checkout")
+        def count_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.pool_checkouts.inc()
+
+        @event.listens_for(engine, "engine_disposed")
+        def instrument_new_pool(engine):
+            # dispose() replaces the pool with a fresh one
+            self.instrument_pool(engine.pool)
+
+        self.instrument_pool(engine.pool)
+
+    def instrument_pool(self, pool: Pool) -> None:
+        """Time how long checkouts wait for a connection and count the ones that time out.
+
+        The pool has no event before a checkout, so its ``_do_get`` is wrapped instead.
+        """
+        if getattr(pool, "_metrics_instrumented", False):
+            return
+        do_get = pool._do_get
+
+        @functools.wraps(do_get)
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return do_get()
+            except PoolTimeoutError:
+                self.pool_timeouts.inc()
+                raise
+            finally:
+                self.pool_wait.observe(time.perf_counter() - started)
+
+        pool._do_get = timed_do_get  # type: ignore[method-assign]
+        pool._metrics_instrumented = True  # type: ignore[attr-defined]
+
+    def instrument_socketio(self, socketio) -> None:
+        """Time every registered event handler of a Flask-SocketIO extension or a python-socketio server."""
+        server = getattr(socketio, "server", socketio)
+        for handlers in server.handlers.values():
+            for name, handler in list(handlers.items()):
+                if not getattr(handler, "_metrics_instrumented", False):
+                    handlers[name] = self._timed_handler(name, handler)
+
+    def _timed_handler(self, name: str, handler: Callable) -> Callable:
+        observe = self.socket_duration.observe
+
+        if inspect.iscoroutinefunction(handler):
+
+            @functools.wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await handler(*args, **kwargs)
+                except Exception:
+                    self.socket_errors.inc(name)
+                    raise
+                finally:
+                    observe(time.perf_counter() - started, name)
+
+            async_wrapper._metrics_instrumented = True  # type: ignore[attr-defined]
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                self.socket_errors.inc(name)
+                raise
+            finally:
+                observe(time.perf_counter() - started, name)
+
+        wrapper._metrics_instrumented = True  # type: ignore[attr-defined]
+        return wrapper
+
+
+metrics = MetricsRegistry()
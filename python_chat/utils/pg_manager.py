@@ -0,0 +1,171 @@
+import time
+from typing import Any
+
+import psycopg2
+import socketio
+from sqlalchemy.engine import make_url
+
+from python_chat.database.models.socketio_payload import SocketIOPayload
+
+# NOTIFY payloads must be shorter than 8000 bytes
+MAX_NOTIFY_BYTES = 7900
+
+
+def pack_messages(messages: list[str], max_bytes: int = MAX_NOTIFY_BYTES) -> tuple[list[str], list[str]]:
+    """Pack JSON messages into as few JSON-array payloads as fit in a NOTIFY.
+
+    Returns the payloads and the messages too large for any payload.
+    """
+    payloads: list[str] = []
+    oversized: list[str] = []
+    current: list[str] = []
+    size = 2  # brackets
+    for message in messages:
+        length = len(message.encode())
+        if length + 2 > max_bytes:
+            oversized.append(message)
+            continue
+        if current and size + length + 1 > max_bytes:
+            payloads.append("[" + ",".join(current) + "]")
+            current, size = [], 2
+        current.append(message)
+        size += length + (1 if len(current) > 1 else 0)
+    if current:
+        payloads.append("[" + ",".join(current) + "]")
+    return payloads, oversized
+
+
+class PostgresManager(socketio.PubSubManager):
+    """Socket.IO client manager that uses Postgres LISTEN/NOTIFY as the message queue.
+
+    Lets several server processes share rooms and broadcasts without Redis. Messages
+    published within ``batch_delay`` seconds (up to ``batch_size``) are sent in one
+    transaction, packed into as few NOTIFY payloads as possible. Messages too large for
+    a NOTIFY are stored in the ``socketio_payloads`` side table and only their id is
+    notified.
+
+    :param url: SQLAlchemy or libpq URL of the database.
+    """
+
+    name = "postgres"
+
+    def __init__(
+        self,
+        url: str,
+        channel: str = "socketio",
+        write_only: bool = False,
+        logger=None,
+        json=None,
+        batch_delay: float = 0.002,
+        batch_size: int = 64,
+        poll_interval: float = 0.005,
+        payload_ttl: float = 300.0,
+    ) -> None:
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.payload_ttl = payload_ttl
+        self._publisher: Any = None
+        self._outbox: Any = None
+        self._empty: type[Exception] = Exception
+        self._last_cleanup = 0.0
+
+    def initialize(self) -> None:
+        super().initialize()
+        if not self.write_only:
+            eio = self.server.eio
+            self._outbox = eio.create_queue()
+            self._empty = eio.get_queue_empty_exception()
+            self.server.start_background_task(self._flush_loop)
+
+    def _connect(self, autocommit: bool) -> Any:
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = autocommit
+        return conn
+
+    def _publish(self, data: dict) -> None:
+        message = self.json.dumps(data)
+        if self._outbox is None:
+            # Write-only emitter without a server: no background task to batch on
+            self._send([message])
+        else:
+            self._outbox.put(message)
+
+    def _flush_loop(self) -> None:
+        while True:
+            batch = [self._outbox.get()]
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._outbox.get(timeout=remaining))
+                except self._empty:
+                    break
+            self._send(batch)
+
+    def _send(self, messages: list[str]) -> None:
+        for attempt in range(2):
+            try:
+                if self._publisher is None or self._publisher.closed:
+                    self._publisher = self._connect(autocommit=False)
+                self._send_once(messages)
+                return
+            except Exception as e:
+                self._get_logger().error(f"Cannot publish to postgres (attempt {attempt + 1}): {e}")
+                if self._publisher is not None:
+                    self._publisher.close()
+                self._publisher = None
+
+    def _send_once(self, messages: list[str]) -> None:
+        payloads, oversized = pack_messages(messages)
+        table = SocketIOPayload.__tablename__
+        with self._publisher.cursor() as cursor:
+            for message in oversized:
+                cursor.execute(f"INSERT INTO {table} (payload) VALUES (%s) RETURNING id", (message,))
+                payloads.append(self.json.dumps({"ref": cursor.fetchone()[0]}))
+
+            now = time.monotonic()
+            if oversized and now - self._last_cleanup > self.payload_ttl:
+                self._last_cleanup = now
+                cursor.execute(f"DELETE FROM {table} WHERE created_at < now() - make_interval(secs => %s)", (self.payload_ttl,))
+
+            # All notifications in one round trip; they are delivered on commit, in order
+            cursor.execute(";".join(cursor.mogrify("SELECT pg_notify(%s, %s)", (self.channel, payload)).decode() for payload in payloads))
+        self._publisher.commit()
+
+    def _decode(self, conn: Any, payload: str) -> list[dict]:
+        data = self.json.loads(payload)
+        if isinstance(data, dict) and "ref" in data:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT payload FROM {SocketIOPayload.__tablename__} WHERE id = %s", (data["ref"],))
+                row = cursor.fetchone()
+            if row is None:
+                self._get_logger().error(f"Socket.IO payload {data['ref']} expired before it was read")
+                return []
+            return [self.json.loads(row[0])]
+        return list(data)
+
+    def _listen(self):
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = self._connect(autocommit=True)
+                    with conn.cursor() as cursor:
+                        cursor.execute(f'LISTEN "{self.channel}"')
+                # Poll instead of blocking in select() so the loop also cooperates with eventlet
+                conn.poll()
+                while conn.notifies:
+                    yield from self._decode(conn, conn.notifies.pop(0).payload)
+            except psycopg2.Error as e:
+                self._get_logger().error(f"Postgres listener error, reconnecting: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self.server.sleep(1)
+                continue
+            self.server.sleep(self.poll_interval)
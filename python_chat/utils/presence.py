@@ -0,0 +1,282 @@
+import json
+import os
+import socket
+import uuid
+from collections.abc import Callable
+from typing import Any, cast
+
+import psycopg2
+from flask import Flask, current_app
+from sqlalchemy import Connection, delete, func, insert, select, update
+from sqlalchemy.engine import make_url
+
+from python_chat.database import db
+from python_chat.database.models.presence_session import PresenceSession
+
+KickHandler = Callable[[str, int], None]
+
+
+def user_room(user_id: int) -> str:
+    """Name of the Socket.IO room every socket of a user joins on connect."""
+    return f"user:{user_id}"
+
+
+class PresenceRegistry:
+    """In-process registry of connected sockets and the users behind them.
+
+    Session data is a dict with ``username``, ``user_id`` and, once the socket joined a
+    chat, ``chat_id``. Online usernames are reference-counted, so a user with several tabs
+    comes online with the first socket and goes offline with the last one. Only works with
+    a single worker process.
+    """
+
+    def __init__(self) -> None:
+        self.sessions: dict[str, dict[str, Any]] = {}
+        self._username_counts: dict[str, int] = {}
+        # Reverse index for per-user lookups without scanning every session
+        self._user_sids: dict[int, set[str]] = {}
+        self._kick_handler: KickHandler | None = None
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Hook for backends that need the app or background tasks."""
+
+    def add(self, sid: str, user_id: int, username: str) -> bool:
+        """Register a connected socket. Returns True if it is the first socket of the username."""
+        self.sessions[sid] = {"username": username, "user_id": user_id}
+        self._user_sids.setdefault(user_id, set()).add(sid)
+        return self._acquire(username)
+
+    def remove(self, sid: str) -> tuple[dict[str, Any] | None, bool]:
+        """Forget a disconnected socket. Returns its session data and whether it was the username's last socket."""
+        session = self.sessions.pop(sid, None)
+        if session is None:
+            return None, False
+        sids = self._user_sids.get(session["user_id"])
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._user_sids[session["user_id"]]
+        return session, self._release(session["username"])
+
+    def _acquire(self, username: str) -> bool:
+        count = self._username_counts.get(username, 0)
+        self._username_counts[username] = count + 1
+        return count == 0
+
+    def _release(self, username: str) -> bool:
+        count = self._username_counts.get(username, 0) - 1
+        if count > 0:
+            self._username_counts[username] = count
+            return False
+        self._username_counts.pop(username, None)
+        return True
+
+    def get(self, sid: str) -> dict[str, Any] | None:
+        """Get the session data of a socket connected to this process."""
+        return self.sessions.get(sid)
+
+    def set_chat(self, sid: str, chat_id: int | None) -> None:
+        """Remember which chat the socket is currently in."""
+        session = self.sessions.get(sid)
+        if session is None:
+            return
+        if chat_id is None:
+            session.pop("chat_id", None)
+        else:
+            session["chat_id"] = chat_id
+
+    def set_username(self, sid: str, username: str) -> tuple[bool, bool]:
+        """Change the username shown for a socket.
+
+        Returns whether the old username went offline and whether the new one came online.
+        """
+        session = self.sessions.get(sid)
+        if session is None or session["username"] == username:
+            return False, False
+        old_gone = self._release(session["username"])
+        session["username"] = username
+        return old_gone, self._acquire(username)
+
+    def online_usernames(self) -> list[str]:
+        """Get the usernames of all connected users."""
+        return list(self._username_counts)
+
+    def local_sids_for_user(self, user_id: int) -> list[str]:
+        """Get the sockets of a user connected to this process."""
+        return list(self._user_sids.get(user_id, ()))
+
+    def on_kick(self, handler: KickHandler) -> None:
+        """Set the handler called as handler(sid, chat_id) for each kicked socket."""
+        self._kick_handler = handler
+
+    def kick(self, user_id: int, chat_id: int) -> None:
+        """Remove every socket of a user from a chat, wherever it is connected."""
+        self._apply_kick(user_id, chat_id)
+
+    def _apply_kick(self, user_id: int, chat_id: int) -> None:
+        if self._kick_handler is None:
+            return
+        for sid in self.local_sids_for_user(user_id):
+            self._kick_handler(sid, chat_id)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+class PostgresPresenceRegistry(PresenceRegistry):
+    """Presence shared by all worker processes through Postgres.
+
+    Sessions of local sockets stay in memory for the event handlers and are mirrored
+    into the UNLOGGED ``presence_sessions`` table for cluster-wide queries. Kicks are
+    sent with NOTIFY and applied by the worker that owns the socket. Each worker
+    refreshes its rows on a heartbeat, and rows of dead workers expire.
+    """
+
+    CHANNEL = "presence_kick"
+
+    def __init__(self, heartbeat: float = 10.0, poll_interval: float = 0.05) -> None:
+        super().__init__()
+        self.node = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self.app: Flask | None = None
+        self._socketio: Any = None
+        self._started = False
+
+    def init_app(self, app: Flask, socketio) -> None:
+        self.heartbeat = app.config.get("PRESENCE_HEARTBEAT", self.heartbeat)
+        self.app = app
+        self._socketio = socketio
+
+    def _ensure_listener(self) -> None:
+        if not self._started and self._socketio is not None:
+            self._started = True
+            self._socketio.start_background_task(self._listen)
+
+    @staticmethod
+    def _lock_usernames(conn: Connection, *usernames: str) -> None:
+        # Serialize changes per username so concurrent workers agree on the first and last socket
+        for username in sorted(usernames):
+            conn.execute(select(func.pg_advisory_xact_lock(func.hashtext(username))))
+
+    @staticmethod
+    def _count(conn: Connection, username: str) -> int:
+        return conn.execute(select(func.count()).select_from(PresenceSession).filter(PresenceSession.username == username)).scalar_one()
+
+    def add(self, sid: str, user_id: int, username: str) -> bool:
+        self._ensure_listener()
+        super().add(sid, user_id, username)
+        with db.engine.begin() as conn:
+            self._lock_usernames(conn, username)
+            conn.execute(insert(PresenceSession).values(sid=sid, node=self.node, user_id=user_id, username=username, seen_at=func.now()))
+            return self._count(conn, username) == 1
+
+    def remove(self, sid: str) -> tuple[dict[str, Any] | None, bool]:
+        session, _ = super().remove(sid)
+        if session is None:
+            return None, False
+        with db.engine.begin() as conn:
+            self._lock_usernames(conn, session["username"])
+            conn.execute(delete(PresenceSession).filter(PresenceSession.sid == sid))
+            return session, self._count(conn, session["username"]) == 0
+
+    def set_username(self, sid: str, username: str) -> tuple[bool, bool]:
+        session = self.get(sid)
+        if session is None or session["username"] == username:
+            return False, False
+        old_username = session["username"]
+        super().set_username(sid, username)
+        with db.engine.begin() as conn:
+            self._lock_usernames(conn, old_username, username)
+            conn.execute(update(PresenceSession).filter(PresenceSession.sid == sid).values(username=username))
+            return self._count(conn, old_username) == 0, self._count(conn, username) == 1
+
+    def online_usernames(self) -> list[str]:
+        with db.engine.connect() as conn:
+            return list(conn.execute(select(PresenceSession.username).distinct()).scalars())
+
+    def kick(self, user_id: int, chat_id: int) -> None:
+        message = json.dumps({"user_id": user_id, "chat_id": chat_id})
+        with db.engine.begin() as conn:
+            conn.execute(select(func.pg_notify(self.CHANNEL, message)))
+
+    def handle_notification(self, message: str) -> None:
+        """Apply a kick received from any worker to the local sockets."""
+        data = json.loads(message)
+        self._apply_kick(data["user_id"], data["chat_id"])
+
+    def beat(self) -> list[str]:
+        """Refresh this worker's rows and drop the rows of workers that stopped beating.
+
+        Returns the usernames that went offline with the dropped rows.
+        """
+        expired = PresenceSession.seen_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, 3 * self.heartbeat)
+        with db.engine.begin() as conn:
+            conn.execute(update(PresenceSession).filter(PresenceSession.node == self.node).values(seen_at=func.now()))
+            usernames = conn.execute(select(PresenceSession.username).filter(expired).distinct()).scalars().all()
+            if not usernames:
+                return []
+            self._lock_usernames(conn, *usernames)
+            # Workers beating together each delete a row once, so each username is reported by one of them
+            removed = set(conn.execute(delete(PresenceSession).filter(expired).returning(PresenceSession.username)).scalars())
+            return [username for username in sorted(removed) if self._count(conn, username) == 0]
+
+    def _listen(self) -> None:
+        # Poll instead of blocking in select() so the loop also cooperates with eventlet
+        assert self.app is not None
+        with self.app.app_context():
+            direct_url = self.app.config.get("SQLALCHEMY_DIRECT_DATABASE_URI")
+            dbapi_conn: Any
+            if direct_url:
+                # LISTEN needs a session of its own, which a transaction pooler in front of the database cannot give
+                dbapi_conn = psycopg2.connect(make_url(direct_url).set(drivername="postgresql").render_as_string(hide_password=False))
+            else:
+                raw = db.engine.raw_connection()
+                dbapi_conn = raw.driver_connection
+                # Autocommit LISTEN connection, keep it out of the pool
+                raw.detach()
+            try:
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.CHANNEL}")
+                since_beat = 0.0
+                while True:
+                    dbapi_conn.poll()
+                    while dbapi_conn.notifies:
+                        notify = dbapi_conn.notifies.pop(0)
+                        try:
+                            self.handle_notification(notify.payload)
+                        except Exception as e:
+                            current_app.logger.error(f"Error handling presence notification: {e}")
+                    since_beat += self.poll_interval
+                    if since_beat >= self.heartbeat:
+                        since_beat = 0.0
+                        try:
+                            for username in self.beat():
+                                # Same delta as a disconnect, for users whose last sockets were on a dead worker
+                                self._socketio.emit("presence_remove", {"username": username})
+                        except Exception as e:
+                            current_app.logger.error(f"Presence heartbeat failed: {e}")
+                    self._socketio.sleep(self.poll_interval)
+            finally:
+                dbapi_conn.close()
+
+
+def init_presence(app: Flask, socketio) -> PresenceRegistry:
+    """Create the presence registry selected by PRESENCE_BACKEND ("memory" or "postgres")."""
+    backend = app.config.get("PRESENCE_BACKEND", "memory")
+    if backend == "postgres":
+        registry: PresenceRegistry = PostgresPresenceRegistry()
+    elif backend == "memory":
+        registry = PresenceRegistry()
+    else:
+        raise ValueError(f"Unknown presence backend: {backend}")
+
+    registry.init_app(app, socketio)
+    app.extensions["presence"] = registry
+    return registry
+
+
+def get_presence() -> PresenceRegistry:
+    """Get the presence registry of the current app."""
+    return cast(PresenceRegistry, current_app.extensions["presence"])
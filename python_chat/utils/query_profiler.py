@@ -0,0 +1,248 @@
+import functools
+import inspect
+import re
+import time
+from collections import deque
+from collections.abc import Callable
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from typing import Any
+
+from flask import Flask, request
+from sqlalchemy import Select, event
+from sqlalchemy.engine import Engine
+
+from python_chat.database import db
+
+# Expanded IN lists render one placeholder per value; collapse them so the statement shape is the key
+_IN_LIST_RE = re.compile(r"\((?:%\(\w+\)s|\$\d+|\?)(?:,\s*(?:%\(\w+\)s|\$\d+|\?))+\)")
+
+# [queries, seconds] of the HTTP request or socket event running in this context
+_current: ContextVar[list | None] = ContextVar("query_profile", default=None)
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse whitespace and IN lists so statements differing only in list length share stats."""
+    return _IN_LIST_RE.sub("(...)", " ".join(statement.split()))
+
+
+class QueryProfiler:
+    """Opt-in SQL profiler.
+
+    Counts queries and database time per HTTP endpoint and per Socket.IO event, keeps
+    totals per statement and logs statements slower than ``slow_query_ms``, optionally
+    with their plan. ANALYZE executes the statement a second time, so only compiled SELECTs
+    that read tables get ``EXPLAIN (ANALYZE, BUFFERS)``; other SELECTs, e.g. of pg_notify()
+    or setval(), and writes get a plain EXPLAIN. Disabled unless ``QUERY_PROFILER_ENABLED``
+    is set.
+    """
+
+    def __init__(self, slow_query_ms: float = 100.0, explain: bool = False, slow_log_size: int = 50, max_statements: int = 500) -> None:
+        self.enabled = False
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.max_statements = max_statements
+        # unit -> {"calls", "queries", "db_seconds", "max_queries", "max_db_seconds"}
+        self.units: dict[str, dict[str, float]] = {}
+        # normalized statement -> {"calls", "seconds", "max_seconds"}
+        self.statements: dict[str, dict[str, float]] = {}
+        self.slow_queries: deque[dict[str, Any]] = deque(maxlen=slow_log_size)
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Read the profiler settings and instrument the app, its engine and its Socket.IO handlers.
+
+        Call after the Socket.IO handlers are registered so every one of them is profiled.
+        """
+        self.enabled = app.config.get("QUERY_PROFILER_ENABLED", False)
+        self.slow_query_ms = app.config.get("SLOW_QUERY_MS", self.slow_query_ms)
+        self.explain = app.config.get("SLOW_QUERY_EXPLAIN", self.explain)
+        self.slow_queries = deque(maxlen=app.config.get("SLOW_QUERY_LOG_SIZE", self.slow_queries.maxlen))
+        self.reset()
+        app.extensions["query_profiler"] = self
+        if not self.enabled:
+            return
+
+        self.instrument_app(app)
+        with app.app_context():
+            for engine in db.engines.values():
+                self.instrument_engine(engine)
+        self.instrument_socketio(socketio)
+
+    def reset(self) -> None:
+        """Forget everything collected so far."""
+        self.units.clear()
+        self.statements.clear()
+        self.slow_queries.clear()
+
+    def record_unit(self, unit: str, queries: int, seconds: float) -> None:
+        """Add one HTTP request or socket event with its query count and database time."""
+        stats = self.units.get(unit)
+        if stats is None:
+            stats = self.units[unit] = {"calls": 0, "queries": 0, "db_seconds": 0.0, "max_queries": 0, "max_db_seconds": 0.0}
+        stats["calls"] += 1
+        stats["queries"] += queries
+        stats["db_seconds"] += seconds
+        stats["max_queries"] = max(stats["max_queries"], queries)
+        stats["max_db_seconds"] = max(stats["max_db_seconds"], seconds)
+
+    def record_query(self, statement: str, seconds: float) -> None:
+        """Add one executed statement to the current unit and to the per-statement totals."""
+        profile = _current.get()
+        if profile is not None:
+            profile[0] += 1
+            profile[1] += seconds
+
+        key = normalize_statement(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            if len(self.statements) >= self.max_statements:
+                key = "<other statements>"
+            stats = self.statements.setdefault(key, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def instrument_app(self, app: Flask) -> None:
+        """Profile every request by method and endpoint."""
+
+        @app.before_request
+        def start_request_profile():
+            _current.set([0, 0.0])
+
+        @app.teardown_request
+        def finish_request_profile(exc):
+            profile = _current.get()
+            _current.set(None)
+            if profile is not None:
+                endpoint = request.url_rule.endpoint if request.url_rule is not None else "unmatched"
+                self.record_unit(f"{request.method} {endpoint}", *profile)
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """Time every statement executed on the engine."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_query(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("_profiler_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def finish_query(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.get("_profiler_started")
+            if not started:
+                return
+            seconds = time.perf_counter() - started.pop()
+            self.record_query(statement, seconds)
+            if seconds * 1000 >= self.slow_query_ms:
+                plan = self._explain(cursor.connection, statement, parameters, self._analyzable(context)) if self.explain and not executemany else None
+                self.slow_queries.append(
+                    {
+                        "statement": statement,
+                        "parameters": repr(parameters)[:500],
+                        "duration_ms": round(seconds * 1000, 3),
+                        "plan": plan,
+                        "at": datetime.now(UTC).isoformat(),
+                    }
+                )
+
+    @staticmethod
+    def _analyzable(context: Any) -> bool:
+        """Whether a statement may be run again: a compiled SELECT reading tables, not a bare function call."""
+        statement = getattr(getattr(context, "compiled", None), "statement", None)
+        return isinstance(statement, Select) and bool(statement.get_final_froms())
+
+    @staticmethod
+    def _explain(dbapi_conn, statement: str, parameters: Any, analyze: bool) -> list[str] | None:
+        """EXPLAIN a statement on the same connection, inside a savepoint so a failure cannot abort the transaction."""
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+            return None
+        in_transaction = not getattr(dbapi_conn, "autocommit", False)
+        cursor = dbapi_conn.cursor()
+        try:
+            if in_transaction:
+                cursor.execute("SAVEPOINT query_profiler_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}" if analyze else f"EXPLAIN {statement}", parameters)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT query_profiler_explain")
+                plan = [f"EXPLAIN failed: {e}"]
+            if in_transaction:
+                cursor.execute("RELEASE SAVEPOINT query_profiler_explain")
+            return plan
+        finally:
+            cursor.close()
+
+    def instrument_socketio(self, socketio) -> None:
+        """Profile every registered event handler of a Flask-SocketIO extension or a python-socketio server."""
+        server = getattr(socketio, "server", socketio)
+        for handlers in server.handlers.values():
+            for name, handler in list(handlers.items()):
+                if not getattr(handler, "_query_profiled", False):
+                    handlers[name] = self._profiled_handler(name, handler)
+
+    def _profiled_handler(self, name: str, handler: Callable) -> Callable:
+        unit = f"socket {name}"
+
+        if inspect.iscoroutinefunction(handler):
+
+            @functools.wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                profile = [0, 0.0]
+                token = _current.set(profile)
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    _current.reset(token)
+                    self.record_unit(unit, *profile)
+
+            async_wrapper._query_profiled = True  # type: ignore[attr-defined]
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            profile = [0, 0.0]
+            token = _current.set(profile)
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                _current.reset(token)
+                self.record_unit(unit, *profile)
+
+        wrapper._query_profiled = True  # type: ignore[attr-defined]
+        return wrapper
+
+    def report(self, limit: int = 20) -> dict[str, Any]:
+        """Worst units and statements by total database time, and the slow query log, newest first."""
+        units = sorted(self.units.items(), key=lambda item: item[1]["db_seconds"], reverse=True)[:limit]
+        statements = sorted(self.statements.items(), key=lambda item: item[1]["seconds"], reverse=True)[:limit]
+        return {
+            "enabled": self.enabled,
+            "slow_query_ms": self.slow_query_ms,
+            "units": [
+                {
+                    "unit": unit,
+                    "calls": stats["calls"],
+                    "queries": stats["queries"],
+                    "queries_per_call": round(stats["queries"] / stats["calls"], 2),
+                    "db_ms": round(stats["db_seconds"] * 1000, 3),
+                    "db_ms_per_call": round(stats["db_seconds"] * 1000 / stats["calls"], 3),
+                    "max_queries": stats["max_queries"],
+                    "max_db_ms": round(stats["max_db_seconds"] * 1000, 3),
+                }
+                for unit, stats in units
+            ],
+            "statements": [
+                {
+                    "statement": statement,
+                    "calls": stats["calls"],
+                    "total_ms": round(stats["seconds"] * 1000, 3),
+                    "mean_ms": round(stats["seconds"] * 1000 / stats["calls"], 3),
+                    "max_ms": round(stats["max_seconds"] * 1000, 3),
+                }
+                for statement, stats in statements
+            ],
+            "slow_queries": list(reversed(self.slow_queries)),
+        }
+
+
+query_profiler = QueryProfiler()
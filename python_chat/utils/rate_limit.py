@@ -0,0 +1,95 @@
+import time
+from typing import Any
+
+from flask import Flask
+
+# Events per second and burst size for each limited Socket.IO event
+DEFAULT_RATE_LIMITS: dict[str, tuple[float, float]] = {
+    "send_message": (5.0, 10.0),
+    "typing": (2.0, 5.0),
+    "mark_read": (2.0, 5.0),
+    "join": (1.0, 5.0),
+    "get_online_users": (0.5, 3.0),
+}
+
+
+def parse_rate_limits(spec: str) -> dict[str, tuple[float, float]]:
+    """Parse "event=rate/burst,..." (e.g. "send_message=5/10,typing=2/5") into a rate limit mapping."""
+    limits: dict[str, tuple[float, float]] = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        event, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        limits[event.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class RateLimiter:
+    """In-process token bucket limiter per user and event.
+
+    Each (event, user) bucket holds up to ``burst`` tokens and refills at ``rate`` tokens
+    per second; a call takes one token or is rejected. Rejections are counted per event.
+    Buckets live in a dict per event keyed by user id, and buckets that refilled completely
+    are dropped once there are more than ``max_users`` of them.
+    """
+
+    def __init__(self, limits: dict[str, tuple[float, float]] | None = None, max_users: int = 100_000) -> None:
+        self.enabled = True
+        self.max_users = max_users
+        self.rejections: dict[str, int] = {}
+        self._rules: dict[str, tuple[float, float, dict[Any, list[float]]]] = {}
+        self.configure(DEFAULT_RATE_LIMITS if limits is None else limits)
+
+    def init_app(self, app: Flask) -> None:
+        """Read RATE_LIMIT_ENABLED and RATE_LIMITS (a mapping or an "event=rate/burst,..." string) from the app config."""
+        self.enabled = app.config.get("RATE_LIMIT_ENABLED", True)
+        limits = app.config.get("RATE_LIMITS") or DEFAULT_RATE_LIMITS
+        self.configure(parse_rate_limits(limits) if isinstance(limits, str) else limits)
+
+    def configure(self, limits: dict[str, tuple[float, float]]) -> None:
+        """Replace the limits and reset all buckets and counters."""
+        self._rules = {event: (float(rate), float(burst), {}) for event, (rate, burst) in limits.items()}
+        self.rejections = dict.fromkeys(limits, 0)
+
+    def allow(self, key: Any, event: str, now: float | None = None) -> bool:
+        """Take a token from the bucket of ``key`` (usually the user id) for ``event``."""
+        rule = self._rules.get(event)
+        if rule is None or not self.enabled:
+            return True
+        rate, burst, buckets = rule
+        if now is None:
+            now = time.monotonic()
+
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.max_users:
+                self._prune(rate, burst, buckets, now)
+            buckets[key] = [burst - 1.0, now]
+            return True
+
+        tokens = bucket[0] + (now - bucket[1]) * rate
+        if tokens > burst:
+            tokens = burst
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            self.rejections[event] += 1
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    @staticmethod
+    def _prune(rate: float, burst: float, buckets: dict[Any, list[float]], now: float) -> None:
+        # A full bucket behaves exactly like a missing one
+        for key in [key for key, (tokens, stamp) in buckets.items() if tokens + (now - stamp) * rate >= burst]:
+            del buckets[key]
+
+    def clear(self) -> None:
+        """Reset all buckets and counters."""
+        for _, _, buckets in self._rules.values():
+            buckets.clear()
+        self.rejections = dict.fromkeys(self._rules, 0)
+
+
+rate_limiter = RateLimiter()
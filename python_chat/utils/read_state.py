@@ -0,0 +1,114 @@
+from typing import Any, cast
+
+from flask import Flask
+from sqlalchemy import CursorResult, Integer, Update, column, or_, tuple_, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from python_chat.database import db
+from python_chat.database.models.chat_member import ChatMember
+from python_chat.database.models.chat_message import ChatMessage
+
+
+class ReadMarker:
+    """Debounces ``mark_read`` events into batched updates of the members' read pointers.
+
+    Marks only keep the newest message id per (user, chat) in memory; every ``interval``
+    seconds the pending pointers are written with one UPDATE, which also stores where the
+    message is in the history. A pointer never moves back, so marks flushed late or by
+    another worker cannot undo a newer one, and ids of messages of other chats are ignored.
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.app: Flask | None = None
+        self._socketio: Any = None
+        self._pending: dict[tuple[int, int], int] = {}
+        self._started = False
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Read the flush interval and bind to the app's Socket.IO server."""
+        self.interval = app.config.get("READ_MARK_FLUSH_MS", self.interval * 1000) / 1000
+        self.app = app
+        self._socketio = socketio
+        self._pending.clear()
+        self._started = False
+
+    def mark_read(self, user_id: int, chat_id: int, message_id: int) -> None:
+        """Record that a user has seen a chat up to a message."""
+        key = (int(user_id), int(chat_id))
+        if message_id > self._pending.get(key, 0):
+            self._pending[key] = int(message_id)
+            self._ensure_started()
+
+    def flush(self) -> int:
+        """Write the pending read pointers in one statement. Needs an app context; returns the members updated."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            result = cast(CursorResult, db.session.execute(self._update_stmt(pending)))
+            updated = result.rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._requeue(pending)
+            raise
+        return updated
+
+    async def flush_async(self, session: AsyncSession) -> int:
+        """Same as :meth:`flush`, on an asyncio session."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            result = cast(CursorResult, await session.execute(self._update_stmt(pending)))
+            updated = result.rowcount
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            self._requeue(pending)
+            raise
+        return updated
+
+    @staticmethod
+    def _update_stmt(pending: dict[tuple[int, int], int]) -> Update:
+        # Sorted, so concurrent flushes lock member rows in the same order
+        marks = values(column("user_id", Integer), column("chat_id", Integer), column("message_id", Integer), name="marks").data(
+            [(user_id, chat_id, message_id) for (user_id, chat_id), message_id in sorted(pending.items())]
+        )
+        return (
+            update(ChatMember)
+            .filter(
+                ChatMember.user_id == marks.c.user_id,
+                ChatMember.chat_id == marks.c.chat_id,
+                ChatMessage.id == marks.c.message_id,
+                ChatMessage.chat_id == marks.c.chat_id,
+                or_(ChatMember.last_read_sent_at.is_(None), tuple_(ChatMessage.sent_at, ChatMessage.id) > tuple_(ChatMember.last_read_sent_at, ChatMember.last_read_message_id)),
+            )
+            .values(last_read_message_id=ChatMessage.id, last_read_sent_at=ChatMessage.sent_at)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _requeue(self, pending: dict[tuple[int, int], int]) -> None:
+        # Retried with the next flush, unless newer marks arrived meanwhile
+        for key, message_id in pending.items():
+            if message_id > self._pending.get(key, 0):
+                self._pending[key] = message_id
+
+    def _ensure_started(self) -> None:
+        if not self._started and self._socketio is not None:
+            self._started = True
+            self._socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            assert self.app is not None
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.app.logger.error(f"Error writing read pointers: {e}")
+
+
+read_marker = ReadMarker()
@@ -0,0 +1,92 @@
+import time
+import uuid
+from typing import Any
+
+from flask import Flask
+
+
+class TypingCoalescer:
+    """Coalesces typing events into a periodic ``typing_state`` digest per chat room.
+
+    Instead of forwarding every typing event to the room, the latest flag of each user is
+    kept per chat, and every ``interval`` seconds each chat whose state changed gets one
+    digest with the usernames currently typing. Flags that are not refreshed within
+    ``ttl`` seconds expire, so a client that went away mid-sentence stops showing as typing.
+
+    State is per process; digests carry a ``source`` id so clients can merge the digests
+    of several workers.
+    """
+
+    def __init__(self, interval: float = 0.5, ttl: float = 5.0) -> None:
+        self.interval = interval
+        self.ttl = ttl
+        self.source = uuid.uuid4().hex[:8]
+        self.app: Flask | None = None
+        self._socketio: Any = None
+        self._typing: dict[int, dict[str, float]] = {}
+        self._dirty: set[int] = set()
+        self._started = False
+
+    def init_app(self, app: Flask, socketio) -> None:
+        """Read the digest settings and bind to the app's Socket.IO server."""
+        self.interval = app.config.get("TYPING_DIGEST_INTERVAL_MS", self.interval * 1000) / 1000
+        self.ttl = app.config.get("TYPING_TTL", self.ttl)
+        self.app = app
+        self._socketio = socketio
+        self._typing.clear()
+        self._dirty.clear()
+        self._started = False
+
+    def set_typing(self, chat_id: int, username: str, is_typing: bool, now: float | None = None) -> None:
+        """Record the typing flag of a user in a chat."""
+        now = time.monotonic() if now is None else now
+        chat_id = int(chat_id)
+        users = self._typing.get(chat_id)
+        if is_typing:
+            if users is None:
+                users = self._typing[chat_id] = {}
+            if username not in users:
+                self._dirty.add(chat_id)
+            users[username] = now + self.ttl
+            self._ensure_started()
+        elif users is not None and users.pop(username, None) is not None:
+            self._dirty.add(chat_id)
+            if not users:
+                del self._typing[chat_id]
+
+    def typing_users(self, chat_id: int) -> list[str]:
+        """Get the usernames typing in a chat, as of the last recorded events."""
+        return sorted(self._typing.get(int(chat_id), ()))
+
+    def collect(self, now: float | None = None) -> list[tuple[int, list[str]]]:
+        """Expire stale flags and return (chat_id, typing usernames) for each chat that changed since the last call."""
+        now = time.monotonic() if now is None else now
+        for chat_id, users in list(self._typing.items()):
+            expired = [username for username, expires_at in list(users.items()) if expires_at <= now]
+            if expired:
+                for username in expired:
+                    users.pop(username, None)
+                self._dirty.add(chat_id)
+                if not users:
+                    self._typing.pop(chat_id, None)
+
+        dirty, self._dirty = self._dirty, set()
+        return [(chat_id, self.typing_users(chat_id)) for chat_id in dirty]
+
+    def _ensure_started(self) -> None:
+        if not self._started and self._socketio is not None:
+            self._started = True
+            self._socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            try:
+                for chat_id, users in self.collect():
+                    self._socketio.emit("typing_state", {"chat_id": chat_id, "users": users, "source": self.source}, room=str(chat_id))
+            except Exception as e:
+                if self.app is not None:
+                    self.app.logger.error(f"Error sending typing state: {e}")
+
+
+typing_coalescer = TypingCoalescer()
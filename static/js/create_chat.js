@@ -16,6 +16,10 @@ document.addEventListener('DOMContentLoaded', function () {
     let isGroupChat = false;
     let selectedUsers = [];
     let searchTimeout = null;
+    // Запрос поиска, который ещё выполняется; отменяется, когда пользователь печатает дальше
+    let searchController = null;
+    let lastSearchQuery = '';
+    const SEARCH_DEBOUNCE_MS = 250;
 
     // Открытие модального окна
     function openModal() {
@@ -34,6 +38,7 @@ document.addEventListener('DOMContentLoaded', function () {
         isGroupChat = false;
         selectedUsers = [];
         userSearchInput.value = '';
+        lastSearchQuery = '';
         chatNameInput.value = '';
         searchResults.innerHTML = '';
         searchResults.classList.remove('active');
@@ -61,15 +66,25 @@ document.addEventListener('DOMContentLoaded', function () {
 
     // Поиск пользователей
     function searchUsers(query) {
+        if (searchController) {
+            searchController.abort();
+            searchController = null;
+        }
         if (query.length < 2) {
             searchResults.innerHTML = '';
             searchResults.classList.remove('active');
             return;
         }
 
-        fetch(`/api/search-users?query=${encodeURIComponent(query)}`)
+        const controller = new AbortController();
+        searchController = controller;
+        fetch(`/api/search-users?query=${encodeURIComponent(query)}`, { signal: controller.signal })
             .then(response => response.json())
             .then(data => {
+                if (controller !== searchController) {
+                    return;
+                }
+                searchController = null;
                 searchResults.innerHTML = '';
 
                 if (data.users && data.users.length > 0) {
@@ -93,6 +108,9 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
             })
             .catch(error => {
+                if (error.name === 'AbortError') {
+                    return;
+                }
                 console.error('Ошибка при поиске пользователей:', error);
             });
     }
@@ -108,6 +126,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         renderSelectedUsers();
         userSearchInput.value = '';
+        lastSearchQuery = '';
         searchResults.innerHTML = '';
         searchResults.classList.remove('active');
 
@@ -209,9 +228,19 @@ document.addEventListener('DOMContentLoaded', function () {
 
     userSearchInput.addEventListener('input', function () {
         clearTimeout(searchTimeout);
+        const query = this.value.trim();
+        if (query === lastSearchQuery) {
+            return;
+        }
+        // Ответ на предыдущий запрос уже не нужен
+        if (searchController) {
+            searchController.abort();
+            searchController = null;
+        }
         searchTimeout = setTimeout(() => {
-            searchUsers(this.value);
-        }, 300);
+            lastSearchQuery = query;
+            searchUsers(query);
+        }, SEARCH_DEBOUNCE_MS);
     });
 
     createChatSubmit.addEventListener('click', createNewChat);
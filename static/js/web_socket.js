@@ -17,17 +17,87 @@ const pathParts = window.location.pathname.split('/');
 console.log(pathParts);
 const chatId = parseInt(pathParts[pathParts.length - 1], 10); // Ensure it's a number
 console.log(chatId);
+// Keyset pagination state for the message history
+let oldestMessageId = null;
+let hasOlderMessages = false;
+let loadingOlderMessages = false;
+// Newest message seen, sent on rejoin so the server replays only what was missed
+let newestMessageId = null;
+let historyLoaded = false;
+
+function trackNewest(messageId) {
+    if (messageId && (newestMessageId === null || messageId > newestMessageId)) {
+        newestMessageId = messageId;
+        markRead();
+    }
+}
+
+// Move the read pointer to the newest message once it stops changing for a moment, and only
+// while the tab is visible; the server batches these writes too
+const MARK_READ_DEBOUNCE_MS = 1000;
+let lastReadMessageId = 0;
+let markReadTimer = null;
+
+function markRead() {
+    clearTimeout(markReadTimer);
+    markReadTimer = setTimeout(() => {
+        if (!document.hidden && newestMessageId !== null && newestMessageId > lastReadMessageId) {
+            lastReadMessageId = newestMessageId;
+            socket.emit('mark_read', { chat_id: chatId, message_id: newestMessageId });
+        }
+    }, MARK_READ_DEBOUNCE_MS);
+}
+
+document.addEventListener('visibilitychange', markRead);
+
+// Load the newest page of the history
 function loadPreviousMessages(chatId) {
     fetch(`/api/messages/${chatId}`)
         .then(response => response.json())
         .then(data => {
             data.messages.forEach(msg => {
+                displayedMessages.add(msg.id);
+                trackNewest(msg.id);
                 addMessage(msg.content, "user", msg.username, msg.id);
             });
+            oldestMessageId = data.next_cursor;
+            hasOlderMessages = data.has_more;
+            historyLoaded = true;
         })
         .catch(error => console.error('Error loading messages:', error));
 }
 
+// Load the page before the oldest displayed message and keep the scroll position
+function loadOlderMessages() {
+    if (!hasOlderMessages || loadingOlderMessages || oldestMessageId === null) {
+        return;
+    }
+    loadingOlderMessages = true;
+    const previousScrollHeight = chatMessages.scrollHeight;
+
+    fetch(`/api/messages/${chatId}?before_id=${oldestMessageId}`)
+        .then(response => response.json())
+        .then(data => {
+            // Prepend newest-to-oldest so the page ends up in chronological order
+            data.messages.slice().reverse().forEach(msg => {
+                displayedMessages.add(msg.id);
+                addMessage(msg.content, "user", msg.username, msg.id, true);
+            });
+            oldestMessageId = data.next_cursor;
+            hasOlderMessages = data.has_more;
+            chatMessages.scrollTop = chatMessages.scrollHeight - previousScrollHeight;
+        })
+        .catch(error => console.error('Error loading older messages:', error))
+        .finally(() => {
+            loadingOlderMessages = false;
+        });
+}
+
+chatMessages.addEventListener('scroll', () => {
+    if (chatMessages.scrollTop < 100) {
+        loadOlderMessages();
+    }
+});
 
 let currentUsername = "";
 const displayedMessages = new Set();
@@ -43,18 +113,36 @@ socket.on('connect', function () {
 function joinChatRoom() {
     console.log('Joining chat room:', chatId);
     // Join needs to happen before any messages can be received
-    socket.emit('join', { chat_id: chatId });
+    socket.emit('join', { chat_id: chatId, last_message_id: historyLoaded ? newestMessageId : null });
+}
 
-    // Add this debug line to confirm joining worked
-    socket.on('joined_chat', (data) => {
-        console.log('Successfully joined chat room:', data.chat_id);
+socket.on('joined_chat', (data) => {
+    console.log('Successfully joined chat room:', data.chat_id);
 
-        // Check if user is a moderator first, then load messages
-        checkModeratorStatus().then(() => {
-            loadPreviousMessages(chatId);
+    if (historyLoaded && !data.reload) {
+        // Rejoin after a reconnect: the server sent only the messages we missed
+        (data.missed_messages || []).forEach(msg => {
+            if (!displayedMessages.has(msg.id)) {
+                displayedMessages.add(msg.id);
+                trackNewest(msg.id);
+                addMessage(msg.content, "user", msg.username, msg.id);
+            }
         });
+        return;
+    }
+
+    if (data.reload) {
+        // Too far behind to replay: start over from the newest page
+        chatMessages.innerHTML = '';
+        displayedMessages.clear();
+        historyLoaded = false;
+    }
+
+    // Check if user is a moderator first, then load messages
+    checkModeratorStatus().then(() => {
+        loadPreviousMessages(chatId);
     });
-}
+});
 
 // Function to check if the current user is a moderator
 function checkModeratorStatus() {
@@ -121,12 +209,25 @@ socket.on("banned_from_chat", (data) => {
 });
 
 
-socket.on("user_joined", (data) => {
-    addMessage(`${data.username} joined the chat`, "system");
+// Online usernames: a full snapshot on (re)connect, then kept current with presence deltas
+const onlineUsers = new Set();
+
+socket.on("online_users", (data) => {
+    onlineUsers.clear();
+    data.users.forEach(username => onlineUsers.add(username));
 });
 
-socket.on("user_left", (data) => {
-    addMessage(`${data.username} left the chat`, "system");
+socket.on("presence_add", (data) => {
+    if (!onlineUsers.has(data.username)) {
+        onlineUsers.add(data.username);
+        addMessage(`${data.username} joined the chat`, "system");
+    }
+});
+
+socket.on("presence_remove", (data) => {
+    if (onlineUsers.delete(data.username)) {
+        addMessage(`${data.username} left the chat`, "system");
+    }
 });
 
 socket.on("receive_message", (data) => {
@@ -138,6 +239,7 @@ socket.on("receive_message", (data) => {
     // Check if we've already displayed this message
     if (!displayedMessages.has(messageId)) {
         displayedMessages.add(messageId);
+        trackNewest(data.message_id);
         addMessage(data.message, "user", data.username, data.message_id);
     } else {
         console.log("Skipping duplicate message:", messageId);
@@ -152,6 +254,50 @@ socket.on("username_updated", (data) => {
     }
 });
 
+// Typing users per server process, from the coalesced typing_state digests
+const typingIndicator = document.getElementById("typing-indicator");
+const typingBySource = new Map();
+
+socket.on("typing_state", (data) => {
+    if (parseInt(data.chat_id) !== chatId) return;
+    typingBySource.set(data.source, data.users);
+    const typing = new Set();
+    typingBySource.forEach(users => users.forEach(username => {
+        if (username !== currentUsername) typing.add(username);
+    }));
+    const names = Array.from(typing);
+    if (names.length === 0) {
+        typingIndicator.textContent = "";
+    } else if (names.length <= 3) {
+        typingIndicator.textContent = `${names.join(", ")} ${names.length === 1 ? "is" : "are"} typing...`;
+    } else {
+        typingIndicator.textContent = `${names.length} people are typing...`;
+    }
+});
+
+// Report typing when it starts and stops, refreshing it before the server expires the flag,
+// instead of on every keystroke
+const TYPING_IDLE_MS = 2000;
+const TYPING_REFRESH_MS = 3000;
+let isTyping = false;
+let typingSentAt = 0;
+let typingTimer = null;
+
+function setTyping(typing) {
+    const now = Date.now();
+    if (typing !== isTyping || (typing && now - typingSentAt > TYPING_REFRESH_MS)) {
+        isTyping = typing;
+        typingSentAt = now;
+        socket.emit("typing", { isTyping: typing });
+    }
+}
+
+messageInput.addEventListener("input", () => {
+    setTyping(messageInput.value.length > 0);
+    clearTimeout(typingTimer);
+    typingTimer = setTimeout(() => setTyping(false), TYPING_IDLE_MS);
+});
+
 sendButton.addEventListener("click", sendMessage);
 messageInput.addEventListener("keypress", (e) => {
     if (e.key === "Enter") sendMessage();
@@ -164,11 +310,49 @@ socket.on("set_username", (data) => {
 });
 
 
+// crypto.randomUUID is only available in secure contexts
+function generateMessageId() {
+    if (window.crypto.randomUUID) {
+        return window.crypto.randomUUID();
+    }
+    const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+    bytes[6] = (bytes[6] & 0x0f) | 0x40;
+    bytes[8] = (bytes[8] & 0x3f) | 0x80;
+    const hex = Array.from(bytes, b => b.toString(16).padStart(2, "0")).join("");
+    return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+}
+
+// Retrying is safe: the server stores a client_msg_id once and acks every attempt with the same id
+const SEND_TIMEOUT_MS = 5000;
+const SEND_RETRIES = 3;
+
+function emitMessage(payload, retriesLeft) {
+    socket.timeout(SEND_TIMEOUT_MS).emit("send_message", payload, (err, ack) => {
+        if (err) {
+            if (retriesLeft > 0) {
+                emitMessage(payload, retriesLeft - 1);
+            } else {
+                addMessage("Message could not be sent", "system");
+            }
+            return;
+        }
+        // The ack may arrive before our own receive_message broadcast
+        if (ack && ack.status === "ok" && !displayedMessages.has(ack.message_id)) {
+            displayedMessages.add(ack.message_id);
+            trackNewest(ack.message_id);
+            addMessage(payload.message, "user", currentUsername, ack.message_id);
+        }
+    });
+}
+
 function sendMessage() {
     const message = messageInput.value.trim();
     if (message) {
-        socket.emit("send_message", { message: message, chat_id: chatId });
+        emitMessage({ message: message, chat_id: chatId, client_msg_id: generateMessageId() }, SEND_RETRIES);
         messageInput.value = "";
+        // The server clears the typing flag on send
+        isTyping = false;
+        clearTimeout(typingTimer);
     }
 }
 
@@ -181,7 +365,7 @@ function updateUsername() {
 }
 
 // Update your addMessage function to include message ID and delete button
-function addMessage(message, type, username = "", messageId = null) {
+function addMessage(message, type, username = "", messageId = null, prepend = false) {
     const messageElement = document.createElement("div");
     messageElement.className = "message";
 
@@ -231,8 +415,12 @@ function addMessage(message, type, username = "", messageId = null) {
         messageElement.textContent = message;
     }
 
-    chatMessages.appendChild(messageElement);
-    chatMessages.scrollTop = chatMessages.scrollHeight;
+    if (prepend) {
+        chatMessages.prepend(messageElement);
+    } else {
+        chatMessages.appendChild(messageElement);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    }
     return messageElement;
 }
 
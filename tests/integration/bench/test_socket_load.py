@@ -0,0 +1,19 @@
+from python_chat.bench.socket_load import percentile, summarize
+
+
+class TestSocketLoad:
+    """Test suite for the statistics of the Socket.IO load generator."""
+
+    def test_percentile_is_nearest_rank(self):
+        """Test that the smallest value covering the requested share is returned."""
+        values = [float(value) for value in range(1, 101)]
+
+        assert [percentile(values, pct) for pct in (0, 1, 50, 95, 99, 100)] == [1.0, 1.0, 50.0, 95.0, 99.0, 100.0]
+        assert percentile([3.0, 7.0], 50) == 3.0
+        assert percentile([3.0, 7.0], 51) == 7.0
+        assert percentile([], 50) is None
+
+    def test_summarize(self):
+        """Test that latencies are sorted before the percentiles are taken."""
+        assert summarize([40.0, 10.0, 30.0, 20.0]) == {"p50_ms": 20.0, "p95_ms": 40.0, "p99_ms": 40.0, "max_ms": 40.0}
+        assert summarize([]) == {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
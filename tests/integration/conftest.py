@@ -8,6 +8,8 @@ from testcontainers.postgres import PostgresContainer
 
 from python_chat.app import create_app
 from python_chat.database import db
+from python_chat.utils.membership_cache import membership_cache
+from python_chat.utils.rate_limit import rate_limiter
 
 
 @pytest.fixture(scope="session")
@@ -46,6 +48,9 @@ def session(app) -> Generator[scoped_session, Any]:
 
         # Set the session for the app
         db.session = session
+        # Cached memberships would outlive the rolled back transaction
+        membership_cache.clear()
+        rate_limiter.clear()
 
         yield session
 
@@ -2,7 +2,7 @@ from typing import cast
 
 from sqlalchemy.orm.collections import InstrumentedList
 
-from python_chat.database.models import Chat, ChatMember, User
+from python_chat.database.models import Chat, ChatMember, ChatMessage, User
 
 
 class TestChatMember:
@@ -145,3 +145,22 @@ class TestChatMember:
             assert f"<ChatMember user_id={user.id} chat_id={chat.id} is_moderator=True>" == repr(member)
         except AssertionError:  # pragma: no cover
             print(f"Warning: {repr(member)} does not match expected format.")  # noqa: T201
+
+    def test_unread_counts(self, session):
+        """Test that unread counts skip read and own messages and stop at the limit."""
+        quiet, busy = Chat(name="Quiet Chat", is_group=True), Chat(name="Busy Chat", is_group=True)
+        reader, writer = User(username="unreadreader"), User(username="unreadwriter")
+        for user in (reader, writer):
+            user.set_password("testpass")
+        session.add_all([quiet, busy, reader, writer])
+        session.flush()
+        session.add_all([ChatMember(user_id=reader.id, chat_id=quiet.id), ChatMember(user_id=reader.id, chat_id=busy.id)])
+        messages = [ChatMessage(chat_id=busy.id, user_id=writer.id, content=str(i)) for i in range(8)]
+        session.add_all([*messages, ChatMessage(chat_id=busy.id, user_id=reader.id, content="mine"), ChatMessage(chat_id=quiet.id, user_id=writer.id, content="read")])
+        session.flush()
+        read = session.query(ChatMessage).filter_by(chat_id=quiet.id).one()
+        session.query(ChatMember).filter_by(user_id=reader.id, chat_id=busy.id).update({"last_read_message_id": messages[2].id, "last_read_sent_at": messages[2].sent_at})
+        session.query(ChatMember).filter_by(user_id=reader.id, chat_id=quiet.id).update({"last_read_message_id": read.id, "last_read_sent_at": read.sent_at})
+
+        assert ChatMember.unread_counts(reader.id) == {quiet.id: 0, busy.id: 5}
+        assert ChatMember.unread_counts(reader.id, limit=3) == {quiet.id: 0, busy.id: 3}
@@ -0,0 +1,129 @@
+import datetime
+
+import pytest
+from sqlalchemy import func, select, text, tuple_
+
+from python_chat.database.models import ChatMember, ChatMessage, User
+
+# Big enough that the planner prefers indexes over sequential scans
+SEED_SQL = [
+    """
+    INSERT INTO users (username, password_hash, is_admin, is_blocked, created_at)
+    SELECT 'idx_user_' || g, 'x', false, false, now() FROM generate_series(1, 2000) g
+    """,
+    """
+    INSERT INTO chats (name, is_group, created_at)
+    SELECT 'idx_chat_' || g, true, now() FROM generate_series(1, 1000) g
+    """,
+    """
+    INSERT INTO chat_members (user_id, chat_id, is_moderator, joined_at, is_banned)
+    SELECT DISTINCT u.ids[1 + g % 2000], c.ids[1 + (g * 7) % 1000], false, now(), g % 50 = 0
+    FROM generate_series(1, 40000) g,
+         (SELECT array_agg(id) AS ids FROM users WHERE username LIKE 'idx_user_%') u,
+         (SELECT array_agg(id) AS ids FROM chats WHERE name LIKE 'idx_chat_%') c
+    """,
+    """
+    INSERT INTO messages (chat_id, user_id, content, sent_at)
+    SELECT c.ids[1 + g % 1000], u.ids[1 + g % 2000], 'message ' || g, now() - g * interval '5 minutes'
+    FROM generate_series(1, 50000) g,
+         (SELECT array_agg(id) AS ids FROM users WHERE username LIKE 'idx_user_%') u,
+         (SELECT array_agg(id) AS ids FROM chats WHERE name LIKE 'idx_chat_%') c
+    """,
+    "ANALYZE users",
+    "ANALYZE chats",
+    "ANALYZE chat_members",
+    "ANALYZE messages",
+]
+
+
+def _plan_nodes(plan: dict) -> list[dict]:
+    """Flatten an EXPLAIN (FORMAT JSON) plan tree."""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+class TestIndexes:
+    """Check that the hot queries are served by indexes on a seeded dataset."""
+
+    @pytest.fixture
+    def seeded(self, session):
+        for statement in SEED_SQL:
+            session.execute(text(statement))
+        chat_id = session.execute(text("SELECT id FROM chats WHERE name = 'idx_chat_1'")).scalar_one()
+        user_id = session.execute(text("SELECT id FROM users WHERE username = 'idx_user_1'")).scalar_one()
+        return chat_id, user_id
+
+    def _explain(self, session, stmt) -> list[dict]:
+        connection = session.connection()
+        compiled = stmt.compile(dialect=connection.dialect)
+        result = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar_one()
+        return _plan_nodes(result[0]["Plan"])
+
+    def _assert_uses_index(self, nodes: list[dict], table: str, index: str) -> None:
+        assert not [node for node in nodes if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == table], nodes
+        assert index in {node.get("Index Name") for node in nodes}, nodes
+
+    def test_history_page_uses_chat_index(self, session, seeded):
+        """Newest page and cursor pages of a chat's history."""
+        chat_id, _ = seeded
+        base = select(ChatMessage, User.username).outerjoin(User, ChatMessage.user_id == User.id).filter(ChatMessage.chat_id == chat_id)
+
+        newest = base.order_by(ChatMessage.sent_at.desc(), ChatMessage.id.desc()).limit(51)
+        self._assert_uses_index(self._explain(session, newest), "messages", "ix_messages_chat_id_sent_at_id")
+
+        cursor = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=30), 1
+        older = base.filter(tuple_(ChatMessage.sent_at, ChatMessage.id) < cursor).order_by(ChatMessage.sent_at.desc(), ChatMessage.id.desc()).limit(51)
+        self._assert_uses_index(self._explain(session, older), "messages", "ix_messages_chat_id_sent_at_id")
+
+    def test_profile_message_count_uses_user_index(self, session, seeded):
+        """Message count on the profile page."""
+        _, user_id = seeded
+        stmt = select(func.count(ChatMessage.user_id)).filter(ChatMessage.user_id == user_id)
+        self._assert_uses_index(self._explain(session, stmt), "messages", "ix_messages_user_id")
+
+    def test_analytics_time_window_uses_sent_at_index(self, session, seeded):
+        """Active users and messages of the last day on the admin dashboard."""
+        yesterday = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=1)
+        stmt = select(func.count(func.distinct(ChatMessage.user_id))).filter(ChatMessage.sent_at >= yesterday)
+        self._assert_uses_index(self._explain(session, stmt), "messages", "ix_messages_sent_at")
+
+    def test_chat_members_list_uses_chat_index(self, session, seeded):
+        """Member list of a chat without banned users."""
+        chat_id, _ = seeded
+        stmt = select(User.id, User.username, ChatMember.is_moderator).join(ChatMember, User.id == ChatMember.user_id).filter(ChatMember.chat_id == chat_id, ChatMember.is_banned == False)
+        self._assert_uses_index(self._explain(session, stmt), "chat_members", "ix_chat_members_chat_id_is_banned")
+
+    def test_user_chats_uses_primary_key(self, session, seeded):
+        """Chat list of a user is served by the (user_id, chat_id) primary key."""
+        _, user_id = seeded
+        stmt = select(ChatMember.chat_id).filter(ChatMember.user_id == user_id)
+        self._assert_uses_index(self._explain(session, stmt), "chat_members", "chat_members_pkey")
+
+    def test_unread_counts_use_history_index(self, session, seeded):
+        """Unread counts of all chats of a user in one query."""
+        _, user_id = seeded
+        stmt = ChatMember._unread_counts_stmt(user_id, 100)
+        self._assert_uses_index(self._explain(session, stmt), "messages", "ix_messages_chat_id_sent_at_id")
+
+    def test_message_search_uses_gin_index(self, session, seeded):
+        """Full-text search for a rare word across many chats."""
+        # The seeded messages share one word, which leaves the planner without useful tsvector statistics: a
+        # sequential scan of 50k rows may look as cheap as the index, so only check that the index applies
+        session.execute(text("SET LOCAL enable_seqscan = off"))
+        chat_ids = select(ChatMember.chat_id).filter(ChatMember.is_banned == False).distinct()
+        stmt = ChatMessage._search_stmt("12345", chat_ids, 50, None)
+        self._assert_uses_index(self._explain(session, stmt), "messages", "ix_messages_search_vector")
+
+    def test_user_prefix_search_uses_lower_username_index(self, session, seeded):
+        """Autocomplete on a username prefix."""
+        stmt = User._prefix_search_stmt("IDX_USER_12").limit(10)
+        self._assert_uses_index(self._explain(session, stmt), "users", "ix_users_username_lower")
+
+    def test_user_substring_search_uses_trigram_index(self, session, seeded):
+        """Substring search for usernames, where pg_trgm is installed."""
+        if not session.execute(text("SELECT to_regclass('ix_users_username_trgm') IS NOT NULL")).scalar_one():
+            pytest.skip("pg_trgm is not available on this server")
+        stmt = User._substring_search_stmt("user_123").limit(10)
+        self._assert_uses_index(self._explain(session, stmt), "users", "ix_users_username_trgm")
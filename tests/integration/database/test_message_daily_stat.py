@@ -0,0 +1,65 @@
+import datetime
+
+from sqlalchemy import delete, select, update
+
+from python_chat.database.models import Chat, ChatMessage, MessageDailyStat, User
+
+DAY = datetime.date(2025, 3, 14)
+
+
+def _at(hour: int, minute: int = 0) -> datetime.datetime:
+    return datetime.datetime.combine(DAY, datetime.time(hour, minute), tzinfo=datetime.UTC)
+
+
+def _counts(session, chat_id: int) -> dict[tuple[int, int | None], int]:
+    rows = session.execute(select(MessageDailyStat.hour, MessageDailyStat.user_id, MessageDailyStat.message_count).filter(MessageDailyStat.chat_id == chat_id, MessageDailyStat.day == DAY))
+    return {(hour, user_id): count for hour, user_id, count in rows}
+
+
+class TestMessageDailyStat:
+    """Test suite for the message_daily_stats rollup."""
+
+    def _chat_and_user(self, session) -> tuple[Chat, User]:
+        chat = Chat(name="Rollup Chat", is_group=True)
+        user = User(username="rollupuser")
+        user.set_password("testpass")
+        session.add_all([chat, user])
+        session.flush()
+        return chat, user
+
+    def test_inserts_are_counted_per_hour_and_author(self, session):
+        """Test that single and batched inserts are added to the bucket of their UTC hour."""
+        chat, user = self._chat_and_user(session)
+        session.add(ChatMessage(chat_id=chat.id, user_id=user.id, content="first", sent_at=_at(9, 5)))
+        session.flush()
+        session.add_all([ChatMessage(chat_id=chat.id, user_id=user.id, content=str(i), sent_at=_at(9, 30 + i)) for i in range(3)])
+        session.add(ChatMessage(chat_id=chat.id, user_id=None, content="system", sent_at=_at(17)))
+        session.flush()
+
+        assert _counts(session, chat.id) == {(9, user.id): 4, (17, None): 1}
+
+    def test_deletes_are_subtracted(self, session):
+        """Test that deleting messages decrements their buckets."""
+        chat, user = self._chat_and_user(session)
+        session.add_all([ChatMessage(chat_id=chat.id, user_id=user.id, content=str(i), sent_at=_at(12)) for i in range(3)])
+        session.flush()
+        session.execute(delete(ChatMessage).filter(ChatMessage.chat_id == chat.id, ChatMessage.content != "0"))
+
+        assert _counts(session, chat.id) == {(12, user.id): 1}
+
+    def test_rebuild_day_repairs_drift(self, session):
+        """Test that rebuilding a day recounts it from messages and leaves other days alone."""
+        chat, user = self._chat_and_user(session)
+        session.add_all(
+            [ChatMessage(chat_id=chat.id, user_id=user.id, content="a", sent_at=_at(8)), ChatMessage(chat_id=chat.id, user_id=user.id, content="b", sent_at=_at(8) + datetime.timedelta(days=1))]
+        )
+        session.flush()
+        session.execute(update(MessageDailyStat).filter(MessageDailyStat.chat_id == chat.id).values(message_count=42))
+        session.add(MessageDailyStat(day=DAY, hour=3, chat_id=chat.id, user_id=user.id, message_count=5))
+        session.flush()
+
+        MessageDailyStat.rebuild_day(session.connection(), DAY)
+
+        assert _counts(session, chat.id) == {(8, user.id): 1}
+        next_day = session.execute(select(MessageDailyStat.message_count).filter(MessageDailyStat.chat_id == chat.id, MessageDailyStat.day == DAY + datetime.timedelta(days=1))).scalar_one()
+        assert next_day == 42
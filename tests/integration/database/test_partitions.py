@@ -0,0 +1,168 @@
+import datetime
+import json
+import uuid
+from collections.abc import Generator
+
+import pytest
+from sqlalchemy import Engine, create_engine, func, insert, select, text
+from sqlalchemy.engine import make_url
+
+from python_chat.database import db
+from python_chat.database.counters import counter_mismatches
+from python_chat.database.models import Chat, ChatMessage, MessageDailyStat, User
+from python_chat.database.partitions import DEFAULT_PARTITION, convert_messages_to_partitioned, create_partitioned_messages, ensure_message_partitions, is_partitioned, message_partitions
+
+PARTITIONS_DATABASE = "python_chat_partitions"
+TODAY = datetime.date(2025, 11, 15)
+
+
+def _utc(year: int, month: int, day: int) -> datetime.datetime:
+    return datetime.datetime(year, month, day, 12, tzinfo=datetime.UTC)
+
+
+@pytest.fixture(scope="module")
+def partitions_engine(app) -> Generator[Engine]:
+    """An engine on a database of its own, so messages can be recreated as partitioned."""
+    primary_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    admin = create_engine(primary_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {PARTITIONS_DATABASE}"))
+        conn.execute(text(f"CREATE DATABASE {PARTITIONS_DATABASE}"))
+    engine = create_engine(primary_url.set(database=PARTITIONS_DATABASE))
+    yield engine
+
+    engine.dispose()
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {PARTITIONS_DATABASE}"))
+    admin.dispose()
+
+
+@pytest.fixture
+def empty_engine(partitions_engine) -> Engine:
+    """The partitions database without any tables."""
+    with partitions_engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    return partitions_engine
+
+
+@pytest.fixture
+def partitioned_engine(empty_engine) -> tuple[Engine, int, int]:
+    """A partitioned messages table with partitions around TODAY, a user and a chat."""
+    with empty_engine.begin() as conn:
+        create_partitioned_messages(conn)
+        ensure_message_partitions(conn, months_ahead=2, today=TODAY)
+        user_id = conn.execute(insert(User).values(username="partitioned", password_hash="x", is_admin=False, is_blocked=False).returning(User.id)).scalar_one()
+        chat_id = conn.execute(insert(Chat).values(name="Partitioned", is_group=True).returning(Chat.id)).scalar_one()
+    return empty_engine, user_id, chat_id
+
+
+def _partition_of(conn, message_id: int) -> str:
+    return conn.execute(text("SELECT tableoid::regclass::text FROM messages WHERE id = :id"), {"id": message_id}).scalar_one()
+
+
+def _scanned_relations(conn, stmt) -> set[str]:
+    plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + str(stmt.compile(conn, compile_kwargs={"literal_binds": True})))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    relations = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return relations
+
+
+class TestMessagePartitions:
+    """Test suite for the monthly partitions of messages."""
+
+    def test_partitions_are_created_ahead(self, partitioned_engine):
+        """Test that the current and the next months get partitions, once."""
+        engine, _, _ = partitioned_engine
+        with engine.begin() as conn:
+            assert is_partitioned(conn)
+            assert message_partitions(conn) == [DEFAULT_PARTITION, "messages_p2025_11", "messages_p2025_12", "messages_p2026_01"]
+            assert ensure_message_partitions(conn, months_ahead=2, today=TODAY) == []
+
+    def test_rows_go_to_the_partition_of_their_month(self, partitioned_engine):
+        """Test that ORM inserts land in the monthly partition, and out of range rows in the default one."""
+        engine, user_id, chat_id = partitioned_engine
+        with engine.begin() as conn:
+            inside, outside = conn.execute(
+                insert(ChatMessage).returning(ChatMessage.id),
+                [
+                    {"chat_id": chat_id, "user_id": user_id, "content": "inside", "sent_at": _utc(2025, 12, 31)},
+                    {"chat_id": chat_id, "user_id": user_id, "content": "outside", "sent_at": _utc(2024, 3, 1)},
+                ],
+            ).scalars()
+            assert _partition_of(conn, inside) == "messages_p2025_12"
+            assert _partition_of(conn, outside) == DEFAULT_PARTITION
+
+    def test_maintenance_moves_rows_out_of_the_default_partition(self, partitioned_engine):
+        """Test that a month found in the default partition gets its partition and keeps its rows."""
+        engine, user_id, chat_id = partitioned_engine
+        with engine.begin() as conn:
+            message_id = conn.execute(insert(ChatMessage).values(chat_id=chat_id, user_id=user_id, content="late", sent_at=_utc(2026, 3, 2)).returning(ChatMessage.id)).scalar_one()
+            assert ensure_message_partitions(conn, months_ahead=2, today=TODAY) == ["messages_p2026_03"]
+            assert _partition_of(conn, message_id) == "messages_p2026_03"
+            assert conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar_one() == 0
+
+    def test_time_bounded_queries_are_pruned(self, partitioned_engine):
+        """Test that a history page below a cursor and a date range scan only the partitions they cover."""
+        engine, _, chat_id = partitioned_engine
+        cursor_sent_at = _utc(2025, 11, 20)
+        page = ChatMessage._page_stmt(chat_id, 50, newest_first=True, cursor_id=1, cursor_sent_at=cursor_sent_at)
+        month = select(ChatMessage.id).filter(ChatMessage.sent_at >= _utc(2025, 12, 1), ChatMessage.sent_at < _utc(2025, 12, 8))
+        with engine.connect() as conn:
+            assert _scanned_relations(conn, page) - {"users"} == {"messages_p2025_11", DEFAULT_PARTITION}
+            assert _scanned_relations(conn, month) == {"messages_p2025_12"}
+
+    def test_retried_sends_are_deduplicated(self, partitioned_engine):
+        """Test that the idempotent insert works without a unique index on the parent table."""
+        engine, user_id, chat_id = partitioned_engine
+        client_msg_id = uuid.uuid4()
+        with engine.begin() as conn:
+            first = conn.execute(ChatMessage._insert_idempotent_stmt(user_id, chat_id, "once", client_msg_id)).scalar_one_or_none()
+            retry = conn.execute(ChatMessage._insert_idempotent_stmt(user_id, chat_id, "once", client_msg_id)).scalar_one_or_none()
+            assert first is not None
+            assert retry is None
+            assert conn.execute(ChatMessage._existing_stmt(user_id, client_msg_id)).scalar_one() == first
+
+    def test_moved_rows_are_searchable(self, partitioned_engine):
+        """Test that the generated search vector and its index carry over to partitions made by maintenance."""
+        engine, user_id, chat_id = partitioned_engine
+        with engine.begin() as conn:
+            conn.execute(insert(ChatMessage).values(chat_id=chat_id, user_id=user_id, content="quarterly report", sent_at=_utc(2026, 3, 2)))
+            ensure_message_partitions(conn, months_ahead=2, today=TODAY)
+            assert [row.headline for row in conn.execute(ChatMessage._search_stmt("report", [chat_id], 10, None))] == ["quarterly \ue000report\ue001"]
+            indexes = conn.execute(text("SELECT indexdef FROM pg_indexes WHERE tablename = 'messages_p2026_03'")).scalars().all()
+            assert any("gin (search_vector)" in indexdef for indexdef in indexes)
+
+    def test_rollup_counts_each_message_once(self, partitioned_engine):
+        """Test that the rollup and counter triggers fire on the partitioned table, and moving rows between partitions does not count them again."""
+        engine, user_id, chat_id = partitioned_engine
+        with engine.begin() as conn:
+            conn.execute(insert(ChatMessage), [{"chat_id": chat_id, "user_id": user_id, "content": str(day), "sent_at": _utc(2026, 3, day)} for day in (2, 3)])
+            ensure_message_partitions(conn, months_ahead=2, today=TODAY)
+            assert conn.execute(select(func.sum(MessageDailyStat.message_count)).filter(MessageDailyStat.chat_id == chat_id)).scalar_one() == 2
+            assert counter_mismatches(conn) == []
+
+    def test_plain_table_is_converted(self, empty_engine):
+        """Test that an existing table becomes the first partition and ids continue after its rows."""
+        with empty_engine.begin() as conn:
+            db.metadata.create_all(conn, tables=[User.__table__, Chat.__table__, ChatMessage.__table__])
+            chat_id = conn.execute(insert(Chat).values(name="Legacy", is_group=True).returning(Chat.id)).scalar_one()
+            old_id = conn.execute(insert(ChatMessage).values(chat_id=chat_id, content="old", sent_at=_utc(2025, 6, 10)).returning(ChatMessage.id)).scalar_one()
+
+            assert convert_messages_to_partitioned(conn) == "messages_legacy"
+            assert ensure_message_partitions(conn, months_ahead=0, today=TODAY) == ["messages_p2025_11"]
+            new_id = conn.execute(insert(ChatMessage).values(chat_id=chat_id, content="new", sent_at=_utc(2025, 11, 16)).returning(ChatMessage.id)).scalar_one()
+            assert conn.execute(select(MessageDailyStat.day, MessageDailyStat.message_count)).all() == [(datetime.date(2025, 11, 16), 1)]
+
+            assert new_id > old_id
+            assert _partition_of(conn, old_id) == "messages_legacy"
+            assert _partition_of(conn, new_id) == "messages_p2025_11"
+            with pytest.raises(ValueError, match="already partitioned"):
+                convert_messages_to_partitioned(conn)
@@ -0,0 +1,128 @@
+from collections.abc import Generator
+
+import pytest
+from flask import Flask
+from flask import session as flask_session
+from sqlalchemy import create_engine, delete, insert, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from python_chat.database import db
+from python_chat.database.models import Chat, User
+from python_chat.database.replicas import RoutingSession, replica_reads, replica_router
+
+REPLICA_DATABASE = "python_chat_replica"
+
+
+@pytest.fixture(scope="module")
+def replica_app(app) -> Generator[Flask]:
+    """An app whose replica is a second database on the same server, with a row the primary lacks."""
+    primary_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    replica_url = primary_url.set(database=REPLICA_DATABASE).render_as_string(hide_password=False)
+    admin = create_engine(primary_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {REPLICA_DATABASE}"))
+        conn.execute(text(f"CREATE DATABASE {REPLICA_DATABASE}"))
+    replica = create_engine(replica_url)
+    db.metadata.create_all(replica)
+    with replica.begin() as conn:
+        conn.execute(insert(User).values(username="replica_only", password_hash="x", is_admin=False, is_blocked=False))
+    replica.dispose()
+
+    replica_app = Flask(__name__)
+    replica_app.config.from_mapping(
+        SQLALCHEMY_DATABASE_URI=primary_url.render_as_string(hide_password=False),
+        SQLALCHEMY_REPLICA_URIS=[replica_url],
+        REPLICA_LAG_CHECK_SECONDS=60,
+        SECRET_KEY="replicas",
+    )
+    replica_router.init_app(replica_app)
+    db.init_app(replica_app)
+    yield replica_app
+
+    with replica_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app added a metadata for the bind to the shared extension
+    db.metadatas.pop("replica_0", None)
+    replica_router.init_app(app)
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {REPLICA_DATABASE}"))
+    admin.dispose()
+
+
+@pytest.fixture
+def routing_session(replica_app) -> Generator[RoutingSession]:
+    """A db.session-like session of the replica app with fresh router state."""
+    replica_router.clear()
+    with replica_app.app_context(), RoutingSession(db) as session:
+        yield session
+
+
+def _replica_only_user(session: RoutingSession) -> User | None:
+    return session.execute(select(User).filter(User.username == "replica_only")).scalar_one_or_none()
+
+
+class TestReplicaRouting:
+    """Test suite for read-replica routing."""
+
+    def test_reads_in_scope_go_to_a_replica(self, routing_session):
+        """Test that only SELECTs in replica_reads scopes see the replica."""
+        assert _replica_only_user(routing_session) is None
+        with replica_reads():
+            assert _replica_only_user(routing_session) is not None
+        assert replica_router.routed == {"replica": 1, "primary": 0}
+
+    def test_writes_in_scope_go_to_the_primary(self, routing_session, replica_app):
+        """Test that an ORM write inside a replica scope is flushed to the primary."""
+        with replica_reads():
+            chat = Chat(name="Written in a replica scope", is_group=True)
+            routing_session.add(chat)
+            routing_session.commit()
+        try:
+            with db.engines[None].connect() as conn:
+                assert conn.execute(select(Chat.id).filter(Chat.id == chat.id)).scalar_one_or_none() == chat.id
+            with db.engines["replica_0"].connect() as conn:
+                assert conn.execute(select(Chat.id).filter(Chat.id == chat.id)).scalar_one_or_none() is None
+        finally:
+            routing_session.execute(delete(Chat).filter(Chat.id == chat.id))
+            routing_session.commit()
+
+    def test_reads_follow_the_users_own_writes(self, routing_session, replica_app):
+        """Test that a user reads from the primary right after a commit, and other users do not."""
+        with replica_app.test_request_context():
+            flask_session["_user_id"] = "41"
+            chat_id = routing_session.execute(insert(Chat).values(name="Read your writes", is_group=True).returning(Chat.id)).scalar_one()
+            routing_session.commit()
+            with replica_reads():
+                assert _replica_only_user(routing_session) is None
+        try:
+            with replica_app.test_request_context():
+                flask_session["_user_id"] = "42"
+                with replica_reads():
+                    assert _replica_only_user(routing_session) is not None
+        finally:
+            routing_session.execute(delete(Chat).filter(Chat.id == chat_id))
+            routing_session.commit()
+
+    def test_lagging_replica_falls_back_to_the_primary(self, routing_session, monkeypatch):
+        """Test that a replica further behind than REPLICA_MAX_LAG_SECONDS is not used."""
+        monkeypatch.setattr(replica_router, "measure_lag", lambda engine: replica_router.max_lag + 1)
+        with replica_reads():
+            assert _replica_only_user(routing_session) is None
+        assert replica_router.lags == {"replica_0": replica_router.max_lag + 1}
+        assert replica_router.routed == {"replica": 0, "primary": 1}
+
+    def test_unreachable_replica_falls_back_to_the_primary(self, routing_session, monkeypatch):
+        """Test that a replica failing its lag check is skipped until the next check."""
+        calls = []
+
+        def fail(engine):
+            calls.append(engine)
+            raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+        monkeypatch.setattr(replica_router, "measure_lag", fail)
+        with replica_reads():
+            assert _replica_only_user(routing_session) is None
+            assert _replica_only_user(routing_session) is None
+        assert len(calls) == 1
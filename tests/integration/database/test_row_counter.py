@@ -0,0 +1,66 @@
+from sqlalchemy import delete, tuple_, update
+
+from python_chat.database.counters import counter_mismatches
+from python_chat.database.models import Chat, ChatMember, ChatMessage, RowCounter, User
+from python_chat.database.models.row_counter import TABLE_KEY
+
+
+class TestRowCounter:
+    """Test suite for the maintained row counters."""
+
+    def _chat_and_users(self, session) -> tuple[Chat, User, User]:
+        chat = Chat(name="Counted Chat", is_group=True)
+        users = [User(username=f"counted{i}") for i in range(2)]
+        for user in users:
+            user.set_password("testpass")
+        session.add_all([chat, *users])
+        session.flush()
+        session.add_all([ChatMember(chat_id=chat.id, user_id=user.id) for user in users])
+        session.flush()
+        return chat, users[0], users[1]
+
+    def test_inserts_and_deletes_are_counted(self, session):
+        """Test that table, chat and user counters follow inserts and deletes."""
+        before = RowCounter.get(session, ("users", TABLE_KEY), ("chats", TABLE_KEY), ("messages", TABLE_KEY))
+        chat, author, reader = self._chat_and_users(session)
+        session.add_all([ChatMessage(chat_id=chat.id, user_id=author.id, content=str(i)) for i in range(3)])
+        session.add(ChatMessage(chat_id=chat.id, user_id=None, content="system"))
+        session.flush()
+        session.execute(delete(ChatMessage).filter(ChatMessage.chat_id == chat.id, ChatMessage.content == "0"))
+
+        after = RowCounter.get(session, ("users", TABLE_KEY), ("chats", TABLE_KEY), ("messages", TABLE_KEY))
+        assert after == {("users", TABLE_KEY): before["users", TABLE_KEY] + 2, ("chats", TABLE_KEY): before["chats", TABLE_KEY] + 1, ("messages", TABLE_KEY): before["messages", TABLE_KEY] + 3}
+        assert RowCounter.get(session, ("chat_messages", chat.id), ("chat_members", chat.id), ("user_messages", author.id), ("user_chats", reader.id), ("user_messages", reader.id)) == {
+            ("chat_messages", chat.id): 3,
+            ("chat_members", chat.id): 2,
+            ("user_messages", author.id): 2,
+            ("user_chats", reader.id): 1,
+            ("user_messages", reader.id): 0,
+        }
+
+    def test_deleted_chat_and_user_lose_their_counters(self, session):
+        """Test that deleting a chat or a user removes the counters keyed by it, cascades included."""
+        chat, author, reader = self._chat_and_users(session)
+        session.add(ChatMessage(chat_id=chat.id, user_id=author.id, content="bye"))
+        session.flush()
+        session.execute(delete(User).filter(User.id == author.id))
+        assert RowCounter.get(session, ("chat_members", chat.id), ("chat_messages", chat.id)) == {("chat_members", chat.id): 1, ("chat_messages", chat.id): 1}
+
+        session.execute(delete(Chat).filter(Chat.id == chat.id))
+
+        owned = tuple_(RowCounter.name, RowCounter.key_id).in_([("chat_members", chat.id), ("chat_messages", chat.id), ("user_chats", author.id), ("user_messages", author.id)])
+        assert session.query(RowCounter).filter(owned).count() == 0
+        assert RowCounter.get(session, ("user_chats", reader.id)) == {("user_chats", reader.id): 0}
+        assert counter_mismatches(session.connection()) == []
+
+    def test_drift_is_reported_and_repaired(self, session):
+        """Test that the consistency check finds a wrong counter and a rebuild fixes it."""
+        chat, author, _ = self._chat_and_users(session)
+        session.add(ChatMessage(chat_id=chat.id, user_id=author.id, content="counted"))
+        session.flush()
+        session.execute(update(RowCounter).filter(RowCounter.name == "chat_messages", RowCounter.key_id == chat.id).values(value=7))
+
+        assert counter_mismatches(session.connection()) == [("chat_messages", chat.id, 1, 7)]
+        RowCounter.rebuild(session.connection())
+        assert counter_mismatches(session.connection()) == []
+        assert RowCounter.get(session, ("chat_messages", chat.id)) == {("chat_messages", chat.id): 1}
@@ -35,6 +35,24 @@ def socket_client(session: Session, app: Flask) -> SocketIOTestClient:
     return socket_test_client
 
 
+@pytest.fixture(scope="function")
+def app_socket_client(session: Session, app: Flask, user: User) -> Generator[SocketIOTestClient, Any]:
+    """Create a Socket.IO test client for the app's own SocketIO instance, logged in as the test user."""
+    from python_chat.app import socketio
+
+    # socket_client replaces the app's SocketIO extension with a bare instance
+    app.extensions["socketio"] = socketio
+
+    flask_test_client = app.test_client()
+    with flask_test_client.session_transaction() as sess:
+        sess["_user_id"] = user.id
+
+    socket_test_client = socketio.test_client(app, flask_test_client=flask_test_client)
+    yield socket_test_client
+    if socket_test_client.is_connected():
+        socket_test_client.disconnect()
+
+
 @pytest.fixture(scope="function")
 def user(session: Session) -> User:
     """Create a test user."""
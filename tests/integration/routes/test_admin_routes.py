@@ -1,3 +1,4 @@
+import datetime
 import json
 from collections.abc import Generator
 from typing import Any
@@ -182,6 +183,58 @@ class TestAdminRoutes:
         assert response.status_code == 302
         assert "/login" in response.location
 
+    def test_user_activity_hourly_range(self, admin_authenticated_client: FlaskClient, session: Session, user: User, chat: Chat) -> None:
+        """Test that hourly activity covers every hour of the requested days and can be filtered by chat."""
+        sent_at = datetime.datetime(2025, 2, 3, 14, 20, tzinfo=datetime.UTC)
+        session.add_all([ChatMessage(user_id=user.id, chat_id=chat.id, content=str(i), sent_at=sent_at) for i in range(2)])
+        session.commit()
+
+        response = admin_authenticated_client.get(f"/api/analytics/user-activity?from=2025-02-02&to=2025-02-03&granularity=hour&chat_id={chat.id}")
+        assert response.status_code == 200
+
+        data = json.loads(response.data)
+        assert len(data["labels"]) == 48
+        assert data["labels"][24 + 14] == "03.02 14:00"
+        assert data["datasets"][0]["data"][24 + 14] == 2
+        assert sum(data["datasets"][0]["data"]) == 2
+
+    def test_user_activity_daily_range(self, admin_authenticated_client: FlaskClient, session: Session, user: User, chat: Chat) -> None:
+        """Test that daily activity can be requested for any range and filtered by user."""
+        session.add(ChatMessage(user_id=user.id, chat_id=chat.id, content="old", sent_at=datetime.datetime(2024, 12, 31, 23, 59, tzinfo=datetime.UTC)))
+        session.commit()
+
+        response = admin_authenticated_client.get(f"/api/analytics/user-activity?from=2024-12-01&to=2025-01-31&user_id={user.id}")
+        assert response.status_code == 200
+
+        data = json.loads(response.data)
+        assert len(data["labels"]) == 62
+        assert data["labels"][30] == "31.12"
+        assert data["datasets"][0]["data"][30] == 1
+        assert data["from"] == "2024-12-01"
+        assert data["to"] == "2025-01-31"
+
+    @pytest.mark.parametrize(
+        "query",
+        ["granularity=week", "from=yesterday", "from=2025-02-03&to=2025-02-01", "from=2025-01-01&to=2025-03-01&granularity=hour"],
+    )
+    def test_user_activity_invalid_range(self, admin_authenticated_client: FlaskClient, query: str) -> None:
+        """Test that unknown granularities, malformed or reversed dates and too many buckets are rejected."""
+        response = admin_authenticated_client.get(f"/api/analytics/user-activity?{query}")
+        assert response.status_code == 400
+
+    def test_chat_activity_date_range(self, admin_authenticated_client: FlaskClient, session: Session, user: User, chat: Chat) -> None:
+        """Test that chat activity counts only the messages of the requested days."""
+        session.add_all(
+            [
+                ChatMessage(user_id=user.id, chat_id=chat.id, content="in", sent_at=datetime.datetime(2025, 2, 3, 10, tzinfo=datetime.UTC)),
+                ChatMessage(user_id=user.id, chat_id=chat.id, content="out", sent_at=datetime.datetime(2025, 2, 4, 10, tzinfo=datetime.UTC)),
+            ]
+        )
+        session.commit()
+
+        data = json.loads(admin_authenticated_client.get("/api/analytics/chat-activity?from=2025-02-01&to=2025-02-03").data)
+        assert data["datasets"][0]["data"][data["labels"].index(chat.name)] == 1
+
     def test_admin_required_decorator(self, authenticated_client: FlaskClient) -> None:
         """Test that the admin_required decorator blocks non-admin users from all admin routes."""
         # Test all admin endpoints
@@ -190,3 +243,42 @@ class TestAdminRoutes:
         for endpoint in admin_endpoints:
             response = authenticated_client.get(endpoint)
             assert response.status_code == 403
+
+    def test_metrics_for_admin(self, admin_authenticated_client: FlaskClient) -> None:
+        """Test that admins can scrape request, query and gauge metrics."""
+        admin_authenticated_client.get("/api/analytics/overview")
+
+        response = admin_authenticated_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        text = response.get_data(as_text=True)
+        assert 'http_request_duration_seconds_count{endpoint="admin.get_analytics_overview",method="GET",status="200"} ' in text
+        assert "db_query_duration_seconds_count " in text
+        assert "socketio_connected_sockets " in text
+        assert 'db_pool_connections{state="checkedout"}' in text
+
+    def test_metrics_unauthorized(self, authenticated_client: FlaskClient, test_client: FlaskClient) -> None:
+        """Test that regular and anonymous users cannot scrape metrics."""
+        assert authenticated_client.get("/metrics").status_code == 403
+        assert test_client.get("/metrics").status_code == 403
+
+    def test_metrics_with_token(self, app: Flask, test_client: FlaskClient, monkeypatch) -> None:
+        """Test that a scraper can authenticate with the METRICS_TOKEN bearer token."""
+        monkeypatch.setitem(app.config, "METRICS_TOKEN", "scrape-secret")
+
+        assert test_client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+        response = test_client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        assert response.status_code == 200
+        assert "# TYPE http_request_duration_seconds histogram" in response.get_data(as_text=True)
+
+    def test_query_profile(self, admin_authenticated_client: FlaskClient) -> None:
+        """Test that admins can see the query profiler report."""
+        assert admin_authenticated_client.get("/admin/queries").status_code == 200
+        response = admin_authenticated_client.get("/api/admin/query-profile")
+        assert response.status_code == 200
+        assert set(json.loads(response.data)) == {"enabled", "slow_query_ms", "units", "statements", "slow_queries"}
+
+    def test_query_profile_unauthorized(self, authenticated_client: FlaskClient) -> None:
+        """Test that regular users cannot see the query profiler report."""
+        assert authenticated_client.get("/admin/queries").status_code == 403
+        assert authenticated_client.get("/api/admin/query-profile").status_code == 403
@@ -0,0 +1,177 @@
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Generator
+
+import pytest
+import requests
+import socketio
+from sqlalchemy import delete, insert, select
+from werkzeug.security import generate_password_hash
+
+from python_chat.asgi import async_database_url
+from python_chat.database import db
+from python_chat.database.models import Chat, ChatMember, ChatMessage, User
+from python_chat.database.models.chat_member import UNREAD_LIMIT
+
+SERVER = """
+import sys
+import uvicorn
+from python_chat.asgi import create_asgi_app
+
+app = create_asgi_app({"SQLALCHEMY_DATABASE_URI": sys.argv[1], "SECRET_KEY": "asgi", "WTF_CSRF_ENABLED": False, "RATE_LIMIT_ENABLED": False, "READ_MARK_FLUSH_MS": 50})
+uvicorn.run(app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning", timeout_graceful_shutdown=1)
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_async_database_url():
+    """The sync driver is swapped for asyncpg, keeping credentials and query parameters."""
+    assert async_database_url("postgresql+psycopg2://user:secret@db:5432/chat?sslmode=disable") == "postgresql+asyncpg://user:secret@db:5432/chat?sslmode=disable"
+    assert async_database_url("postgresql://postgres@localhost") == "postgresql+asyncpg://postgres@localhost"
+
+
+class TestAsgiServer:
+    """The ASGI entry point serves the same events and REST API as the eventlet one."""
+
+    @pytest.fixture
+    def chat_users(self, app) -> Generator[tuple[int, int, int]]:
+        """Committed moderator, member and chat, visible to the server process."""
+        with app.app_context(), db.engine.begin() as conn:
+            user_ids = [
+                conn.execute(insert(User).values(username=name, password_hash=generate_password_hash("secret"), is_admin=False, is_blocked=False).returning(User.id)).scalar_one()
+                for name in ("asgi_alice", "asgi_bob")
+            ]
+            chat_id = conn.execute(insert(Chat).values(name="ASGI", is_group=True).returning(Chat.id)).scalar_one()
+            conn.execute(insert(ChatMember), [{"chat_id": chat_id, "user_id": user_id, "is_moderator": user_id == user_ids[0], "is_banned": False} for user_id in user_ids])
+        yield chat_id, user_ids[0], user_ids[1]
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(delete(Chat).filter(Chat.id == chat_id))
+            conn.execute(delete(User).filter(User.id.in_(user_ids)))
+
+    @pytest.fixture
+    def server(self, app) -> Generator[str]:
+        """An ASGI server process."""
+        port = _free_port()
+        process = subprocess.Popen([sys.executable, "-c", SERVER, app.config["SQLALCHEMY_DATABASE_URI"], str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        try:
+
+            def up() -> bool:
+                try:
+                    return requests.get(f"{url}/login", timeout=1).status_code == 200
+                except requests.ConnectionError:
+                    return False
+
+            assert _wait_until(up, timeout=30)
+            yield url
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def _connect(self, url: str, username: str) -> tuple[socketio.Client, requests.Session, dict[str, list]]:
+        http = requests.Session()
+        http.post(f"{url}/login", data={"username": username, "password": "secret"}, timeout=5)
+        client = socketio.Client(http_session=http)
+        events: dict[str, list] = {"receive_message": [], "joined_chat": [], "banned_from_chat": [], "online_users": []}
+        for name, received in events.items():
+            client.on(name, received.append)
+        client.connect(url, transports=["polling"])
+        return client, http, events
+
+    def test_unauthenticated_connection_is_rejected(self, server):
+        client = socketio.Client(reconnection=False)
+        with pytest.raises(socketio.exceptions.ConnectionError):
+            client.connect(server, transports=["polling"])
+
+    def test_messages_and_rest_emits(self, app, chat_users, server):
+        chat_id, alice_id, bob_id = chat_users
+        alice, alice_http, alice_events = self._connect(server, "asgi_alice")
+        bob, _, bob_events = self._connect(server, "asgi_bob")
+        try:
+            assert _wait_until(lambda: alice_events["online_users"] and bob_events["online_users"])
+            alice.emit("join", {"chat_id": chat_id})
+            bob.emit("join", {"chat_id": chat_id})
+            assert _wait_until(lambda: alice_events["joined_chat"] and bob_events["joined_chat"])
+
+            ack = alice.call("send_message", {"chat_id": chat_id, "message": "Hello over ASGI", "client_msg_id": "6f1c5f9e-4a8c-4a55-9a56-1a9b2d3c4e5f"}, timeout=10)
+            retry = alice.call("send_message", {"chat_id": chat_id, "message": "Hello over ASGI", "client_msg_id": "6f1c5f9e-4a8c-4a55-9a56-1a9b2d3c4e5f"}, timeout=10)
+            assert ack["status"] == "ok" and retry["message_id"] == ack["message_id"]
+            assert _wait_until(lambda: bob_events["receive_message"])
+            assert [message["message_id"] for message in bob_events["receive_message"]] == [ack["message_id"]]
+            with app.app_context(), db.engine.connect() as conn:
+                assert conn.execute(select(ChatMessage.content).filter(ChatMessage.id == ack["message_id"])).scalar_one() == "Hello over ASGI"
+
+            # Rejoin replay goes through the async history query
+            later = alice.call("send_message", {"chat_id": chat_id, "message": "Missed it?"}, timeout=10)
+            bob.emit("join", {"chat_id": chat_id, "last_message_id": ack["message_id"]})
+            assert _wait_until(lambda: len(bob_events["joined_chat"]) == 2)
+            assert [message["id"] for message in bob_events["joined_chat"][1]["missed_messages"]] == [later["message_id"]]
+
+            # The REST API is served by Flask; its emit and kick reach the AsyncServer's clients
+            response = alice_http.post(f"{server}/api/chat/{chat_id}/ban", json={"user_id": bob_id, "reason": "test"}, timeout=5)
+            assert response.status_code == 200
+            assert _wait_until(lambda: bob_events["banned_from_chat"])
+            alice.call("send_message", {"chat_id": chat_id, "message": "Bob is gone"}, timeout=10)
+            assert _wait_until(lambda: len(alice_events["receive_message"]) == 3)
+            assert len(bob_events["receive_message"]) == 2
+        finally:
+            alice.disconnect()
+            bob.disconnect()
+
+    def test_mark_read_moves_read_pointer(self, app, chat_users, server):
+        chat_id, alice_id, bob_id = chat_users
+        alice, _, _ = self._connect(server, "asgi_alice")
+        bob, _, _ = self._connect(server, "asgi_bob")
+        try:
+            sent = [alice.call("send_message", {"chat_id": chat_id, "message": f"Unread {i}"}, timeout=10)["message_id"] for i in range(2)]
+
+            assert bob.call("mark_read", {"chat_id": chat_id, "message_id": sent[0]}, timeout=10) == {"status": "ok"}
+            assert bob.call("mark_read", {"chat_id": chat_id + 1, "message_id": sent[0]}, timeout=10) == {"status": "error", "message": "You are not a member of this chat"}
+
+            def pointer() -> int | None:
+                with app.app_context(), db.engine.connect() as conn:
+                    return conn.execute(select(ChatMember.last_read_message_id).filter(ChatMember.chat_id == chat_id, ChatMember.user_id == bob_id)).scalar_one()
+
+            # Written by the server's flush task
+            assert _wait_until(lambda: pointer() == sent[0])
+            with app.app_context(), db.engine.connect() as conn:
+                assert dict(conn.execute(ChatMember._unread_counts_stmt(bob_id, UNREAD_LIMIT)).all()) == {chat_id: 1}
+        finally:
+            alice.disconnect()
+            bob.disconnect()
+
+    def test_rejections_match_the_eventlet_handlers(self, chat_users, server):
+        chat_id, alice_id, bob_id = chat_users
+        alice, _, _ = self._connect(server, "asgi_alice")
+        errors: list[dict] = []
+        alice.on("error", errors.append)
+        alice.on("username_error", errors.append)
+        try:
+            assert alice.call("send_message", {"message": "Nowhere"}, timeout=10) == {"status": "error", "message": "No chat room selected"}
+            assert alice.call("send_message", {"chat_id": chat_id, "message": "Hi", "client_msg_id": "not-a-uuid"}, timeout=10) == {"status": "error", "message": "Invalid client_msg_id"}
+            assert alice.call("mark_read", {"chat_id": chat_id, "message_id": 0}, timeout=10) == {"status": "error", "message": "chat_id and message_id are required"}
+            alice.emit("update_username", {"username": "ab"})
+            assert _wait_until(lambda: len(errors) == 3)
+            assert errors == [{"message": "No chat room selected"}, {"message": "Invalid client_msg_id"}, {"error": "Username must be at least 3 characters"}]
+        finally:
+            alice.disconnect()
@@ -5,7 +5,7 @@ from flask.testing import FlaskClient
 from sqlalchemy.orm import Session
 
 from python_chat.database.models.chat import Chat
-from python_chat.database.models.chat_member import ChatMember
+from python_chat.database.models.chat_member import UNREAD_LIMIT, ChatMember
 from python_chat.database.models.chat_message import ChatMessage
 from python_chat.database.models.user import User
 
@@ -141,6 +141,113 @@ class TestChatRoutes:
 
         assert found_deleted_message, "Message from deleted user was not found in API response"
 
+    def test_get_chat_messages_paginated(self, authenticated_client, chat, user: User, session: Session):
+        """Test walking the history backwards with before_id cursors."""
+        base_time = datetime.now(UTC) - timedelta(hours=1)
+        messages = [ChatMessage(user_id=user.id, chat_id=chat.id, content=f"Message {i}", sent_at=base_time + timedelta(seconds=i)) for i in range(5)]
+        session.add_all(messages)
+        session.commit()
+
+        # The first page is the newest one, in chronological order
+        response = authenticated_client.get(f"/api/messages/{chat.id}?limit=2")
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [msg["content"] for msg in data["messages"]] == ["Message 3", "Message 4"]
+        assert data["has_more"] is True
+        assert data["next_cursor"] == messages[3].id
+
+        response = authenticated_client.get(f"/api/messages/{chat.id}?limit=2&before_id={data['next_cursor']}")
+        data = json.loads(response.data)
+        assert [msg["content"] for msg in data["messages"]] == ["Message 1", "Message 2"]
+        assert data["has_more"] is True
+
+        response = authenticated_client.get(f"/api/messages/{chat.id}?limit=2&before_id={data['next_cursor']}")
+        data = json.loads(response.data)
+        assert [msg["content"] for msg in data["messages"]] == ["Message 0"]
+        assert data["has_more"] is False
+        assert data["next_cursor"] is None
+
+    def test_get_chat_messages_after_id(self, authenticated_client, chat, user: User, session: Session):
+        """Test fetching newer messages with an after_id cursor."""
+        base_time = datetime.now(UTC) - timedelta(hours=1)
+        messages = [ChatMessage(user_id=user.id, chat_id=chat.id, content=f"Message {i}", sent_at=base_time + timedelta(seconds=i)) for i in range(4)]
+        session.add_all(messages)
+        session.commit()
+
+        response = authenticated_client.get(f"/api/messages/{chat.id}?limit=2&after_id={messages[0].id}")
+        data = json.loads(response.data)
+        assert [msg["content"] for msg in data["messages"]] == ["Message 1", "Message 2"]
+        assert data["has_more"] is True
+        assert data["next_cursor"] == messages[2].id
+
+    def test_get_chat_messages_invalid_cursor(self, authenticated_client, chat, chat_message):
+        """Test that cursors from another chat or both cursors at once are rejected."""
+        response = authenticated_client.get(f"/api/messages/{chat.id}?before_id=999999")
+        assert response.status_code == 400
+
+        response = authenticated_client.get(f"/api/messages/{chat.id}?before_id={chat_message.id}&after_id={chat_message.id}")
+        assert response.status_code == 400
+
+    def test_search_chat_messages(self, authenticated_client, chat, chat_member, user: User, session: Session):
+        """Test that search ranks better matches first, highlights them and pages with cursors."""
+        session.add_all(
+            [
+                ChatMessage(user_id=user.id, chat_id=chat.id, content="deploy the <b>deploy</b> script, deploy again"),
+                ChatMessage(user_id=user.id, chat_id=chat.id, content="we should deploy on friday"),
+                ChatMessage(user_id=user.id, chat_id=chat.id, content="nothing to see here"),
+            ]
+        )
+        session.commit()
+
+        response = authenticated_client.get(f"/api/chat/{chat.id}/search?q=deploy&limit=1")
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert len(data["results"]) == 1
+        assert data["results"][0]["highlight"].count("<mark>deploy</mark>") == 3
+        assert "<b>" not in data["results"][0]["highlight"]
+        assert data["has_more"] is True
+
+        response = authenticated_client.get(f"/api/chat/{chat.id}/search?q=deploy&limit=1&before={data['next_cursor']}")
+        data = json.loads(response.data)
+        assert [result["highlight"] for result in data["results"]] == ["we should <mark>deploy</mark> on friday"]
+        assert data["results"][0]["username"] == user.username
+        assert data["has_more"] is False
+        assert data["next_cursor"] is None
+
+    def test_search_chat_messages_escapes_content(self, authenticated_client, chat, chat_member, user: User, session: Session):
+        """Test that message text is HTML-escaped around the highlights."""
+        session.add(ChatMessage(user_id=user.id, chat_id=chat.id, content="fish & chips"))
+        session.commit()
+
+        data = json.loads(authenticated_client.get(f"/api/chat/{chat.id}/search?q=chips").data)
+        assert data["results"][0]["highlight"] == "fish &amp; <mark>chips</mark>"
+
+    def test_search_chat_messages_requires_membership(self, authenticated_client, chat):
+        """Test that only members can search a chat."""
+        response = authenticated_client.get(f"/api/chat/{chat.id}/search?q=hello")
+        assert response.status_code == 403
+
+    def test_search_chat_messages_bad_input(self, authenticated_client, chat, chat_member):
+        """Test that an empty query finds nothing and a malformed cursor is rejected."""
+        response = authenticated_client.get(f"/api/chat/{chat.id}/search?q=%20")
+        assert json.loads(response.data) == {"results": [], "has_more": False, "next_cursor": None}
+        response = authenticated_client.get(f"/api/chat/{chat.id}/search?q=hello&before=nope")
+        assert response.status_code == 400
+
+    def test_search_messages_across_chats(self, authenticated_client, chat, chat_member, user: User, session: Session):
+        """Test that cross-chat search covers the user's chats only, without chats they are banned from."""
+        banned_chat = Chat(name="Banned", is_group=True)
+        other_chat = Chat(name="Other", is_group=True)
+        session.add_all([banned_chat, other_chat])
+        session.flush()
+        session.add(ChatMember(user_id=user.id, chat_id=banned_chat.id, is_banned=True))
+        for target in (chat, banned_chat, other_chat):
+            session.add(ChatMessage(user_id=user.id, chat_id=target.id, content=f"release notes for {target.name}"))
+        session.commit()
+
+        data = json.loads(authenticated_client.get("/api/search?q=release notes").data)
+        assert [result["chat_id"] for result in data["results"]] == [chat.id]
+
     def test_get_chat_members(self, authenticated_client, chat_member, chat, user: User, session: Session):
         """Test getting list of chat members."""
         # Add another member to the chat
@@ -239,6 +346,26 @@ class TestChatRoutes:
         assert len(data["users"]) == 1  # Should find testuser2 but not the current testuser
         assert data["users"][0]["username"] == "testuser2"
 
+    def test_search_users_ranks_exact_and_prefix_matches_first(self, authenticated_client, session: Session):
+        """Test that substring search lists the exact match, then prefixes, then other matches."""
+        for username in ["xsamx", "samuel", "Sam", "sam_1", "bob", "asam"]:
+            session.add(User(username=username, password_hash="x"))
+        session.commit()
+
+        data = json.loads(authenticated_client.get("/api/search-users?query=sam").data)
+        assert [found["username"] for found in data["users"]] == ["Sam", "sam_1", "samuel", "asam", "xsamx"]
+
+    def test_search_users_prefix_mode(self, authenticated_client, session: Session):
+        """Test that prefix mode skips substring matches and LIKE wildcards in the query are literal."""
+        for username in ["xsamx", "samuel", "sam%", "sam_1"]:
+            session.add(User(username=username, password_hash="x"))
+        session.commit()
+
+        data = json.loads(authenticated_client.get("/api/search-users?query=sam&mode=prefix").data)
+        assert [found["username"] for found in data["users"]] == ["sam%", "sam_1", "samuel"]
+        data = json.loads(authenticated_client.get("/api/search-users?query=sam%25&mode=prefix").data)
+        assert [found["username"] for found in data["users"]] == ["sam%"]
+
     def test_search_users_no_results(self, authenticated_client):
         """Test searching users with query that returns no results."""
         response = authenticated_client.get("/api/search-users?query=nonexistent")
@@ -380,6 +507,19 @@ class TestChatRoutes:
         assert "Test Chat 1" in chat_names
         assert "Test Chat 2" in chat_names
 
+    def test_get_user_chats_unread_counts(self, authenticated_client, session, user, admin_user, chat, chat_member):
+        """Test that the chat list counts messages from others after the read pointer."""
+        messages = [ChatMessage(chat_id=chat.id, user_id=admin_user.id, content=f"Unread {i}") for i in range(3)]
+        session.add_all([*messages, ChatMessage(chat_id=chat.id, user_id=user.id, content="Own")])
+        session.flush()
+        chat_member.last_read_message_id = messages[0].id
+        chat_member.last_read_sent_at = messages[0].sent_at
+        session.commit()
+
+        data = json.loads(authenticated_client.get("/api/chats").data)
+        assert [(item["id"], item["unread"]) for item in data["chats"]] == [(chat.id, 2)]
+        assert data["unread_limit"] == UNREAD_LIMIT
+
     def test_get_user_chats_authentication_required(self, test_client):
         """Test that unauthenticated users cannot get chat list."""
         response = test_client.get("/api/chats")
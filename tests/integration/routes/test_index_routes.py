@@ -1,5 +1,6 @@
 from python_chat.database.models.chat import Chat
 from python_chat.database.models.chat_member import ChatMember
+from python_chat.database.models.chat_message import ChatMessage
 
 
 class TestIndexRoutes:
@@ -50,3 +51,11 @@ class TestIndexRoutes:
         assert response.status_code == 200
         assert b"Group Chat 1" in response.data
         assert b"Direct Message" in response.data
+
+    def test_index_shows_unread_badges(self, authenticated_client, session, admin_user, chat, chat_member):
+        """Test that chats with unread messages get a badge with their count."""
+        session.add_all([ChatMessage(chat_id=chat.id, user_id=admin_user.id, content=f"Unread {i}") for i in range(5)])
+        session.commit()
+
+        response = authenticated_client.get("/")
+        assert b'<span class="unread-badge" title="Unread messages">5</span>' in response.data
@@ -1,10 +1,21 @@
+import uuid
+from datetime import UTC, datetime
+
 import pytest
+from flask import g
 from flask.testing import FlaskClient
 from flask_socketio import SocketIOTestClient
+from sqlalchemy import event
 
 from python_chat.database.models.chat import Chat
+from python_chat.database.models.chat_member import ChatMember
 from python_chat.database.models.chat_message import ChatMessage
 from python_chat.database.models.user import User
+from python_chat.utils.message_writer import PendingMessage, message_writer
+from python_chat.utils.metrics import metrics
+from python_chat.utils.rate_limit import DEFAULT_RATE_LIMITS, rate_limiter
+from python_chat.utils.read_state import read_marker
+from python_chat.utils.typing_state import typing_coalescer
 
 
 class TestSocketEvents:
@@ -29,7 +40,6 @@ class TestSocketEvents:
 
         # Check if we received the expected events after connect
         received = authenticated_socket.get_received()
-        assert any(event["name"] == "user_joined" for event in received)
         assert any(event["name"] == "set_username" for event in received)
         assert any(event["name"] == "online_users" for event in received)
 
@@ -122,3 +132,264 @@ class TestSocketEvents:
         # we can't easily test that event was received
         # In a real test with multiple clients, we'd verify this from another client
         assert authenticated_socket.is_connected()
+
+    def test_join_chat_as_member(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember):
+        """Test that a member can join the chat room."""
+        app_socket_client.get_received()
+        app_socket_client.emit("join", {"chat_id": chat.id})
+
+        received = app_socket_client.get_received()
+        assert [event["args"][0]["status"] for event in received if event["name"] == "joined_chat"] == ["success"]
+
+    def test_join_chat_as_non_member(self, app_socket_client: SocketIOTestClient, chat: Chat):
+        """Test that a non-member can't join the chat room."""
+        app_socket_client.get_received()
+        app_socket_client.emit("join", {"chat_id": chat.id})
+
+        received = app_socket_client.get_received()
+        errors = [event["args"][0]["message"] for event in received if event["name"] == "error"]
+        assert errors == ["You are not a member of this chat"]
+
+    def test_join_chat_after_ban(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, user: User):
+        """Test that a ban is seen by the socket handlers even after membership was cached."""
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        chat.ban_member(user, "spam")
+        app_socket_client.get_received()
+
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        app_socket_client.emit("send_message", {"chat_id": chat.id, "message": "Let me in"})
+
+        received = app_socket_client.get_received()
+        errors = [event["args"][0]["message"] for event in received if event["name"] == "error"]
+        assert errors == ["You are banned from this chat", "You are banned from this chat"]
+        assert not [event for event in received if event["name"] == "receive_message"]
+
+    def test_send_message_skips_membership_queries(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, session):
+        """Test that after joining, sending a message only hits the database for the insert."""
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        chat_id = chat.id
+
+        statements: list[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        connection = session.connection()
+        event.listen(connection, "before_cursor_execute", record)
+        try:
+            app_socket_client.emit("send_message", {"chat_id": chat_id, "message": "Cached"})
+        finally:
+            event.remove(connection, "before_cursor_execute", record)
+
+        assert [statement.split()[0] for statement in statements] == ["INSERT"]
+
+    def test_send_message_goes_through_writer(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, monkeypatch):
+        """Test that with batching enabled the message is broadcast and acked once the batch is written."""
+        written: list[list[PendingMessage]] = []
+
+        def submit(user_id, chat_id, content, on_saved, on_error, client_msg_id=None):
+            # Stands in for the writer task, which runs the batch while the handler waits
+            batch = [PendingMessage(user_id, chat_id, content, datetime.now(UTC), on_saved, on_error, client_msg_id)]
+            written.append(batch)
+            message_writer.write_batch(batch)
+
+        monkeypatch.setattr(message_writer, "enabled", True)
+        monkeypatch.setattr(message_writer, "submit", submit)
+
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        app_socket_client.get_received()
+        acks = [app_socket_client.emit("send_message", {"chat_id": chat.id, "message": content}, callback=True) for content in ("First", "Second")]
+
+        assert len(written) == 2
+        received = [event["args"][0] for event in app_socket_client.get_received() if event["name"] == "receive_message"]
+        assert [payload["message"] for payload in received] == ["First", "Second"]
+        assert [ack["message_id"] for ack in acks] == [payload["message_id"] for payload in received]
+        assert all(ack["status"] == "ok" for ack in acks)
+
+    def test_batched_retry_is_not_broadcast_again(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, monkeypatch):
+        """Test that with batching enabled a retried client message id is acked with the stored id but not broadcast again."""
+
+        def submit(user_id, chat_id, content, on_saved, on_error, client_msg_id=None):
+            message_writer.write_batch([PendingMessage(user_id, chat_id, content, datetime.now(UTC), on_saved, on_error, client_msg_id)])
+
+        monkeypatch.setattr(message_writer, "enabled", True)
+        monkeypatch.setattr(message_writer, "submit", submit)
+
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        app_socket_client.get_received()
+        data = {"chat_id": chat.id, "message": "Batched once", "client_msg_id": str(uuid.uuid4())}
+        first = app_socket_client.emit("send_message", data, callback=True)
+        retry = app_socket_client.emit("send_message", data, callback=True)
+
+        assert first == retry
+        received = [event["args"][0] for event in app_socket_client.get_received() if event["name"] == "receive_message"]
+        assert [payload["message_id"] for payload in received] == [first["message_id"]]
+
+    def test_send_message_is_idempotent(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, session):
+        """Test that a retried client message id is stored and broadcast once, and acked with the same id."""
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        app_socket_client.get_received()
+        client_msg_id = str(uuid.uuid4())
+        data = {"chat_id": chat.id, "message": "Only once", "client_msg_id": client_msg_id}
+
+        first = app_socket_client.emit("send_message", data, callback=True)
+        retry = app_socket_client.emit("send_message", data, callback=True)
+
+        assert first == retry == {"status": "ok", "message_id": first["message_id"], "client_msg_id": client_msg_id}
+        received = [event["args"][0] for event in app_socket_client.get_received() if event["name"] == "receive_message"]
+        assert [(payload["message_id"], payload["client_msg_id"]) for payload in received] == [(first["message_id"], client_msg_id)]
+        assert session.query(ChatMessage).filter_by(content="Only once").count() == 1
+
+    def test_send_message_rejects_invalid_client_id(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember):
+        """Test that a malformed client message id is rejected in the ack."""
+        ack = app_socket_client.emit("send_message", {"chat_id": chat.id, "message": "Hi", "client_msg_id": "not-a-uuid"}, callback=True)
+        assert ack == {"status": "error", "message": "Invalid client_msg_id"}
+
+    def test_ban_kicks_connected_user(self, app, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, user: User, session):
+        """Test that a ban removes the banned user's socket from the chat room."""
+        moderator = User(username="moderator")
+        moderator.set_password("password123")
+        session.add(moderator)
+        session.flush()
+        session.add(ChatMember(user_id=moderator.id, chat_id=chat.id, is_moderator=True))
+        session.commit()
+
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        app_socket_client.get_received()
+
+        # Requests share the test's app context, where Flask-Login cached the socket's user
+        g.pop("_login_user", None)
+        with app.test_client() as moderator_client:
+            with moderator_client.session_transaction() as sess:
+                sess["_user_id"] = moderator.id
+            response = moderator_client.post(f"/api/chat/{chat.id}/ban", json={"user_id": user.id, "reason": "spam"})
+        assert response.status_code == 200
+
+        received = app_socket_client.get_received()
+        assert [event["args"][0] for event in received if event["name"] == "banned_from_chat"] == [{"chat_id": chat.id, "chat_name": chat.name}]
+
+        from python_chat.app import socketio
+
+        sid = socketio.server.manager.sid_from_eio_sid(app_socket_client.eio_sid, "/")
+        rooms = socketio.server.manager.get_rooms(sid, "/")
+        assert f"user:{user.id}" in rooms
+        assert str(chat.id) not in rooms
+
+    def test_presence_deltas(self, app, app_socket_client: SocketIOTestClient, user: User, admin_user: User):
+        """Test that connects send a snapshot once and only first/last tabs produce deltas."""
+        from python_chat.app import socketio
+
+        received = app_socket_client.get_received()
+        assert [event["args"][0] for event in received if event["name"] == "online_users"] == [{"users": ["testuser"]}]
+
+        def connect_as(user_id):
+            # Requests share the test's app context, where Flask-Login cached the last user
+            g.pop("_login_user", None)
+            flask_client = app.test_client()
+            with flask_client.session_transaction() as sess:
+                sess["_user_id"] = user_id
+            return socketio.test_client(app, flask_test_client=flask_client)
+
+        def presence_events():
+            return [(event["name"], event["args"][0]) for event in app_socket_client.get_received() if event["name"].startswith("presence_")]
+
+        second_tab = connect_as(user.id)
+        admin_socket = connect_as(admin_user.id)
+        assert sorted(next(event["args"][0]["users"] for event in admin_socket.get_received() if event["name"] == "online_users")) == ["adminuser", "testuser"]
+        assert presence_events() == [("presence_add", {"username": "adminuser"})]
+
+        second_tab.disconnect()
+        assert presence_events() == []
+        admin_socket.disconnect()
+        assert presence_events() == [("presence_remove", {"username": "adminuser"})]
+
+    def test_typing_is_coalesced(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember):
+        """Test that typing events are recorded for the digest instead of being rebroadcast."""
+        app_socket_client.emit("join", {"chat_id": chat.id})
+        app_socket_client.get_received()
+
+        app_socket_client.emit("typing", {"isTyping": True})
+        assert typing_coalescer.typing_users(chat.id) == ["testuser"]
+        assert not [event for event in app_socket_client.get_received() if event["name"] == "typing"]
+
+        app_socket_client.emit("send_message", {"chat_id": chat.id, "message": "Done typing"})
+        assert typing_coalescer.typing_users(chat.id) == []
+
+    def test_mark_read_is_batched(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, user: User, session, monkeypatch):
+        """Test that mark_read events only record the newest pointer until the batch is flushed."""
+        # Flushed by the test instead of the background task
+        monkeypatch.setattr(read_marker, "_started", True)
+        messages = [ChatMessage(user_id=user.id, chat_id=chat.id, content=f"Read {i}") for i in range(3)]
+        session.add_all(messages)
+        session.commit()
+
+        for message in messages:
+            assert app_socket_client.emit("mark_read", {"chat_id": chat.id, "message_id": message.id}, callback=True) == {"status": "ok"}
+        assert read_marker._pending[user.id, chat.id] == messages[-1].id
+        session.refresh(chat_member)
+        assert chat_member.last_read_message_id is None
+
+        assert read_marker.flush() == 1
+        session.refresh(chat_member)
+        assert chat_member.last_read_message_id == messages[-1].id
+
+    def test_mark_read_requires_membership(self, app_socket_client: SocketIOTestClient, chat: Chat, user: User):
+        """Test that marks for chats the user is not a member of are rejected."""
+        response = app_socket_client.emit("mark_read", {"chat_id": chat.id, "message_id": 1}, callback=True)
+        assert response["status"] == "error"
+        assert (user.id, chat.id) not in read_marker._pending
+
+    def test_rejoin_replays_missed_messages(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, user: User, session):
+        """Test that a join with last_message_id replays only the newer messages."""
+        messages = [ChatMessage(user_id=user.id, chat_id=chat.id, content=f"Message {i}", sent_at=datetime(2025, 1, 1, 12, i, tzinfo=UTC)) for i in range(5)]
+        session.add_all(messages)
+        session.commit()
+        app_socket_client.get_received()
+
+        app_socket_client.emit("join", {"chat_id": chat.id, "last_message_id": messages[2].id})
+
+        joined = next(event["args"][0] for event in app_socket_client.get_received() if event["name"] == "joined_chat")
+        assert joined["reload"] is False
+        assert [message["content"] for message in joined["missed_messages"]] == ["Message 3", "Message 4"]
+
+    def test_rejoin_too_far_behind_asks_for_reload(self, app, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember, user: User, session, monkeypatch):
+        """Test that a client missing more than the replay limit, or with an unknown cursor, is told to reload."""
+        messages = [ChatMessage(user_id=user.id, chat_id=chat.id, content=f"Message {i}", sent_at=datetime(2025, 1, 1, 12, i, tzinfo=UTC)) for i in range(5)]
+        session.add_all(messages)
+        session.commit()
+        monkeypatch.setitem(app.config, "JOIN_REPLAY_LIMIT", 3)
+        app_socket_client.get_received()
+
+        app_socket_client.emit("join", {"chat_id": chat.id, "last_message_id": messages[0].id})
+        app_socket_client.emit("join", {"chat_id": chat.id, "last_message_id": 999999})
+
+        joined = [event["args"][0] for event in app_socket_client.get_received() if event["name"] == "joined_chat"]
+        assert [(data["reload"], data["missed_messages"]) for data in joined] == [(True, []), (True, [])]
+
+    def test_send_message_is_rate_limited(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember):
+        """Test that messages over the user's token bucket are rejected with an error."""
+        rate_limiter.configure({"send_message": (0.001, 2.0)})
+        try:
+            app_socket_client.emit("join", {"chat_id": chat.id})
+            app_socket_client.get_received()
+            acks = [app_socket_client.emit("send_message", {"chat_id": chat.id, "message": f"Spam {i}"}, callback=True) for i in range(3)]
+
+            assert [ack["status"] for ack in acks] == ["ok", "ok", "error"]
+            received = app_socket_client.get_received()
+            assert [event["args"][0]["event"] for event in received if event["name"] == "error"] == ["send_message"]
+            assert rate_limiter.rejections["send_message"] == 1
+        finally:
+            rate_limiter.configure(DEFAULT_RATE_LIMITS)
+
+    def test_handlers_are_timed(self, app_socket_client: SocketIOTestClient, chat: Chat, chat_member: ChatMember):
+        """Test that every registered handler records its duration."""
+
+        def joins() -> float:
+            # Every bucket slot except the trailing sum
+            return sum(metrics.socket_duration._values.get(("join",), [0.0])[:-1])
+
+        before = joins()
+        app_socket_client.emit("join", {"chat_id": chat.id})
+
+        assert joins() == before + 1
+        assert 'socketio_event_duration_seconds_count{event="join"}' in metrics.render()
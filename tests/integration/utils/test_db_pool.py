@@ -0,0 +1,68 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from python_chat.utils.db_pool import async_engine_options, engine_options_from_env, init_db_pool
+
+
+def _app(**config) -> Flask:
+    app = Flask(__name__)
+    app.config.from_mapping(config)
+    return app
+
+
+class TestDatabasePool:
+    """Test suite for the engine options."""
+
+    def test_options_from_env(self):
+        """Test that only the DB_POOL_* variables that are set become options."""
+        environ = {"DB_POOL_SIZE": "20", "DB_MAX_OVERFLOW": "0", "DB_POOL_PRE_PING": "1", "DB_POOL_RECYCLE": ""}
+        assert engine_options_from_env(environ) == {"pool_size": 20, "max_overflow": 0, "pool_pre_ping": True}
+
+    def test_explicit_options_override_the_profile(self):
+        """Test that the pgbouncer profile fills in what SQLALCHEMY_ENGINE_OPTIONS leaves out."""
+        app = _app(DB_POOL_PROFILE="pgbouncer", SQLALCHEMY_ENGINE_OPTIONS={"pool_recycle": 60, "pool_size": 3})
+        assert init_db_pool(app) == {"pool_pre_ping": True, "pool_recycle": 60, "pool_size": 3}
+        assert app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_recycle"] == 60
+
+    def test_default_profile_keeps_sqlalchemy_defaults(self):
+        """Test that nothing is added without a profile or options."""
+        assert init_db_pool(_app()) == {}
+
+    def test_unknown_profile(self):
+        """Test that a mistyped profile is rejected."""
+        with pytest.raises(ValueError, match="DB_POOL_PROFILE"):
+            init_db_pool(_app(DB_POOL_PROFILE="pgbouncr"))
+
+    def test_pgbouncer_requires_a_direct_url_for_listen(self):
+        """Test that LISTEN based backends need a connection that bypasses pgbouncer."""
+        with pytest.raises(ValueError, match="SQLALCHEMY_DIRECT_DATABASE_URI"):
+            init_db_pool(_app(DB_POOL_PROFILE="pgbouncer", PRESENCE_BACKEND="postgres"))
+        init_db_pool(_app(DB_POOL_PROFILE="pgbouncer", PRESENCE_BACKEND="postgres", SQLALCHEMY_DIRECT_DATABASE_URI="postgresql://db/chat"))
+
+    def test_statement_timeout(self, app):
+        """Test that DB_STATEMENT_TIMEOUT_MS is set on every new connection."""
+        options = init_db_pool(_app(DB_STATEMENT_TIMEOUT_MS=1500))
+        engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"], **options)
+        try:
+            with engine.connect() as conn:
+                assert conn.execute(text("SHOW statement_timeout")).scalar_one() == "1500ms"
+        finally:
+            engine.dispose()
+
+    def test_statement_timeout_is_rejected_behind_pgbouncer(self):
+        """Test that the startup option pgbouncer refuses is not sent."""
+        with pytest.raises(ValueError, match="DB_STATEMENT_TIMEOUT_MS"):
+            init_db_pool(_app(DB_POOL_PROFILE="pgbouncer", DB_STATEMENT_TIMEOUT_MS=1500))
+
+    def test_async_options_for_pgbouncer(self):
+        """Test that the asyncpg engine gets the pool options and unique, uncached prepared statements."""
+        app = _app(DB_POOL_PROFILE="pgbouncer", SQLALCHEMY_ENGINE_OPTIONS={"pool_size": 3, "poolclass": object})
+        init_db_pool(app)
+        options = async_engine_options(app)
+        connect_args = options.pop("connect_args")
+
+        assert options == {"pool_pre_ping": True, "pool_recycle": 300, "pool_size": 3}
+        assert connect_args["statement_cache_size"] == 0
+        assert connect_args["prepared_statement_cache_size"] == 0
+        assert connect_args["prepared_statement_name_func"]() != connect_args["prepared_statement_name_func"]()
@@ -0,0 +1,184 @@
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Generator
+
+import eventlet
+import pytest
+import requests
+import socketio
+from sqlalchemy import create_engine, delete, insert, text
+from werkzeug.security import generate_password_hash
+
+from python_chat.database import db
+from python_chat.database.models import Chat, ChatMember, User
+from python_chat.utils.green_db import GreenQueuePool, make_psycopg2_blocking, make_psycopg2_green
+
+# A plain eventlet server, not monkey patched, with an extra event that runs a slow query
+SERVER = """
+import sys
+from sqlalchemy import text
+from python_chat.app import create_app, socketio
+from python_chat.database import db
+
+app = create_app({"SQLALCHEMY_DATABASE_URI": sys.argv[1], "SECRET_KEY": "green", "WTF_CSRF_ENABLED": False, "RATE_LIMIT_ENABLED": False, "DB_GREEN": sys.argv[3] == "1"})
+
+@socketio.on("slow_query")
+def slow_query(seconds):
+    db.session.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+    db.session.rollback()
+    return "done"
+
+socketio.run(app, host="127.0.0.1", port=int(sys.argv[2]))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestGreenDatabase:
+    """Database waits yield to other green threads."""
+
+    def _ticks_during_slow_query(self, app) -> int:
+        ticks = 0
+
+        def ticker():
+            nonlocal ticks
+            while True:
+                eventlet.sleep(0.01)
+                ticks += 1
+
+        def slow_query():
+            with app.app_context(), db.engine.connect() as conn:
+                conn.execute(text("SELECT pg_sleep(0.5)"))
+
+        ticking = eventlet.spawn(ticker)
+        eventlet.sleep(0)
+        try:
+            eventlet.spawn(slow_query).wait()
+        finally:
+            ticking.kill()
+        return ticks
+
+    def test_slow_query_does_not_block_the_hub(self, app):
+        """Test that other green threads keep running while a query waits on Postgres."""
+        make_psycopg2_green()
+        assert self._ticks_during_slow_query(app) >= 20
+
+    def test_blocking_mode_stalls_the_hub(self, app):
+        """Test the failure mode green mode fixes: a blocking query freezes every green thread."""
+        make_psycopg2_blocking()
+        try:
+            assert self._ticks_during_slow_query(app) <= 2
+        finally:
+            make_psycopg2_green()
+
+    def test_pool_checkout_waits_cooperatively(self, app):
+        """Test that a green thread waiting for a free pooled connection lets the holder finish."""
+        make_psycopg2_green()
+        engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"], poolclass=GreenQueuePool, pool_size=1, max_overflow=0, pool_timeout=5)
+        finished = []
+
+        def query(name):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT pg_sleep(0.2)"))
+            finished.append(name)
+
+        try:
+            holder = eventlet.spawn(query, "holder")
+            eventlet.sleep(0.05)
+            waiter = eventlet.spawn(query, "waiter")
+            holder.wait()
+            waiter.wait()
+        finally:
+            engine.dispose()
+        assert finished == ["holder", "waiter"]
+
+
+class TestSlowQueryDoesNotStallSockets:
+    """One socket's slow query does not delay message delivery to the others."""
+
+    @pytest.fixture
+    def chat_users(self, app) -> Generator[int]:
+        """Committed users and chat, visible to the server process."""
+        with app.app_context(), db.engine.begin() as conn:
+            user_ids = [
+                conn.execute(insert(User).values(username=name, password_hash=generate_password_hash("secret"), is_admin=False, is_blocked=False).returning(User.id)).scalar_one()
+                for name in ("green_alice", "green_bob")
+            ]
+            chat_id = conn.execute(insert(Chat).values(name="Green", is_group=True).returning(Chat.id)).scalar_one()
+            conn.execute(insert(ChatMember), [{"chat_id": chat_id, "user_id": user_id, "is_moderator": False, "is_banned": False} for user_id in user_ids])
+        yield chat_id
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(delete(Chat).filter(Chat.id == chat_id))
+            conn.execute(delete(User).filter(User.id.in_(user_ids)))
+
+    def _serve(self, app, green: bool) -> tuple[subprocess.Popen, str]:
+        port = _free_port()
+        process = subprocess.Popen([sys.executable, "-c", SERVER, app.config["SQLALCHEMY_DATABASE_URI"], str(port), "1" if green else "0"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+
+        def up() -> bool:
+            try:
+                return requests.get(f"{url}/login", timeout=1).status_code == 200
+            except requests.ConnectionError:
+                return False
+
+        assert _wait_until(up, timeout=30)
+        return process, url
+
+    def _connect(self, url: str, username: str, chat_id: int) -> socketio.Client:
+        http = requests.Session()
+        http.post(f"{url}/login", data={"username": username, "password": "secret"}, timeout=5)
+        client = socketio.Client(http_session=http, reconnection=False)
+        joined = threading.Event()
+        client.on("joined_chat", lambda data: joined.set())
+        client.connect(url, transports=["polling"])
+        client.emit("join", {"chat_id": chat_id})
+        assert joined.wait(10)
+        return client
+
+    def _ack_seconds_during_slow_query(self, app, chat_id: int, green: bool) -> float:
+        process, url = self._serve(app, green)
+        alice = bob = None
+        try:
+            alice = self._connect(url, "green_alice", chat_id)
+            bob = self._connect(url, "green_bob", chat_id)
+
+            slow = threading.Thread(target=alice.call, args=("slow_query", 2), kwargs={"timeout": 10})
+            slow.start()
+            time.sleep(0.3)
+            started = time.perf_counter()
+            ack = bob.call("send_message", {"chat_id": chat_id, "message": "Still here"}, timeout=10)
+            seconds = time.perf_counter() - started
+            assert ack["status"] == "ok"
+            slow.join()
+            return seconds
+        finally:
+            for client in (alice, bob):
+                if client is not None:
+                    client.disconnect()
+            process.terminate()
+            process.wait(timeout=10)
+
+    def test_message_is_acked_during_slow_query(self, app, chat_users):
+        """Test that a message is stored and acked while another socket's query runs for 2 s."""
+        assert self._ack_seconds_during_slow_query(app, chat_users, green=True) < 1.0
+
+    def test_blocking_mode_delays_the_ack(self, app, chat_users):
+        """Test the failure mode green mode fixes: the ack waits for the other socket's query."""
+        assert self._ack_seconds_during_slow_query(app, chat_users, green=False) >= 1.0
@@ -0,0 +1,113 @@
+from collections.abc import Generator
+
+import pytest
+from sqlalchemy import event
+
+from python_chat.database.models import Chat, ChatMember, User
+from python_chat.utils.membership_cache import NOT_A_MEMBER, MembershipCache, MemberStatus, membership_cache
+
+
+@pytest.fixture
+def statements(session) -> Generator[list[str]]:
+    """Record the chat_members queries executed on the test connection."""
+    executed: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "chat_members" in statement:
+            executed.append(statement)
+
+    connection = session.connection()
+    event.listen(connection, "before_cursor_execute", record)
+    yield executed
+    event.remove(connection, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def member(session) -> tuple[Chat, User]:
+    chat = Chat(name="Cache Chat", is_group=True)
+    user = User(username="cacheuser")
+    user.set_password("testpass")
+    session.add_all([chat, user])
+    session.flush()
+    session.add(ChatMember(chat_id=chat.id, user_id=user.id))
+    session.commit()
+    return chat, user
+
+
+class TestMembershipCache:
+    """Test suite for the membership and ban cache."""
+
+    def test_hit_does_not_query(self, member, statements):
+        """Test that a cached status is served without touching the database."""
+        chat, user = member
+
+        assert membership_cache.get(chat.id, user.id) == MemberStatus(is_member=True, is_banned=False)
+        assert len(statements) == 1
+
+        assert membership_cache.get(chat.id, user.id).is_member
+        assert membership_cache.get(str(chat.id), user.id).is_member
+        assert len(statements) == 1
+
+    def test_non_member_is_cached(self, member, session, statements):
+        """Test that non-membership is cached as well."""
+        chat, _ = member
+        other = User(username="outsider")
+        other.set_password("testpass")
+        session.add(other)
+        session.commit()
+
+        assert membership_cache.get(chat.id, other.id) == NOT_A_MEMBER
+        assert membership_cache.get(chat.id, other.id) == NOT_A_MEMBER
+        assert len(statements) == 1
+
+    def test_entries_expire(self, member, statements):
+        """Test that entries are reloaded after the TTL."""
+        chat, user = member
+        cache = MembershipCache(ttl=0)
+
+        cache.get(chat.id, user.id)
+        cache.get(chat.id, user.id)
+        assert len(statements) == 2
+
+    def test_ban_and_unban_invalidate(self, member):
+        """Test that banning and unbanning through the model refresh the cache."""
+        chat, user = member
+        assert not membership_cache.get(chat.id, user.id).is_banned
+
+        chat.ban_member(user, "spam")
+        assert membership_cache.get(chat.id, user.id).is_banned
+
+        chat.unban_member(user)
+        assert not membership_cache.get(chat.id, user.id).is_banned
+
+    def test_add_and_remove_member_invalidate(self, member, session):
+        """Test that adding and removing members refresh the cache."""
+        chat, _ = member
+        other = User(username="newmember")
+        other.set_password("testpass")
+        session.add(other)
+        session.commit()
+        assert membership_cache.get(chat.id, other.id) == NOT_A_MEMBER
+
+        chat.add_member(other)
+        assert membership_cache.get(chat.id, other.id).is_member
+
+        chat.remove_member(other)
+        assert membership_cache.get(chat.id, other.id) == NOT_A_MEMBER
+
+    def test_invalidate_whole_chat(self, member):
+        """Test dropping every entry of a chat."""
+        chat, user = member
+        membership_cache.get(chat.id, user.id)
+
+        membership_cache.invalidate(chat.id)
+        assert (chat.id, user.id) not in membership_cache._entries
+
+    def test_max_entries(self, member):
+        """Test that the cache does not grow past its bound."""
+        chat, user = member
+        cache = MembershipCache(max_entries=2)
+        for user_id in (user.id, user.id + 1000, user.id + 2000):
+            cache.get(chat.id, user_id)
+
+        assert len(cache._entries) <= 2
@@ -0,0 +1,168 @@
+import queue
+import threading
+import uuid
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from python_chat.database.models import Chat, ChatMessage, User
+from python_chat.utils.message_writer import BatchMessageWriter, PendingMessage
+
+
+class FakeSocketIO:
+    """Threading stand-in for Flask-SocketIO that counts started background tasks."""
+
+    def __init__(self) -> None:
+        self.server = SimpleNamespace(eio=SimpleNamespace(create_queue=queue.Queue, get_queue_empty_exception=lambda: queue.Empty))
+        self.started: list[threading.Thread] = []
+
+    def start_background_task(self, target, *args) -> None:
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        self.started.append(thread)
+        thread.start()
+
+
+@pytest.fixture
+def author(session) -> tuple[Chat, User]:
+    chat = Chat(name="Batch Chat", is_group=True)
+    user = User(username="batchuser")
+    user.set_password("testpass")
+    session.add_all([chat, user])
+    session.commit()
+    return chat, user
+
+
+class TestBatchMessageWriter:
+    """Test suite for the group-commit message writer."""
+
+    def test_init_app_reads_config(self, app):
+        """Test that batch size and window come from the app config."""
+        writer = BatchMessageWriter()
+        app.config.update(MESSAGE_BATCH_ENABLED=True, MESSAGE_BATCH_MAX_SIZE=7, MESSAGE_BATCH_MAX_DELAY_MS=20)
+        try:
+            writer.init_app(app, None)
+        finally:
+            for key in ("MESSAGE_BATCH_ENABLED", "MESSAGE_BATCH_MAX_SIZE", "MESSAGE_BATCH_MAX_DELAY_MS"):
+                app.config.pop(key)
+
+        assert writer.enabled
+        assert writer.max_batch_size == 7
+        assert writer.max_delay == pytest.approx(0.02)
+
+    def test_write_batch(self, app, session, author):
+        """Test that a batch is written in order and each callback gets its id."""
+        chat, user = author
+        saved: list[tuple[str, int]] = []
+        batch = [PendingMessage(user.id, chat.id, f"Batched {i}", datetime.now(UTC), lambda message_id, created, i=i: saved.append((f"Batched {i}", message_id)), pytest.fail) for i in range(3)]
+
+        BatchMessageWriter().write_batch(batch)
+
+        assert [content for content, _ in saved] == ["Batched 0", "Batched 1", "Batched 2"]
+        for content, message_id in saved:
+            assert session.get(ChatMessage, message_id).content == content
+        assert saved[0][1] < saved[1][1] < saved[2][1]
+
+    def test_write_batch_error(self, app, session, author):
+        """Test that a failed batch reports the error to every message."""
+        _, user = author
+        errors: list[Exception] = []
+        batch = [PendingMessage(user.id, 999999, "No such chat", datetime.now(UTC), pytest.fail, errors.append) for _ in range(2)]
+
+        BatchMessageWriter().write_batch(batch)
+
+        assert len(errors) == 2
+
+    def test_write_batch_skips_retried_messages(self, app, session, author):
+        """Test that messages with a known client id resolve to the stored message and are not reported as new."""
+        chat, user = author
+        retried = uuid.uuid4()
+        fresh = uuid.uuid4()
+        saved: list[tuple[int, bool]] = []
+        writer = BatchMessageWriter()
+        writer.write_batch([PendingMessage(user.id, chat.id, "Stored", datetime.now(UTC), lambda *args: saved.append(args), pytest.fail, retried)])
+
+        batch = [
+            PendingMessage(user.id, chat.id, content, datetime.now(UTC), lambda *args: saved.append(args), pytest.fail, client_msg_id)
+            for content, client_msg_id in [("Stored", retried), ("Fresh", fresh), ("Fresh", fresh), ("Plain", None)]
+        ]
+        writer.write_batch(batch)
+
+        ids = [message_id for message_id, _ in saved]
+        assert ids[1] == ids[0]
+        assert ids[2] == ids[3] != ids[0]
+        assert ids[4] not in ids[:4]
+        assert [created for _, created in saved] == [True, False, True, False, True]
+        assert session.query(ChatMessage).filter_by(chat_id=chat.id).count() == 3
+
+    def test_write_batch_resolves_concurrent_insert(self, app, session, author, monkeypatch):
+        """Test that a client id stored by someone else after the lookup only affects its own message."""
+        chat, user = author
+        raced = uuid.uuid4()
+        stored = ChatMessage(chat_id=chat.id, user_id=user.id, content="Direct", client_msg_id=raced)
+        session.add(stored)
+        session.commit()
+        lookups = iter([{}])
+        real_stored_ids = BatchMessageWriter._stored_ids
+        # The first lookup misses the row, as if it was committed right after it
+        monkeypatch.setattr(BatchMessageWriter, "_stored_ids", staticmethod(lambda keys: next(lookups, None) or real_stored_ids(keys)))
+        saved: list[tuple[int, bool]] = []
+
+        batch = [
+            PendingMessage(user.id, chat.id, content, datetime.now(UTC), lambda *args: saved.append(args), pytest.fail, client_msg_id)
+            for content, client_msg_id in [("Direct", raced), ("Other", uuid.uuid4())]
+        ]
+        BatchMessageWriter().write_batch(batch)
+
+        assert saved[0] == (stored.id, False)
+        assert saved[1][1] is True
+        assert session.query(ChatMessage).filter_by(chat_id=chat.id).count() == 2
+
+    def test_concurrent_first_submits_start_one_writer(self, app, monkeypatch):
+        """Test that handlers sending their first messages at once share one writer and queue."""
+        socketio = FakeSocketIO()
+        writer = BatchMessageWriter()
+        writer.init_app(app, socketio)
+        written: list[int] = []
+        all_written = threading.Event()
+
+        def write_batch(batch):
+            written.extend(m.user_id for m in batch)
+            if len(written) == 8:
+                all_written.set()
+
+        monkeypatch.setattr(writer, "write_batch", write_batch)
+        barrier = threading.Barrier(8)
+
+        def send(user_id: int) -> None:
+            barrier.wait()
+            writer.submit(user_id, 1, "Hi", pytest.fail, pytest.fail)
+
+        senders = [threading.Thread(target=send, args=(user_id,)) for user_id in range(8)]
+        for thread in senders:
+            thread.start()
+        for thread in senders:
+            thread.join()
+
+        assert len(socketio.started) == 1
+        assert all_written.wait(5)
+        assert sorted(written) == list(range(8))
+
+    def test_writer_survives_a_failed_batch(self, app, monkeypatch):
+        """Test that an error outside the insert fails that batch's messages and the writer keeps running."""
+        writer = BatchMessageWriter(max_delay=0)
+        writer.init_app(app, FakeSocketIO())
+        calls: list[int] = []
+
+        def write_batch(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            batch[0].on_saved(1, True)
+
+        monkeypatch.setattr(writer, "write_batch", write_batch)
+        failed, saved = threading.Event(), threading.Event()
+        writer.submit(1, 1, "First", pytest.fail, lambda e: failed.set())
+        assert failed.wait(5)
+        writer.submit(1, 1, "Second", lambda message_id, created: saved.set(), pytest.fail)
+        assert saved.wait(5)
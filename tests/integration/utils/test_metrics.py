@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from python_chat.utils.metrics import CallbackCounter, CallbackGauge, CallbackHistogram, Counter, Histogram, MetricsRegistry
+
+
+class TestMetrics:
+    """Test suite for the Prometheus text exposition."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that each bucket counts every observation up to its bound."""
+        histogram = Histogram("latency_seconds", "Latency.", ("event",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "join")
+
+        assert list(histogram.samples()) == [
+            'latency_seconds_bucket{event="join",le="0.1"} 2',
+            'latency_seconds_bucket{event="join",le="1"} 3',
+            'latency_seconds_bucket{event="join",le="+Inf"} 4',
+            'latency_seconds_sum{event="join"} 3.65',
+            'latency_seconds_count{event="join"} 4',
+        ]
+
+    def test_counter_and_label_escaping(self):
+        """Test counter samples and escaping of label values."""
+        counter = Counter("errors_total", "Errors.", ("event",))
+        counter.inc('say "hi"\n')
+        counter.inc('say "hi"\n', amount=2)
+
+        assert counter.render() == ["# HELP errors_total Errors.", "# TYPE errors_total counter", 'errors_total{event="say \\"hi\\"\\n"} 3']
+
+    def test_callback_metrics_are_read_at_scrape_time(self):
+        """Test that callback gauges, counters and histograms reflect the state when rendered."""
+        sizes = [1, 3]
+        gauge = CallbackGauge("rooms", "Rooms.", lambda: {(): float(len(sizes))})
+        histogram = CallbackHistogram("room_sockets", "Room sizes.", lambda: sizes, buckets=(2,))
+
+        rejections = {("typing",): 2.0}
+        counter = CallbackCounter("rejected_total", "Rejections.", lambda: rejections, ("event",))
+
+        sizes.append(5)
+        rejections["typing",] = 4.0
+        assert list(gauge.samples()) == ["rooms 3"]
+        assert counter.render() == ["# HELP rejected_total Rejections.", "# TYPE rejected_total counter", 'rejected_total{event="typing"} 4']
+        assert list(histogram.samples()) == ['room_sockets_bucket{le="2"} 1', 'room_sockets_bucket{le="+Inf"} 3', "room_sockets_sum 9", "room_sockets_count 3"]
+
+    def test_timed_handler(self):
+        """Test that wrapped handlers are timed and their errors counted."""
+        registry = MetricsRegistry()
+
+        def fail(sid):
+            raise RuntimeError("boom")
+
+        handler = registry._timed_handler("send_message", lambda sid, data: data)
+        failing = registry._timed_handler("join", fail)
+
+        assert handler("sid", 42) == 42
+        with pytest.raises(RuntimeError):
+            failing("sid")
+
+        text = registry.render()
+        assert 'socketio_event_duration_seconds_count{event="send_message"} 1' in text
+        assert 'socketio_event_duration_seconds_count{event="join"} 1' in text
+        assert 'socketio_event_errors_total{event="join"} 1' in text
+
+    def test_pool_wait_and_timeouts(self, app):
+        """Test that checkout waits are timed and checkouts that time out are counted."""
+        registry = MetricsRegistry()
+        engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"], pool_size=1, max_overflow=0, pool_timeout=0.1)
+        registry.instrument_engine(engine)
+        try:
+            with engine.connect(), pytest.raises(PoolTimeoutError):
+                engine.connect()
+            # dispose() swaps in a new pool, which is timed as well
+            engine.dispose()
+            with engine.connect():
+                pass
+        finally:
+            engine.dispose()
+
+        text = registry.render()
+        assert "db_pool_wait_seconds_count 3" in text
+        assert "db_pool_timeouts_total 1" in text
@@ -0,0 +1,178 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Generator
+
+import pytest
+import requests
+import socketio
+from sqlalchemy import delete, insert, select
+from werkzeug.security import generate_password_hash
+
+from python_chat.database import db
+from python_chat.database.models import Chat, ChatMember, User
+from python_chat.utils.pg_manager import MAX_NOTIFY_BYTES, PostgresManager, pack_messages
+
+WORKER = """
+import sys
+from python_chat.app import create_app, socketio
+
+app = create_app({"SQLALCHEMY_DATABASE_URI": sys.argv[1], "SECRET_KEY": "multi-worker", "WTF_CSRF_ENABLED": False, "SOCKETIO_MESSAGE_QUEUE": "postgres"})
+socketio.run(app, host="127.0.0.1", port=int(sys.argv[2]))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestPackMessages:
+    """Test suite for packing queue messages into NOTIFY payloads."""
+
+    def test_small_messages_share_a_payload(self):
+        payloads, oversized = pack_messages(['{"a":1}', '{"b":2}'])
+        assert payloads == ['[{"a":1},{"b":2}]']
+        assert oversized == []
+
+    def test_payloads_stay_under_the_limit(self):
+        messages = [json.dumps({"data": "x" * 1000, "i": i}) for i in range(20)]
+        payloads, oversized = pack_messages(messages)
+
+        assert oversized == []
+        assert len(payloads) > 1
+        assert all(len(payload.encode()) <= MAX_NOTIFY_BYTES for payload in payloads)
+        assert [item for payload in payloads for item in json.loads(payload)] == [json.loads(message) for message in messages]
+
+    def test_oversized_messages_are_set_aside(self):
+        big = json.dumps({"data": "x" * MAX_NOTIFY_BYTES})
+        payloads, oversized = pack_messages(['{"a":1}', big])
+        assert payloads == ['[{"a":1}]']
+        assert oversized == [big]
+
+
+class TestPostgresManager:
+    """Test suite for the LISTEN/NOTIFY Socket.IO client manager."""
+
+    @pytest.fixture
+    def servers(self, app) -> Generator[tuple[socketio.Server, list[dict]]]:
+        """A publishing server and the emits received by a second server on the same channel."""
+        url = app.config["SQLALCHEMY_DATABASE_URI"]
+        channel = f"test_{os.getpid()}_{time.monotonic_ns()}"
+        publisher = socketio.Server(async_mode="threading", client_manager=PostgresManager(url, channel=channel))
+        receiver = socketio.Server(async_mode="threading", client_manager=PostgresManager(url, channel=channel))
+        received: list[dict] = []
+        receiver.manager._handle_emit = received.append
+        for server in (publisher, receiver):
+            server.manager.initialize()
+        time.sleep(0.3)  # Let the receiver LISTEN
+        yield publisher, received
+
+    def test_emit_reaches_other_server(self, servers):
+        publisher, received = servers
+        for i in range(5):
+            publisher.emit("receive_message", {"i": i}, room="42")
+
+        assert _wait_until(lambda: len(received) == 5)
+        assert [message["data"] for message in received] == [[{"i": i}] for i in range(5)]
+        assert {message["room"] for message in received} == {"42"}
+
+    def test_large_payload_goes_through_side_table(self, servers, app):
+        publisher, received = servers
+        publisher.emit("receive_message", {"message": "x" * 20000}, room="42")
+
+        assert _wait_until(lambda: len(received) == 1)
+        assert received[0]["data"] == [{"message": "x" * 20000}]
+
+    def test_write_only_manager_publishes_directly(self, servers, app):
+        _, received = servers
+        channel = servers[0].manager.channel
+        emitter = PostgresManager(app.config["SQLALCHEMY_DATABASE_URI"], channel=channel, write_only=True, json=json)
+        emitter.emit("user_banned", {"username": "someone"}, room="42")
+
+        assert _wait_until(lambda: len(received) == 1)
+        assert received[0]["event"] == "user_banned"
+
+
+class TestMultiProcessFanOut:
+    """One message reaches clients connected to different worker processes."""
+
+    @pytest.fixture
+    def chat_users(self, app) -> Generator[int]:
+        """Committed users and chat, visible to the worker processes."""
+        with app.app_context(), db.engine.begin() as conn:
+            user_ids = [
+                conn.execute(insert(User).values(username=name, password_hash=generate_password_hash("secret"), is_admin=False, is_blocked=False).returning(User.id)).scalar_one()
+                for name in ("worker_alice", "worker_bob")
+            ]
+            chat_id = conn.execute(insert(Chat).values(name="Multi Worker", is_group=True).returning(Chat.id)).scalar_one()
+            conn.execute(insert(ChatMember), [{"chat_id": chat_id, "user_id": user_id, "is_moderator": False, "is_banned": False} for user_id in user_ids])
+        yield chat_id
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(delete(Chat).filter(Chat.id == chat_id))
+            conn.execute(delete(User).filter(User.id.in_(user_ids)))
+
+    @pytest.fixture
+    def workers(self, app) -> Generator[list[str]]:
+        """Two app processes sharing the Postgres message queue."""
+        ports = [_free_port(), _free_port()]
+        processes = [subprocess.Popen([sys.executable, "-c", WORKER, app.config["SQLALCHEMY_DATABASE_URI"], str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for port in ports]
+        urls = [f"http://127.0.0.1:{port}" for port in ports]
+        try:
+
+            def up(url: str) -> bool:
+                try:
+                    return requests.get(f"{url}/login", timeout=1).status_code == 200
+                except requests.ConnectionError:
+                    return False
+
+            assert _wait_until(lambda: all(up(url) for url in urls), timeout=30)
+            yield urls
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+    def _connect(self, url: str, username: str, chat_id: int) -> tuple[socketio.Client, list[dict], threading.Event]:
+        http = requests.Session()
+        http.post(f"{url}/login", data={"username": username, "password": "secret"}, timeout=5)
+        client = socketio.Client(http_session=http)
+        received: list[dict] = []
+        joined = threading.Event()
+        client.on("receive_message", received.append)
+        client.on("joined_chat", lambda data: joined.set())
+        client.connect(url, transports=["polling"])
+        client.emit("join", {"chat_id": chat_id})
+        return client, received, joined
+
+    def test_message_reaches_both_workers(self, app, chat_users, workers):
+        chat_id = chat_users
+        alice, alice_received, alice_joined = self._connect(workers[0], "worker_alice", chat_id)
+        bob, bob_received, bob_joined = self._connect(workers[1], "worker_bob", chat_id)
+        try:
+            assert alice_joined.wait(10) and bob_joined.wait(10)
+
+            alice.emit("send_message", {"chat_id": chat_id, "message": "Hello from worker 1"})
+
+            assert _wait_until(lambda: bob_received and alice_received)
+            assert bob_received[0]["message"] == "Hello from worker 1"
+            assert bob_received[0]["message_id"] == alice_received[0]["message_id"]
+            with app.app_context(), db.engine.connect() as conn:
+                assert conn.execute(select(User.username).filter(User.id == bob_received[0]["user_id"])).scalar_one() == "worker_alice"
+        finally:
+            alice.disconnect()
+            bob.disconnect()
@@ -0,0 +1,203 @@
+import json
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+from python_chat.database import db
+from python_chat.database.models import PresenceSession
+from python_chat.utils.presence import PostgresPresenceRegistry, PresenceRegistry, get_presence, init_presence
+
+
+class TestPresenceRegistry:
+    """Test suite for the in-process presence registry."""
+
+    def test_add_get_remove(self):
+        """Test the lifecycle of a socket session."""
+        registry = PresenceRegistry()
+        assert registry.add("sid1", 1, "alice") is True
+
+        assert registry.get("sid1") == {"username": "alice", "user_id": 1}
+        assert len(registry) == 1
+
+        assert registry.remove("sid1") == ({"username": "alice", "user_id": 1}, True)
+        assert registry.get("sid1") is None
+        assert registry.remove("sid1") == (None, False)
+
+    def test_chat_and_username(self):
+        """Test updating the current chat and the username of a socket."""
+        registry = PresenceRegistry()
+        registry.add("sid1", 1, "alice")
+
+        registry.set_chat("sid1", 5)
+        registry.set_username("sid1", "alicia")
+        assert registry.get("sid1") == {"username": "alicia", "user_id": 1, "chat_id": 5}
+
+        registry.set_chat("sid1", None)
+        assert "chat_id" not in registry.get("sid1")
+
+    def test_online_usernames_are_unique(self):
+        """Test that users with several tabs are listed once."""
+        registry = PresenceRegistry()
+        registry.add("sid1", 1, "alice")
+        registry.add("sid2", 1, "alice")
+        registry.add("sid3", 2, "bob")
+
+        assert sorted(registry.online_usernames()) == ["alice", "bob"]
+        assert sorted(registry.local_sids_for_user(1)) == ["sid1", "sid2"]
+
+    def test_usernames_are_reference_counted(self):
+        """Test that a user comes online with the first tab and goes offline with the last."""
+        registry = PresenceRegistry()
+        assert registry.add("sid1", 1, "alice") is True
+        assert registry.add("sid2", 1, "alice") is False
+
+        assert registry.remove("sid1")[1] is False
+        assert registry.online_usernames() == ["alice"]
+        assert registry.remove("sid2")[1] is True
+        assert registry.online_usernames() == []
+
+    def test_set_username_reports_presence_changes(self):
+        """Test that renaming one of several tabs keeps the old name online."""
+        registry = PresenceRegistry()
+        registry.add("sid1", 1, "alice")
+        registry.add("sid2", 1, "alice")
+
+        assert registry.set_username("sid1", "alicia") == (False, True)
+        assert registry.set_username("sid2", "alicia") == (True, False)
+        assert registry.set_username("sid2", "alicia") == (False, False)
+        assert registry.online_usernames() == ["alicia"]
+
+    def test_kick_calls_handler_for_each_socket(self):
+        """Test that a kick reaches every socket of the user."""
+        registry = PresenceRegistry()
+        registry.add("sid1", 1, "alice")
+        registry.add("sid2", 1, "alice")
+        registry.add("sid3", 2, "bob")
+        kicked = []
+        registry.on_kick(lambda sid, chat_id: kicked.append((sid, chat_id)))
+
+        registry.kick(1, 7)
+
+        assert sorted(kicked) == [("sid1", 7), ("sid2", 7)]
+
+    def test_user_index_follows_sessions(self):
+        """Test that the user to sockets index is kept in sync with connects and disconnects."""
+        registry = PresenceRegistry()
+        registry.add("sid1", 1, "alice")
+        registry.add("sid2", 1, "alice")
+
+        registry.remove("sid1")
+        assert registry.local_sids_for_user(1) == ["sid2"]
+        registry.remove("sid2")
+        assert registry.local_sids_for_user(1) == []
+        assert registry._user_sids == {}
+
+    def test_init_presence_selects_backend(self, app):
+        """Test choosing the backend from the config."""
+        previous = app.extensions["presence"]
+        try:
+            app.config["PRESENCE_BACKEND"] = "postgres"
+            assert isinstance(init_presence(app, None), PostgresPresenceRegistry)
+
+            app.config["PRESENCE_BACKEND"] = "redis"
+            with pytest.raises(ValueError):
+                init_presence(app, None)
+        finally:
+            app.config.pop("PRESENCE_BACKEND")
+            app.extensions["presence"] = previous
+
+        with app.app_context():
+            assert get_presence() is previous
+
+
+class TestPostgresPresenceRegistry:
+    """Test suite for the Postgres-backed presence registry."""
+
+    @pytest.fixture
+    def registry(self, app):
+        registry = PostgresPresenceRegistry()
+        with app.app_context():
+            yield registry
+            # The registry writes on its own connections, outside the test transaction
+            with db.engine.begin() as conn:
+                conn.execute(delete(PresenceSession))
+
+    def test_sessions_are_shared(self, registry):
+        """Test that sessions of another worker show up in the online list."""
+        other_worker = PostgresPresenceRegistry()
+        registry.add("sid1", 1, "alice")
+        other_worker.add("sid2", 2, "bob")
+
+        assert sorted(registry.online_usernames()) == ["alice", "bob"]
+        assert registry.get("sid2") is None  # Event handlers only see local sockets
+
+        other_worker.remove("sid2")
+        assert registry.online_usernames() == ["alice"]
+
+    def test_usernames_are_counted_across_workers(self, registry):
+        """Test that first and last sockets are decided cluster-wide."""
+        other_worker = PostgresPresenceRegistry()
+        assert registry.add("sid1", 1, "alice") is True
+        assert other_worker.add("sid2", 1, "alice") is False
+
+        assert registry.remove("sid1") == ({"username": "alice", "user_id": 1}, False)
+        assert other_worker.remove("sid2")[1] is True
+
+    def test_set_username(self, registry):
+        """Test that a username change is visible to other workers."""
+        registry.add("sid1", 1, "alice")
+        assert registry.set_username("sid1", "alicia") == (True, True)
+
+        assert PostgresPresenceRegistry().online_usernames() == ["alicia"]
+
+    def test_kick_is_notified(self, registry):
+        """Test that a kick is published with NOTIFY and applied by the owning worker."""
+        owner = PostgresPresenceRegistry()
+        owner.add("sid1", 1, "alice")
+        kicked = []
+        owner.on_kick(lambda sid, chat_id: kicked.append((sid, chat_id)))
+
+        raw = db.engine.raw_connection()
+        listener = raw.driver_connection
+        raw.detach()
+        try:
+            listener.autocommit = True
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {PostgresPresenceRegistry.CHANNEL}")
+
+            registry.kick(1, 7)
+
+            # Delivered asynchronously after the commit
+            deadline = time.monotonic() + 5
+            while not listener.notifies and time.monotonic() < deadline:
+                time.sleep(0.01)
+                listener.poll()
+            notifies = [notify.payload for notify in listener.notifies]
+        finally:
+            listener.close()
+
+        assert [json.loads(payload)["user_id"] for payload in notifies] == [1]
+        assert kicked == []  # Nothing happens until the owner's listener gets the notification
+
+        owner.handle_notification(notifies[0])
+        assert kicked == [("sid1", 7)]
+
+    def test_beat_expires_dead_workers(self, registry):
+        """Test that rows of workers that stopped beating are removed and users left without sockets are reported offline."""
+        registry.add("sid1", 1, "alice")
+        with db.engine.begin() as conn:
+            conn.execute(
+                insert(PresenceSession),
+                [
+                    {"sid": sid, "node": "dead-node", "user_id": user_id, "username": username, "seen_at": datetime.now(UTC) - timedelta(hours=1)}
+                    for sid, user_id, username in [("dead1", 2, "ghost"), ("dead2", 1, "alice")]
+                ],
+            )
+
+        assert registry.beat() == ["ghost"]
+        assert registry.beat() == []
+
+        with db.engine.connect() as conn:
+            assert list(conn.execute(select(PresenceSession.sid)).scalars()) == ["sid1"]
@@ -0,0 +1,106 @@
+from collections.abc import Generator
+from typing import Any
+
+import pytest
+from flask import Flask
+from sqlalchemy import Engine, Integer, column, create_engine, func, select, table, text
+
+from python_chat.utils.query_profiler import QueryProfiler, normalize_statement
+
+
+class TestQueryProfiler:
+    """Test suite for the SQL profiler."""
+
+    @pytest.fixture
+    def engine(self, app: Flask) -> Generator[Engine, Any]:
+        """A separate engine, so the profiler's listeners do not outlive the test."""
+        engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
+        yield engine
+        engine.dispose()
+
+    def test_counts_queries_per_socket_event(self, engine: Engine):
+        """Test that queries run inside a handler are attributed to its event."""
+        profiler = QueryProfiler(slow_query_ms=10_000)
+        profiler.instrument_engine(engine)
+
+        def handler(sid, data):
+            with engine.connect() as conn:
+                for _ in range(data["queries"]):
+                    conn.execute(text("SELECT 1"))
+
+        profiled = profiler._profiled_handler("send_message", handler)
+        profiled("sid", {"queries": 3})
+        profiled("sid", {"queries": 1})
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+        stats = profiler.units["socket send_message"]
+        assert (stats["calls"], stats["queries"], stats["max_queries"]) == (2, 4, 3)
+        assert stats["db_seconds"] > 0
+        assert profiler.statements["SELECT 1"]["calls"] == 5
+        assert not profiler.slow_queries
+
+    def test_counts_queries_per_request(self, engine: Engine):
+        """Test that queries run by a view are attributed to its method and endpoint."""
+        profiler = QueryProfiler()
+        profiler.instrument_engine(engine)
+        profile_app = Flask(__name__)
+        profiler.instrument_app(profile_app)
+
+        @profile_app.route("/two-queries")
+        def two_queries():
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+            return "ok"
+
+        profile_app.test_client().get("/two-queries")
+
+        assert profiler.report()["units"][0] | {"db_ms": 0, "db_ms_per_call": 0, "max_db_ms": 0} == {
+            "unit": "GET two_queries",
+            "calls": 1,
+            "queries": 2,
+            "queries_per_call": 2.0,
+            "max_queries": 2,
+            "db_ms": 0,
+            "db_ms_per_call": 0,
+            "max_db_ms": 0,
+        }
+
+    def test_slow_queries_are_explained(self, engine: Engine):
+        """Test that slow table SELECTs are logged with an analyzed plan, other statements with a plain one or none."""
+        profiler = QueryProfiler(slow_query_ms=0, explain=True)
+        profiler.instrument_engine(engine)
+        profiled = table("profiled", column("n", Integer))
+
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TEMP TABLE profiled (n int)"))
+            conn.execute(select(profiled.c.n).filter(profiled.c.n == 1))
+            conn.execute(text("SELECT n FROM profiled WHERE n = :n"), {"n": 1})
+            # The transaction is still usable after the EXPLAIN ran in a savepoint
+            assert conn.execute(text("SELECT 42")).scalar_one() == 42
+
+        compiled, raw = [query for query in profiler.slow_queries if "FROM profiled" in query["statement"]]
+        assert any("Execution Time" in line for line in compiled["plan"])
+        assert raw["plan"] and not any("Execution Time" in line for line in raw["plan"])
+        create = next(query for query in profiler.slow_queries if query["statement"].startswith("CREATE"))
+        assert create["plan"] is None
+
+    def test_function_calls_are_not_run_twice(self, engine: Engine):
+        """Test that a SELECT of a side-effecting function is explained without being executed again."""
+        profiler = QueryProfiler(slow_query_ms=0, explain=True)
+        profiler.instrument_engine(engine)
+
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TEMP SEQUENCE profiled_seq"))
+            assert conn.execute(select(func.nextval("profiled_seq"))).scalar_one() == 1
+            assert conn.execute(text("SELECT nextval('profiled_seq')")).scalar_one() == 2
+
+        plans = [query["plan"] for query in profiler.slow_queries if "nextval" in query["statement"]]
+        assert len(plans) == 2
+        assert all(plan and not any("Execution Time" in line for line in plan) for plan in plans)
+
+    def test_normalize_statement(self):
+        """Test that IN lists of any length share one statement key."""
+        assert normalize_statement("SELECT *\n  FROM users WHERE id IN (%(id_1_1)s, %(id_1_2)s)") == "SELECT * FROM users WHERE id IN (...)"
+        assert normalize_statement("SELECT * FROM users WHERE id IN (%(id_1_1)s, %(id_1_2)s, %(id_1_3)s)") == "SELECT * FROM users WHERE id IN (...)"
@@ -0,0 +1,66 @@
+from python_chat.utils.rate_limit import DEFAULT_RATE_LIMITS, RateLimiter, parse_rate_limits
+
+
+class TestRateLimiter:
+    """Test suite for the token bucket rate limiter."""
+
+    def test_burst_then_reject(self):
+        """Test that a full bucket allows a burst and then rejects."""
+        limiter = RateLimiter({"send_message": (1.0, 3.0)})
+
+        assert [limiter.allow(1, "send_message", now=0.0) for _ in range(4)] == [True, True, True, False]
+        assert limiter.rejections == {"send_message": 1}
+
+    def test_refill(self):
+        """Test that tokens come back at the configured rate, up to the burst size."""
+        limiter = RateLimiter({"typing": (2.0, 2.0)})
+        limiter.allow(1, "typing", now=0.0)
+        limiter.allow(1, "typing", now=0.0)
+        assert not limiter.allow(1, "typing", now=0.1)
+
+        assert limiter.allow(1, "typing", now=0.6)
+        assert not limiter.allow(1, "typing", now=0.6)
+        assert [limiter.allow(1, "typing", now=100.0) for _ in range(3)] == [True, True, False]
+
+    def test_buckets_are_per_user_and_event(self):
+        """Test that users and events do not share tokens."""
+        limiter = RateLimiter({"send_message": (1.0, 1.0), "join": (1.0, 1.0)})
+        assert limiter.allow(1, "send_message", now=0.0)
+        assert not limiter.allow(1, "send_message", now=0.0)
+
+        assert limiter.allow(2, "send_message", now=0.0)
+        assert limiter.allow(1, "join", now=0.0)
+        assert limiter.allow(1, "leave", now=0.0)  # Not limited
+
+    def test_disabled(self):
+        """Test that a disabled limiter allows everything."""
+        limiter = RateLimiter({"send_message": (1.0, 1.0)})
+        limiter.enabled = False
+        assert all(limiter.allow(1, "send_message", now=0.0) for _ in range(5))
+
+    def test_full_buckets_are_pruned(self):
+        """Test that refilled buckets are dropped when the user limit is reached."""
+        limiter = RateLimiter({"join": (1.0, 5.0)}, max_users=2)
+        limiter.allow(1, "join", now=0.0)
+        limiter.allow(2, "join", now=9.5)
+
+        limiter.allow(3, "join", now=10.0)
+        assert set(limiter._rules["join"][2]) == {2, 3}
+
+    def test_parse_rate_limits(self):
+        """Test parsing rate limits from an environment variable."""
+        assert parse_rate_limits("send_message=5/10, typing=2") == {"send_message": (5.0, 10.0), "typing": (2.0, 2.0)}
+        assert parse_rate_limits("") == {}
+
+    def test_init_app(self, app):
+        """Test reading the limits from the app config."""
+        limiter = RateLimiter()
+        app.config["RATE_LIMITS"] = "join=1/2"
+        try:
+            limiter.init_app(app)
+        finally:
+            app.config.pop("RATE_LIMITS")
+        assert limiter.rejections == {"join": 0}
+
+        limiter.init_app(app)
+        assert set(limiter.rejections) == set(DEFAULT_RATE_LIMITS)
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import select
+
+from python_chat.database.models import Chat, ChatMember, ChatMessage, User
+from python_chat.utils.read_state import ReadMarker
+
+
+@pytest.fixture
+def members(session) -> tuple[Chat, User, User, list[int]]:
+    chat = Chat(name="Read Chat", is_group=True)
+    users = [User(username=f"reader{i}") for i in range(2)]
+    for user in users:
+        user.set_password("testpass")
+    session.add_all([chat, *users])
+    session.flush()
+    session.add_all([ChatMember(chat_id=chat.id, user_id=user.id) for user in users])
+    messages = [ChatMessage(chat_id=chat.id, user_id=users[0].id, content=str(i)) for i in range(3)]
+    session.add_all(messages)
+    session.commit()
+    return chat, users[0], users[1], [message.id for message in messages]
+
+
+def _pointers(session, chat_id: int) -> dict[int, int | None]:
+    return dict(session.execute(select(ChatMember.user_id, ChatMember.last_read_message_id).filter(ChatMember.chat_id == chat_id)).all())
+
+
+class TestReadMarker:
+    """Test suite for the batched read pointer writer."""
+
+    def test_init_app_reads_config(self, app):
+        """Test that the flush interval comes from the app config."""
+        marker = ReadMarker()
+        app.config["READ_MARK_FLUSH_MS"] = 250
+        try:
+            marker.init_app(app, None)
+        finally:
+            app.config.pop("READ_MARK_FLUSH_MS")
+
+        assert marker.interval == pytest.approx(0.25)
+
+    def test_marks_are_debounced(self):
+        """Test that only the newest mark per user and chat is kept until the flush."""
+        marker = ReadMarker()
+        for message_id in (5, 9, 7):
+            marker.mark_read(1, 2, message_id)
+        marker.mark_read(3, 2, 4)
+
+        assert marker._pending == {(1, 2): 9, (3, 2): 4}
+
+    def test_flush_writes_all_marks_at_once(self, app, session, members):
+        """Test that one flush updates every pending member with the message and its position."""
+        chat, first, second, message_ids = members
+        marker = ReadMarker()
+        marker.mark_read(first.id, chat.id, message_ids[1])
+        marker.mark_read(second.id, chat.id, message_ids[2])
+
+        assert marker.flush() == 2
+        assert _pointers(session, chat.id) == {first.id: message_ids[1], second.id: message_ids[2]}
+        member = session.get(ChatMember, (second.id, chat.id))
+        session.refresh(member)
+        assert member.last_read_sent_at == session.get(ChatMessage, message_ids[2]).sent_at
+        assert marker.flush() == 0
+
+    def test_pointer_never_moves_back(self, app, session, members):
+        """Test that an older mark, e.g. flushed late by another worker, and messages of other chats are ignored."""
+        chat, first, _, message_ids = members
+        other = Chat(name="Other Read Chat", is_group=True)
+        session.add(other)
+        session.flush()
+        elsewhere = ChatMessage(chat_id=other.id, user_id=first.id, content="elsewhere")
+        session.add(elsewhere)
+        session.commit()
+
+        marker = ReadMarker()
+        marker.mark_read(first.id, chat.id, message_ids[2])
+        marker.flush()
+        marker.mark_read(first.id, chat.id, message_ids[0])
+        assert marker.flush() == 0
+        marker.mark_read(first.id, chat.id, elsewhere.id)
+        assert marker.flush() == 0
+
+        assert _pointers(session, chat.id)[first.id] == message_ids[2]
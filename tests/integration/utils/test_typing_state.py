@@ -0,0 +1,48 @@
+from python_chat.utils.typing_state import TypingCoalescer
+
+
+class TestTypingCoalescer:
+    """Test suite for the typing state coalescer."""
+
+    def test_changes_are_coalesced(self):
+        """Test that many typing events yield one digest per changed chat."""
+        coalescer = TypingCoalescer(ttl=5.0)
+        for _ in range(10):
+            coalescer.set_typing(1, "alice", True, now=0.0)
+        coalescer.set_typing(1, "bob", True, now=0.1)
+        coalescer.set_typing(2, "carol", True, now=0.1)
+
+        assert sorted(coalescer.collect(now=0.5)) == [(1, ["alice", "bob"]), (2, ["carol"])]
+        assert coalescer.collect(now=1.0) == []
+
+    def test_refresh_does_not_resend(self):
+        """Test that refreshing an existing flag does not produce a digest."""
+        coalescer = TypingCoalescer(ttl=5.0)
+        coalescer.set_typing(1, "alice", True, now=0.0)
+        coalescer.collect(now=0.5)
+
+        coalescer.set_typing(1, "alice", True, now=4.0)
+        assert coalescer.collect(now=6.0) == []
+        assert coalescer.typing_users(1) == ["alice"]
+
+    def test_stop_typing(self):
+        """Test that a stop event is sent in the next digest."""
+        coalescer = TypingCoalescer()
+        coalescer.set_typing(1, "alice", True, now=0.0)
+        coalescer.collect(now=0.5)
+
+        coalescer.set_typing(1, "alice", False, now=1.0)
+        coalescer.set_typing(1, "bob", False, now=1.0)
+        assert coalescer.collect(now=1.5) == [(1, [])]
+        assert coalescer.typing_users(1) == []
+
+    def test_stale_flags_expire(self):
+        """Test that flags that were not refreshed within the TTL are dropped."""
+        coalescer = TypingCoalescer(ttl=5.0)
+        coalescer.set_typing(1, "alice", True, now=0.0)
+        coalescer.set_typing(1, "bob", True, now=3.0)
+        coalescer.collect(now=0.5)
+
+        assert coalescer.collect(now=5.5) == [(1, ["bob"])]
+        assert coalescer.collect(now=8.5) == [(1, [])]
+        assert coalescer._typing == {}